@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+"""
+Times loading a song the way the VizManager does, with and without the AnalysisExecutor's process pool.
+
+A song is loaded in the VizManager's loading stages (parse, notes, timeline, first bars), and then the rest of it
+is prepared the way the SongPreparer and a tension preset do: the chords of every bar, the key, the key timeline
+and the tension of every note. Without the pool, all of this is computed in this process as it is needed. With
+the pool, the analyses start in worker processes right after parsing, and the stages that need their values wait
+for them instead. Every song is loaded from a fresh cache, so it is parsed every time.
+
+The songs are the midi files given, or synthetic songs of different sizes written to a temporary directory. Each
+song is loaded without the pool, then with a pool of each number of workers given, so the columns show how the load
+scales with the cores used. Each pool is started (and its workers have imported everything) before it is timed, as
+the VizManager starts it when the window opens. On a single core the pool can only add overhead; with more cores,
+the analyses run next to the loading stages and each other.
+
+Usage: python benchmarks/bench_analysis_executor.py [--notes 20000 100000] [--workers 1 2 4] [file.mid ...]
+"""
+import gc
+import os
+import sys
+import time
+import random
+import struct
+import shutil
+import argparse
+import tempfile
+import concurrent.futures
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+# the VizManager imports some modules the way the app does, from inside the mmv package
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "mmv"))
+
+import mmv.core.AnalysisExecutor as ae
+import mmv.core.VizManager as vm
+import mmv.midi.NoteTable as nt
+import mmv.midi.SongCache as sc
+
+# the loading stages of the VizManager, in order
+STAGES = [("parse", vm.VizManager.parse_song),
+          ("notes", vm.VizManager.create_song_notes),
+          ("timeline", vm.VizManager.compile_song_timeline),
+          ("first bars", vm.VizManager.prepare_song_start)]
+
+
+class NoPool:
+    """
+    Stands in for the AnalysisExecutor without starting any analysis, so every value is computed as it is needed.
+    """
+    def analyze(self, analysis, names=None, path=None):
+        return {}
+
+
+class Loader:
+    """
+    The parts of a VizManager its loading stages use.
+    """
+    def __init__(self, cache, executor):
+        self.cache = cache
+        self.analysis_executor = executor
+
+
+def write_var_len(value):
+    """
+    Returns a number as a midi variable-length quantity.
+    """
+    out = [value & 0x7F]
+    value >>= 7
+    while value:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    return bytes(reversed(out))
+
+
+def make_midi(path, num_notes, seed=0):
+    """
+    Writes a midi file of about num_notes random chords on 4 tracks, one chord per track every eighth note.
+    """
+    rng = random.Random(seed)
+    step = 240
+    num_steps = num_notes // 8 + 1
+    tracks = []
+    for track in range(4):
+        events = []
+        for i in range(num_steps):
+            for pitch in rng.sample(range(36 + 12 * track, 60 + 12 * track), 2):
+                events.append((i * step, 0x90 | track, pitch, 100))
+                events.append(((i + rng.choice((1, 2))) * step, 0x80 | track, pitch, 0))
+        events.sort(key=lambda e: (e[0], e[1] & 0xF0))
+        # a program change, then the notes
+        body = bytearray([0, 0xC0 | track, track * 8])
+        last = 0
+        for tick, status, pitch, velocity in events:
+            body += write_var_len(tick - last) + bytes([status, pitch, velocity])
+            last = tick
+        body += b'\x00\xFF\x2F\x00'
+        tracks.append(b'MTrk' + struct.pack('>I', len(body)) + bytes(body))
+    with open(path, 'wb') as f:
+        f.write(b'MThd' + struct.pack('>IHHH', 6, 1, len(tracks), 480))
+        for chunk in tracks:
+            f.write(chunk)
+
+
+def load(path, executor):
+    """
+    Loads and prepares the song at the given path. Returns the time each stage took, in seconds.
+    """
+    # the notes of the last song loaded are full of reference cycles, so free them before timing
+    gc.collect()
+    directory = tempfile.mkdtemp()
+    try:
+        loader = Loader(sc.SongCache(directory), executor)
+        song = {'path': path}
+        timings = []
+        for name, stage in STAGES:
+            start = time.perf_counter()
+            stage(loader, song)
+            timings.append((name, time.perf_counter() - start))
+
+        # what the SongPreparer and a tension preset do once the song plays
+        start = time.perf_counter()
+        song['preparer'].prepare_until(float('inf'))
+        analysis = song['analysis']
+        for value in (analysis.key, analysis.key_timeline, analysis.tension):
+            assert value is not None
+        timings.append(("rest of song", time.perf_counter() - start))
+        return timings
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark loading songs with and without the analysis pool")
+    parser.add_argument("paths", nargs="*", help="midi files to load (default: synthetic songs)")
+    parser.add_argument("--notes", type=int, nargs="+", default=[20000, 100000],
+                        help="sizes of the synthetic songs")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4],
+                        help="numbers of worker processes to time the pool with")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    paths = args.paths
+    if not paths:
+        for count in args.notes:
+            paths.append(os.path.join(directory, "synthetic-" + str(count) + ".mid"))
+            make_midi(paths[-1], count)
+
+    print(str(os.cpu_count()) + " cores")
+    try:
+        # every song without the pool, then with each pool. loading once first, so every run finds everything
+        # imported and cached by the os
+        columns = [("no pool", None)] + [(str(workers) + " workers", workers) for workers in args.workers]
+        results = {path: [] for path in paths}
+        for name, workers in columns:
+            executor = NoPool()
+            if workers is not None:
+                executor = ae.AnalysisExecutor(workers)
+                # start every worker before timing
+                concurrent.futures.wait(list(executor.submit(nt.NoteTable()).values()) * workers)
+            try:
+                for path in paths:
+                    load(path, executor)
+                    results[path].append(load(path, executor))
+            finally:
+                if workers is not None:
+                    executor.shutdown()
+
+        header = "".join("  {0:>10}".format(name) for name, _ in columns)
+        for path in paths:
+            print(os.path.basename(path))
+            print("  {0:<14}".format("stage") + header)
+            runs = results[path]
+            rows = [(name, [run[i][1] for run in runs]) for i, (name, _) in enumerate(runs[0])]
+            rows.append(("until playing", [sum(t for _, t in run[:-1]) for run in runs]))
+            rows.append(("total", [sum(t for _, t in run) for run in runs]))
+            for name, times in rows:
+                print("  {0:<14}".format(name) + "".join("  {0:>8.0f}ms".format(t * 1e3) for t in times))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""
+Benchmarks finding the chord of a note at different points of a synthetic song.
+
+Scanning the notes played so far (MusicComp.find_chord_from_viznote) gets slower as the song goes on, while looking
+the chord up in the song's ChordIndex costs the same from the first bar to the last.
+
+Usage: python benchmarks/bench_chord_index.py [--notes 20000] [--samples 50]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import music21
+import mmv.midi.ChordIndex as ci
+import mmv.midi.NoteTable as nt
+import mmv.util.Utilities as util
+import mmv.util.MusicComp as muse
+
+
+def make_table(num_notes, seed=0):
+    """
+    Returns a NoteTable of random chords of 1 to 4 notes on 4 tracks, one chord per track every eighth note.
+    """
+    rng = random.Random(seed)
+    table = nt.NoteTable()
+    pitch, track, start = [], [], []
+    tick = 0
+    while len(pitch) < num_notes:
+        for t in range(1, 5):
+            for _ in range(rng.randint(1, 4)):
+                pitch.append(rng.randint(36, 84))
+                track.append(t)
+                start.append(tick)
+        tick += table.ticks_per_quarter // 2
+    count = len(pitch)
+    table.set_notes(pitch, [100] * count, track, [0] * count, start, [table.ticks_per_quarter // 2] * count)
+    table.num_tracks = 4
+    return table
+
+
+def find_chord(chord_index, viz_note):
+    """
+    Returns the chord of a note as a music21 chord, like find_chord_from_viznote, from the slice of its group in a
+    ChordIndex.
+    """
+    first = chord_index.first[chord_index.group[viz_note.index]]
+    rows = chord_index.order[first:first + chord_index.rank[viz_note.index] + 1]
+    return music21.chord.Chord([music21.note.Note(int(chord_index.pitch[row])) for row in rows])
+
+
+def time_lookups(notes, positions, lookup):
+    """
+    Returns the average time of looking up the chord of the notes at the given positions of the song.
+    """
+    start = time.perf_counter()
+    for i in positions:
+        lookup(i)
+    return (time.perf_counter() - start) / len(positions)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark chord lookups")
+    parser.add_argument("--notes", type=int, default=20000)
+    parser.add_argument("--samples", type=int, default=50, help="notes looked up at each point of the song")
+    args = parser.parse_args()
+
+    table = make_table(args.notes)
+    notes = util.get_viz_notes_from_table(table)
+    # create the music21 notes up front, so only the lookups are timed
+    for n in notes:
+        n.note
+    start = time.perf_counter()
+    chord_index = ci.ChordIndex(table)
+    print("{0} notes, index built in {1:.1f} ms".format(len(notes), (time.perf_counter() - start) * 1e3))
+
+    print("{0:>10}  {1:>14}  {2:>14}".format("position", "scan (us)", "index (us)"))
+    for fraction in (0., 0.25, 0.5, 0.75, 1.):
+        first = int((len(notes) - args.samples) * fraction)
+        positions = range(first, first + args.samples)
+        scan = time_lookups(notes, positions,
+                            lambda i: muse.find_chord_from_viznote(notes[i], notes[:i + 1]))
+        index = time_lookups(notes, positions,
+                             lambda i: find_chord(chord_index, notes[i]))
+        print("{0:>9.0f}%  {1:>14.1f}  {2:>14.1f}".format(fraction * 100, scan * 1e6, index * 1e6))
+
+
+if __name__ == '__main__':
+    main()
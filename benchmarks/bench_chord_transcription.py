@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+"""
+Benchmarks the chord transcription done by Utilities.get_viz_notes on synthetic songs of increasing size.
+
+The sweep used by Utilities.transcribe_chords is compared against the old approach, which rescanned every note
+for each beat, half-bar and bar. The old approach is quadratic, so it only runs on the smaller songs.
+
+Usage: python benchmarks/bench_chord_transcription.py [--sizes 1000 10000 ...] [--max-rescan 20000]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import mmv.core.VizNote as vn
+import mmv.util.Utilities as util
+import mmv.util.MusicComp as muse
+
+
+def make_song(num_notes, notes_per_beat=16, seed=0):
+    """
+    Returns a list of random VizNotes sorted by offset, with about notes_per_beat notes starting in each beat.
+    """
+    rng = random.Random(seed)
+    beats = max(1, num_notes // notes_per_beat)
+    notes = []
+    for i in range(num_notes):
+        offset = rng.randrange(beats * 4) / 4.0
+        notes.append(vn.VizNote(None, rng.randint(36, 84), 100, offset, 0.5, rng.randint(1, 4)))
+    notes.sort(key=lambda x: x.offset)
+    return notes
+
+
+def transcribe_chords_rescan(flat):
+    """
+    The old chord transcription, which rescans the whole song for every window.
+    """
+    quarter_beats = int(flat[-1].offset)
+    bars = quarter_beats // 4
+    half_bars = bars * 2
+    for attr, length, count in [('chord_in_beat', 1, quarter_beats),
+                                ('chord_in_half_bar', 2, half_bars),
+                                ('chord_in_bar', 4, bars)]:
+        for i in range(0, count):
+            pitches = []
+            window_notes = []
+            for note in flat:
+                if float(i * length) <= note.offset < float((i + 1) * length):
+                    pitches.append(note.pitch)
+                    window_notes.append(note)
+            chord = muse.get_chord_from_pitches(pitches)
+            for note in window_notes:
+                setattr(note, attr, chord)
+
+
+def time_it(func, notes):
+    start = time.perf_counter()
+    func(notes)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark chord transcription")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 20000, 100000, 500000])
+    parser.add_argument("--max-rescan", type=int, default=20000,
+                        help="largest song to run the old rescanning transcription on")
+    args = parser.parse_args()
+
+    print("{0:>10}  {1:>12}  {2:>12}  {3:>12}  {4:>10}".format("notes", "sweep (s)", "us/note", "rescan (s)",
+                                                                "speedup"))
+    for size in args.sizes:
+        sweep = time_it(util.transcribe_chords, make_song(size))
+        line = "{0:>10}  {1:>12.3f}  {2:>12.1f}".format(size, sweep, sweep * 1e6 / size)
+        if size <= args.max_rescan:
+            rescan = time_it(transcribe_chords_rescan, make_song(size))
+            line += "  {0:>12.3f}  {1:>9.1f}x".format(rescan, rescan / sweep)
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
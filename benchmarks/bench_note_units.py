@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+"""
+Benchmarks a frame of fading note units (updating then drawing every unit) with different numbers of units on the
+screen, like PresetPianoRollFading or PresetJulien with a dense song.
+
+Updating every unit on its own (what the display used to do) costs a few python calls per unit, while the
+NoteUnitStore of a UnitRegistry fades every rect, circle and ellipse at once, and works out the colors they are
+drawn with once per frame.
+
+Usage: python benchmarks/bench_note_units.py [--frames 30]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# draw to a surface in memory, so no window is needed
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import pygame
+import mmv.core.Unit as unit
+import mmv.core.UnitRegistry as ur
+
+
+def make_units(count, seed=0):
+    """
+    Returns slowly fading rect, circle and ellipse units with random colors and dissonances.
+    """
+    rng = random.Random(seed)
+    units = []
+    for _ in range(count):
+        x, y = rng.randint(0, 800), rng.randint(0, 600)
+        color = (rng.randint(128, 255), rng.randint(128, 255), rng.randint(128, 255))
+        shape = rng.randrange(3)
+        if shape == 0:
+            u = unit.RectNoteUnit(x, y, color, None, 30, 15)
+        elif shape == 1:
+            u = unit.CircleNoteUnit(x, y, color, None, 10)
+        else:
+            u = unit.EllipseNoteUnit(x, y, color, None, 30, 15, 0)
+        u.SetFade(True, 1, True)
+        u.dissonance = rng.randint(0, 5)
+        units.append(u)
+    return units
+
+
+def time_objects(units, screen, frames):
+    """
+    Returns the average time of updating (in python) and drawing every unit, in ms.
+    """
+    update = draw = 0.
+    for _ in range(frames):
+        start = time.perf_counter()
+        for u in list(units):
+            if u.should_delete is True:
+                units.remove(u)
+            else:
+                u.update()
+        middle = time.perf_counter()
+        for u in units:
+            u.draw(screen)
+        update += middle - start
+        draw += time.perf_counter() - middle
+    return update * 1e3 / frames, draw * 1e3 / frames
+
+
+def time_registry(units, screen, frames):
+    """
+    Returns the average time of updating (in the registry's store) and drawing every unit, in ms.
+    """
+    registry = ur.UnitRegistry()
+    for u in units:
+        registry.append(u)
+    update = draw = 0.
+    for _ in range(frames):
+        start = time.perf_counter()
+        registry.update()
+        middle = time.perf_counter()
+        for u in registry:
+            u.draw(screen)
+        registry.compact()
+        update += middle - start
+        draw += time.perf_counter() - middle
+    return update * 1e3 / frames, draw * 1e3 / frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark updating and drawing fading note units")
+    parser.add_argument("--frames", type=int, default=30)
+    args = parser.parse_args()
+
+    pygame.init()
+    screen = pygame.Surface((800, 600))
+
+    print("{0:>8}  {1:>14}  {2:>14}  {3:>14}  {4:>14}".format(
+        "units", "update (ms)", "draw (ms)", "store update", "store draw"))
+    for count in (100, 1000, 5000):
+        objects = time_objects(make_units(count), screen, args.frames)
+        stored = time_registry(make_units(count), screen, args.frames)
+        print("{0:>8}  {1:>14.2f}  {2:>14.2f}  {3:>14.2f}  {4:>14.2f}".format(count, *(objects + stored)))
+
+
+if __name__ == '__main__':
+    main()
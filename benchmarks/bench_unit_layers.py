@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+"""
+Benchmarks adding a unit for every note with different numbers of units already on the screen.
+
+Appending to a list and sorting every unit by layer (what VizManager.sort_units used to do after every note) gets
+slower as units pile up, while appending to the bucket of the unit's layer in a UnitRegistry costs the same no
+matter how many units there are.
+
+Usage: python benchmarks/bench_unit_layers.py [--notes 2000] [--layers 2]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import mmv.core.Unit as unit
+import mmv.core.UnitRegistry as ur
+
+
+def make_units(count, num_layers, seed=0):
+    """
+    Returns rect units on random layers.
+    """
+    rng = random.Random(seed)
+    units = []
+    for _ in range(count):
+        rect = unit.RectNoteUnit(rng.randint(0, 800), rng.randint(0, 600), (255, 255, 255), None, 30, 15)
+        rect.layer = rng.randrange(num_layers)
+        units.append(rect)
+    return units
+
+
+def time_sorted_list(live, notes, rounds):
+    """
+    Returns the average time of appending a unit to a list and sorting it by layer.
+    """
+    elapsed = 0.
+    for _ in range(rounds):
+        units = list(live)
+        start = time.perf_counter()
+        for note in notes:
+            units.append(note)
+            units.sort(key=lambda x: x.layer)
+        elapsed += time.perf_counter() - start
+    return elapsed / (len(notes) * rounds)
+
+
+def time_registry(live, notes, rounds, num_layers):
+    """
+    Returns the average time of appending a unit to the bucket of its layer in a UnitRegistry.
+    """
+    elapsed = 0.
+    for _ in range(rounds):
+        units = ur.UnitRegistry()
+        units.add_layers(range(num_layers))
+        for u in live:
+            units.append(u)
+        start = time.perf_counter()
+        for note in notes:
+            units.append(note)
+        elapsed += time.perf_counter() - start
+    return elapsed / (len(notes) * rounds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark adding units on layers")
+    parser.add_argument("--notes", type=int, default=2000, help="units added at each size")
+    parser.add_argument("--layers", type=int, default=2)
+    args = parser.parse_args()
+
+    print("{0:>8}  {1:>14}  {2:>14}".format("units", "sort (us)", "buckets (us)"))
+    for count in (100, 1000, 10000):
+        live = make_units(count, args.layers)
+        # only a tenth more units are added at a time, so the number on the screen stays about the same
+        notes = make_units(max(count // 10, 1), args.layers, seed=1)
+        rounds = max(args.notes // len(notes), 1)
+        sort = time_sorted_list(live, notes, rounds)
+        buckets = time_registry(live, notes, rounds, args.layers)
+        print("{0:>8}  {1:>14.1f}  {2:>14.1f}".format(count, sort * 1e6, buckets * 1e6))
+
+
+if __name__ == '__main__':
+    main()
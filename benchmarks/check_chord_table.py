@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""
+Compares every entry of ChordTable against music21, and times a lookup against building a music21 chord.
+
+Chords of the common types are spelled correctly from their root (i.e. C# major as C#, E#, G#) and must get the
+same root, quality and common name from music21. Every other pitch-class set is spelled with music21's default note
+names and must get the same root and quality.
+
+Exits with status 1 if any entry differs from music21, so it can be run as a check.
+
+Usage: python benchmarks/check_chord_table.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import music21
+import mmv.util.ChordTable as ct
+
+# intervals that spell each common chord type from its root
+SPELLINGS = {'major triad': ['P1', 'M3', 'P5'],
+             'minor triad': ['P1', 'm3', 'P5'],
+             'diminished triad': ['P1', 'm3', 'd5'],
+             'augmented triad': ['P1', 'M3', 'A5'],
+             'dominant seventh chord': ['P1', 'M3', 'P5', 'm7'],
+             'major seventh chord': ['P1', 'M3', 'P5', 'M7'],
+             'minor seventh chord': ['P1', 'm3', 'P5', 'm7'],
+             'half-diminished seventh chord': ['P1', 'm3', 'd5', 'm7'],
+             'diminished seventh chord': ['P1', 'm3', 'd5', 'd7'],
+             'minor-augmented tetrachord': ['P1', 'm3', 'P5', 'M7'],
+             'augmented major tetrachord': ['P1', 'M3', 'A5', 'M7'],
+             'augmented seventh chord': ['P1', 'M3', 'A5', 'm7']}
+
+
+def check_entry(info):
+    """
+    Returns a description of how the entry differs from music21, or None if it matches.
+    """
+    if info.chord_type is not None:
+        root = music21.pitch.Pitch(ct.PITCH_NAMES[info.root])
+        chord = music21.chord.Chord([root.transpose(i) for i in SPELLINGS[info.chord_type]])
+        expected = (chord.root().pitchClass, chord.quality, chord.commonName)
+        actual = (info.root, info.quality, info.chord_type)
+    else:
+        chord = music21.chord.Chord([ct.PITCH_NAMES[pc] for pc in ct.get_pitch_classes(info.id)])
+        expected = (chord.root().pitchClass, chord.quality)
+        actual = (info.root, info.quality)
+    if expected != actual:
+        return "{0:012b} {1}: table {2}, music21 {3}".format(info.id, info.name, actual, expected)
+    return None
+
+
+def main():
+    mismatches = [m for m in (check_entry(info) for info in ct.TABLE[1:]) if m is not None]
+    common = sum(1 for info in ct.TABLE if info.chord_type is not None)
+    print("checked " + str(len(ct.TABLE) - 1) + " pitch-class sets (" + str(common) + " of common types)")
+    for m in mismatches:
+        print("  mismatch: " + m)
+    if mismatches:
+        print("FAILED: " + str(len(mismatches)) + " entries differ from music21")
+        return 1
+
+    pitches = [60, 64, 67, 71, 74]
+    runs = 200
+    start = time.perf_counter()
+    for _ in range(runs):
+        music21.chord.Chord([music21.note.Note(p).name for p in pitches]).pitchedCommonName
+    music21_time = (time.perf_counter() - start) / runs
+    start = time.perf_counter()
+    for _ in range(runs):
+        ct.get_chord_info(pitches).name
+    table_time = (time.perf_counter() - start) / runs
+    print("music21 chord: {0:.1f} us, table lookup: {1:.1f} us".format(music21_time * 1e6, table_time * 1e6))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""
+Checks that pushing the notes of a song to a KeyTimeline one at a time (as live input would) gives the same
+timeline as building it from the whole song, and times both.
+
+The songs are the midi files given, or music21's test midi files by default, plus a synthetic song that modulates
+every few bars.
+
+Exits with status 1 if any song gets a different timeline, so it can be run as a check.
+
+Usage: python benchmarks/check_key_timeline.py [file.mid ...]
+"""
+import os
+import sys
+import glob
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import music21
+import mmv.midi.KeyTimeline as kt
+import mmv.midi.MidiParser as mp
+import mmv.midi.NoteTable as nt
+
+
+def make_table(num_bars, seed=0):
+    """
+    Returns a NoteTable of random notes of a major scale, moving up a fifth every 8 bars.
+    """
+    rng = random.Random(seed)
+    table = nt.NoteTable()
+    step = table.ticks_per_quarter // 2
+    scale = [0, 2, 4, 5, 7, 9, 11]
+    pitch, start, duration = [], [], []
+    for bar in range(num_bars):
+        tonic = (bar // 8 * 7) % 12
+        for eighth in range(8):
+            pitch.append(48 + tonic + rng.choice(scale) + 12 * rng.randint(0, 2))
+            start.append((bar * 8 + eighth) * step)
+            duration.append(step * rng.choice((1, 2, 4)))
+    count = len(pitch)
+    table.set_notes(pitch, [100] * count, [1] * count, [0] * count, start, duration)
+    table.num_tracks = 1
+    return table
+
+
+def push_table(table):
+    """
+    Returns a KeyTimeline of a NoteTable made by pushing its notes one at a time.
+    """
+    timeline = kt.KeyTimeline()
+    for pitch, offset, length in zip(table.pitch.tolist(), table.offsets.tolist(), table.quarter_lengths.tolist()):
+        timeline.push(pitch, offset, length)
+    timeline.flush()
+    return timeline
+
+
+def main():
+    paths = sys.argv[1:]
+    if not paths:
+        paths = sorted(glob.glob(os.path.join(os.path.dirname(music21.__file__), "midi", "testPrimitive", "*.mid")))
+    songs = [("modulating (synthetic)", make_table(200))]
+    for path in paths:
+        songs.append((os.path.basename(path), mp.MidiParser().parse_file(path)))
+
+    failed = 0
+    print("{0:<24}  {1:>6}  {2:>8}  {3:>11}  {4:>10}".format("song", "notes", "changes", "build (ms)", "push (ms)"))
+    for name, table in songs:
+        start = time.perf_counter()
+        built = kt.KeyTimeline(table)
+        middle = time.perf_counter()
+        pushed = push_table(table)
+        end = time.perf_counter()
+        print("{0:<24}  {1:>6}  {2:>8}  {3:>11.1f}  {4:>10.1f}".format(
+            name, len(table), len(built), (middle - start) * 1e3, (end - middle) * 1e3))
+        if pushed.offsets != built.offsets or pushed.keys != built.keys:
+            failed += 1
+            print("  mismatch: build " + str(list(zip(built.offsets, built.keys))) +
+                  ", push " + str(list(zip(pushed.offsets, pushed.keys))))
+
+    if failed:
+        print("FAILED: " + str(failed) + " songs get a different timeline when their notes are pushed")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+"""
+This class runs the analyses of a song in a pool of worker processes, so they use every core instead of taking
+turns on the GIL.
+
+Each analysis only needs the song's NoteTable (a few numpy columns, cheap to send to another process), so they run
+at the same time on different workers: the key, the key timeline, the chords of every beat, half-bar and bar, and
+the tension columns. They are started cheapest first, so the key is back almost at once. The tension is measured
+against the key timeline, so it is only started once the timeline is back, and is sent it instead of finding it
+again. Songs in a note store aren't sent at all: the workers open the store themselves, which only maps the file.
+
+The analyses are started as soon as the song is parsed. Each value is handed to the song's SongAnalysis as one it
+should expect, so whatever asks for it before it is back waits for it instead of computing it again, and it is
+merged in as soon as it arrives. An analysis that fails is computed where it is needed instead.
+
+Worker processes are spawned rather than forked, so they never inherit the GUI's state. If processes can't be
+used, the analyses run on a thread instead.
+"""
+import time
+import threading
+import multiprocessing
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+import mmv.midi.ChordIndex as ci
+import mmv.midi.KeyTimeline as kt
+import mmv.midi.NoteStore as nstore
+import mmv.midi.NoteTable as nt
+import mmv.midi.SongCache as sc
+import mmv.midi.TensionTable as tt
+
+
+def analyze_key(table):
+    return {'key': kt.find_key_index(table)}
+
+
+def analyze_key_timeline(table):
+    return {'key_timeline': kt.KeyTimeline(table)}
+
+
+def analyze_chords(table):
+    return {'chords': sc.get_table_chords(table)}
+
+
+def analyze_tension(table, key_timeline=None):
+    if key_timeline is None:
+        key_timeline = kt.KeyTimeline(table)
+    return {'tension': tt.TensionTable(table, None, ci.ChordIndex(table), key_timeline)}
+
+
+# every analysis the executor runs, by name, in the order they are started
+ANALYSES = {'key': analyze_key,
+            'key_timeline': analyze_key_timeline,
+            'chords': analyze_chords,
+            'tension': analyze_tension}
+
+# names of the values each analysis finds, as the SongAnalysis calls them
+RESULTS = {'key': ['key'],
+           'key_timeline': ['key_timeline'],
+           'chords': ['chords'],
+           'tension': ['tension']}
+
+# the value each analysis needs from another one, by name. the analysis is started once the other one is back,
+# and given its value
+DEPENDENCIES = {'tension': 'key_timeline'}
+
+
+def run_analysis(name, source, *args):
+    """
+    Runs one analysis in a worker process, on a NoteTable or on the path of a note store, passing it any other
+    arguments given. Returns a dict of the values it found by name, and how long it took in seconds.
+    """
+    start = time.perf_counter()
+    table = source if isinstance(source, nt.NoteTable) else nstore.NoteStore(source).table
+    results = ANALYSES[name](table, *args)
+    return results, time.perf_counter() - start
+
+
+def get_results(future):
+    """
+    Returns the values found by a finished analysis, by name, in the form the SongAnalysis keeps them. Raises the
+    analysis's exception if it failed.
+    """
+    results, seconds = future.result()
+    results = dict(results)
+    if 'key' in results:
+        results['key'] = kt.get_key(results['key']) if results['key'] >= 0 else None
+    return results
+
+
+class AnalysisExecutor:
+
+    def __init__(self, workers=None):
+        # number of worker processes, or None for one per core
+        self.workers = workers
+        # the process pool, created on first use
+        self.pool = None
+        self.lock = threading.Lock()
+
+    def get_pool(self):
+        """
+        Returns the process pool, creating it the first time.
+        """
+        with self.lock:
+            if self.pool is None:
+                context = multiprocessing.get_context('spawn')
+                self.pool = concurrent.futures.ProcessPoolExecutor(self.workers, mp_context=context)
+            return self.pool
+
+    def shutdown(self):
+        """
+        Stops the worker processes. Analyses that are still running are cancelled.
+        """
+        with self.lock:
+            if self.pool is not None:
+                self.pool.shutdown(wait=False, cancel_futures=True)
+                self.pool = None
+
+    def start(self):
+        """
+        Starts the worker processes ahead of the first song, so its analyses don't wait for them to start and
+        import everything.
+        """
+        try:
+            pool = self.get_pool()
+            pool.submit(run_analysis, 'chords', nt.NoteTable())
+        except (OSError, RuntimeError, BrokenProcessPool):
+            self.shutdown()
+
+    def submit(self, source, names=None):
+        """
+        Starts the given analyses (every one by default) of a NoteTable, or of the note store at the given path.
+        Returns a dict of futures by name, each resolving to the values found and how long it took.
+        """
+        names = [name for name in ANALYSES if names is None or name in names]
+        try:
+            pool = self.get_pool()
+            futures = {}
+            for name in names:
+                dependency = DEPENDENCIES.get(name)
+                if dependency in futures:
+                    futures[name] = self.submit_after(pool, futures[dependency], name, source)
+                else:
+                    futures[name] = pool.submit(run_analysis, name, source)
+            return futures
+        except (OSError, RuntimeError, BrokenProcessPool):
+            # no processes (or a pool that broke): run on a thread instead
+            self.shutdown()
+            futures = {name: concurrent.futures.Future() for name in names}
+            thread = threading.Thread(target=self.run_serially, args=(source, futures))
+            thread.daemon = True
+            thread.start()
+            return futures
+
+    @staticmethod
+    def submit_after(pool, dependency, name, source):
+        """
+        Returns a future of an analysis that is started once the future of the analysis it depends on is done, and
+        given the value it found. If that analysis failed, it is started without it.
+        """
+        future = concurrent.futures.Future()
+
+        def start(done):
+            if done.cancelled():
+                future.cancel()
+            if future.cancelled():
+                return
+            args = ()
+            if done.exception() is None:
+                args = (done.result()[0][DEPENDENCIES[name]],)
+            try:
+                started = pool.submit(run_analysis, name, source, *args)
+            except (RuntimeError, BrokenProcessPool) as e:
+                set_outcome(future, e, None)
+                return
+            # cancelling the future cancels the analysis, if it hasn't started yet
+            future.add_done_callback(lambda f: started.cancel() if f.cancelled() else None)
+            started.add_done_callback(lambda f: set_outcome(future, None, f))
+
+        dependency.add_done_callback(start)
+        return future
+
+    @staticmethod
+    def run_serially(source, futures):
+        """
+        Runs analyses one after the other on the calling thread, resolving their futures. Analyses are given the
+        values they need from the ones before them.
+        """
+        results = {}
+        for name, future in futures.items():
+            if not future.set_running_or_notify_cancel():
+                continue
+            dependency = DEPENDENCIES.get(name)
+            args = (results[dependency],) if dependency in results else ()
+            try:
+                outcome = run_analysis(name, source, *args)
+            except Exception as e:
+                future.set_exception(e)
+                continue
+            results.update(outcome[0])
+            future.set_result(outcome)
+
+    def analyze(self, analysis, names=None, path=None):
+        """
+        Starts the analyses of a SongAnalysis's NoteTable, and has the analysis expect the values they find until
+        they are back. Returns the dict of futures.
+
+        :param path:    path of the note store the table is a view of, if any. the workers open it instead of being
+                        sent the notes
+        """
+        futures = self.submit(path if path is not None else analysis.table, names)
+        for name, future in futures.items():
+            for result in RESULTS[name]:
+                analysis.expect(result, lambda future=future, result=result: get_results(future)[result])
+            future.add_done_callback(lambda f: self.merge(analysis, f))
+        return futures
+
+    @staticmethod
+    def merge(analysis, future):
+        """
+        Stores the values found by a finished analysis in the SongAnalysis. Failed analyses are left for the
+        analysis to compute itself.
+        """
+        if future.cancelled() or future.exception() is not None:
+            return
+        for name, value in get_results(future).items():
+            analysis.put(name, value)
+
+
+def set_outcome(future, exception, done):
+    """
+    Resolves a future with an exception, or with the outcome of another future that is done. Does nothing if the
+    future was cancelled meanwhile.
+    """
+    try:
+        if done is not None and done.cancelled():
+            future.cancel()
+        elif done is not None and done.exception() is None:
+            future.set_result(done.result())
+        else:
+            future.set_exception(exception if exception is not None else done.exception())
+    except concurrent.futures.InvalidStateError:
+        pass
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""
+This class is the static layer of a preset: things like grid lines, track dividers and guide circles that never
+change while a song plays.
+
+A preset hands its background the units that make it up, once for every layout. They are drawn into a surface the
+first time the background is shown, and from then on the display blits that surface instead of clearing the screen,
+so they cost nothing to draw no matter how many there are. The surface is only drawn again when the preset hands it
+new units (i.e. when the display is resized or the preset is loaded again).
+"""
+import pygame
+
+
+class Background:
+
+    def __init__(self, color=(0, 0, 0)):
+        # color behind the units
+        self.color = color
+        # the units drawn in the background, in drawing order
+        self.units = []
+        # the units drawn into a surface the size of the screen, or None until the background is shown
+        self.surface = None
+        # the list of units the surface was drawn from
+        self.drawn_units = None
+
+    def set_units(self, units):
+        """
+        Replaces the units drawn in the background. They're drawn into the surface the next time it's shown.
+        """
+        # a new list is made so a preset loading on a worker thread never changes the one being drawn
+        self.units = list(units)
+
+    def clear(self):
+        """
+        Removes every unit from the background.
+        """
+        self.set_units([])
+
+    def draw(self, screen, rect=None):
+        """
+        Draws the background over the screen, or over the given rect of it.
+        """
+        units = self.units
+        if not units:
+            screen.fill(self.color, rect)
+            return
+        surface = self.surface
+        if self.drawn_units is not units or surface.get_size() != screen.get_size():
+            surface = self.render(screen, units)
+        if rect is None:
+            screen.blit(surface, (0, 0))
+        else:
+            screen.blit(surface, rect, rect)
+
+    def render(self, screen, units):
+        """
+        Draws the units into a new surface the size of the screen, and returns it.
+        """
+        surface = pygame.Surface(screen.get_size(), 0, screen)
+        surface.fill(self.color)
+        for unit in units:
+            unit.draw(surface)
+        self.surface = surface
+        self.drawn_units = units
+        return surface
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""
+This class follows the chord made by the last few notes played, for every preset at once.
+
+The pitch classes of the most recent notes are kept in a fixed-size ring buffer, along with how many times each
+pitch class is in it. Playing a note replaces the oldest one, which updates the counts, the pitch-class mask and
+the current chord (a ChordTable lookup) in constant time, no matter how long the song has been playing.
+
+The VizManager pushes every note before the preset draws it, so presets only have to read the current chord,
+whether it just changed, and the dissonance of a note.
+"""
+import mmv.util.ChordTable as ct
+import mmv.util.MusicComp as muse
+
+# position of each pitch class on the circle of fifths
+CIRCLE_POSITIONS = [muse.convert_pitch_to_circle_position(pc) for pc in range(12)]
+
+
+class ChordTracker:
+
+    def __init__(self, size=5):
+        # number of recent notes that make up the chord
+        self.size = size
+        # pitch classes of the recent notes. once full, the oldest one is at self.head
+        self.pitch_classes = []
+        self.head = 0
+        # number of recent notes of each pitch class
+        self.histogram = [0] * 12
+        # pitch-class mask of the recent notes, which is also the id of the current chord
+        self.mask = 0
+        # ChordInfo of the current chord
+        self.chord = ct.TABLE[0]
+        # true if the last note pushed changed the chord
+        self.chord_changed = False
+        # pitch class of the tonic of the song. until the key is known, C is used
+        self.tonic = 0
+
+    def reset(self):
+        """
+        Forgets every note played.
+        """
+        self.pitch_classes = []
+        self.head = 0
+        self.histogram = [0] * 12
+        self.mask = 0
+        self.chord = ct.TABLE[0]
+        self.chord_changed = False
+
+    def set_key(self, key):
+        """
+        Sets the key of the song (a music21.key.Key, or None if it isn't known).
+        """
+        self.tonic = key.tonic.pitchClass if key is not None else 0
+
+    def push(self, pitch):
+        """
+        Adds a note (a midi pitch) to the recent notes, dropping the oldest one if there are already enough.
+        """
+        pc = pitch % 12
+        if len(self.pitch_classes) < self.size:
+            self.pitch_classes.append(pc)
+        else:
+            old = self.pitch_classes[self.head]
+            self.histogram[old] -= 1
+            if self.histogram[old] == 0:
+                self.mask &= ~(1 << old)
+            self.pitch_classes[self.head] = pc
+            self.head = (self.head + 1) % self.size
+
+        self.histogram[pc] += 1
+        self.mask |= 1 << pc
+
+        chord = ct.TABLE[self.mask]
+        self.chord_changed = chord.id != self.chord.id
+        self.chord = chord
+
+    def get_dissonance(self, pitch):
+        """
+        Returns the dissonance of a note (a midi pitch) against the key of the song and the root of the current
+        chord, as in MusicComp.get_dissonance_of_note.
+        """
+        position = CIRCLE_POSITIONS[pitch % 12]
+        distance_from_key = abs(position - CIRCLE_POSITIONS[self.tonic])
+        if distance_from_key > 6:
+            distance_from_key = 12 - distance_from_key
+
+        root = self.chord.root if self.chord.root is not None else pitch % 12
+        return distance_from_key + (position - CIRCLE_POSITIONS[root]) % 12
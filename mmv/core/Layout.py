@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+"""
+This class caches where a preset draws things on the screen, so drawing a note is a lookup instead of arithmetic.
+
+It holds the height of every midi pitch (relative to the lowest and highest pitches of the song, like
+Utilities.graph_note_y) and the column of every track. A preset builds its layout in first_load, and it is only
+recomputed when the display is resized.
+"""
+
+
+class Layout:
+
+    def __init__(self, width=0, height=0, lowest_pitch=0, highest_pitch=127, num_tracks=1):
+        """
+        :param width:           width of the display
+        :param height:          height of the display
+        :param lowest_pitch:    pitch drawn at the bottom of the display
+        :param highest_pitch:   pitch drawn at the top of the display
+        :param num_tracks:      number of tracks to split the display into columns for
+        """
+        self.lowest_pitch = lowest_pitch
+        self.highest_pitch = highest_pitch
+        self.num_tracks = max(num_tracks, 1)
+        # size of the display, or None until the first resize
+        self.size = None
+        self.width = 0
+        self.height = 0
+        # middle of the display
+        self.center_x = 0
+        self.center_y = 0
+        # y of every midi pitch, with the lowest pitch at the bottom of the display
+        self.pitch_y = [0] * 128
+        # y of every midi pitch, with the lowest pitch one row above the bottom of the display, so it stays visible
+        self.cropped_y = [0] * 128
+        # height of the row of a single pitch
+        self.row_height = 0
+        # width of the column of each track
+        self.track_width = 0
+        # left edge and middle of the column of each track, by track number (tracks are numbered from 1)
+        self.track_left = [0] * (self.num_tracks + 1)
+        self.track_center = [0] * (self.num_tracks + 1)
+
+        self.resize(width, height)
+
+    def resize(self, width, height):
+        """
+        Recomputes every position for a display of the given size. Returns False if the size didn't change.
+        """
+        if (width, height) == self.size:
+            return False
+        self.size = (width, height)
+        self.width = width
+        self.height = height
+        self.center_x = width // 2
+        self.center_y = height // 2
+
+        lowest, highest = self.lowest_pitch, self.highest_pitch
+        self.pitch_y = get_pitch_heights(lowest, highest, height)
+        self.cropped_y = get_pitch_heights(lowest - 1, highest, height)
+        self.row_height = height // max(highest - (lowest - 1), 1)
+
+        self.track_width = width // self.num_tracks
+        self.track_left = [self.track_width * (track - 1) for track in range(self.num_tracks + 1)]
+        self.track_center = [(left * 2 + self.track_width) // 2 for left in self.track_left]
+        return True
+
+
+def get_pitch_heights(lowest, highest, height):
+    """
+    Returns the y of every midi pitch on a display of the given height, the same as Utilities.graph_note_y.
+    """
+    span = max(highest - lowest, 1)
+    return [int(height - (((pitch - lowest) / span) * height)) for pitch in range(128)]
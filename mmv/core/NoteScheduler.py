@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""
+This class keeps track of the notes that are currently sounding and when each of them must be turned off.
+
+Note-offs are stored in a min-heap keyed by their release time, so each frame only has to pop the notes that have
+expired instead of scanning every note that is playing. Every scheduled note gets its own handle, which keeps
+notes with the same pitch (or even the same VizNote) apart and makes sure each one is released exactly once.
+"""
+import heapq
+
+
+class NoteScheduler:
+
+    def __init__(self):
+        # min-heap of (release time, handle) tuples
+        self.heap = []
+        # maps the handle of each sounding note to the note itself
+        self.sounding = {}
+        # the next handle to give to a scheduled note
+        self.next_handle = 0
+
+        # number of notes scheduled and released since the last call to start_frame, shown in the status bar
+        self.frame_pushed = 0
+        self.frame_popped = 0
+        # most notes that have been sounding at the same time, shown in the status bar
+        self.max_pending = 0
+
+    def __len__(self):
+        return len(self.sounding)
+
+    def __iter__(self):
+        return iter(list(self.sounding.values()))
+
+    def start_frame(self):
+        """
+        Resets the per-frame counters.
+        """
+        self.frame_pushed = 0
+        self.frame_popped = 0
+
+    def schedule(self, note, release_time):
+        """
+        Adds a sounding note that should be released at the given time, and returns its handle.
+        """
+        handle = self.next_handle
+        self.next_handle += 1
+        self.sounding[handle] = note
+        heapq.heappush(self.heap, (release_time, handle))
+
+        self.frame_pushed += 1
+        if len(self.sounding) > self.max_pending:
+            self.max_pending = len(self.sounding)
+        return handle
+
+    def pop_expired(self, time):
+        """
+        Removes and returns every note whose release time is at or before the given time, in release order.
+        """
+        expired = []
+        while self.heap and self.heap[0][0] <= time:
+            release_time, handle = heapq.heappop(self.heap)
+            note = self.sounding.pop(handle, None)
+            if note is not None:
+                expired.append(note)
+        self.frame_popped += len(expired)
+        return expired
+
+    def clear(self):
+        """
+        Forgets every sounding note without releasing them.
+        """
+        self.heap.clear()
+        self.sounding.clear()
+        self.max_pending = 0
+        self.start_frame()
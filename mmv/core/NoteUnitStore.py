@@ -0,0 +1,285 @@
+#!/usr/bin/env python
+"""
+This class keeps the rect, circle and ellipse note units of the visualization in numpy arrays, one array per field
+(position, size, color, fade...), with one row per unit.
+
+A unit in the store is only a view of its row: reading or setting one of its fields reads or sets the arrays, so
+presets can keep using units like any other object. What the store saves is the work done on every unit every
+frame: fading, deleting the units that faded out and darkening dissonant notes are done for every row at once with
+numpy, instead of once per unit in python. The colors the units are drawn with are worked out (and mapped to the
+pixel format of the screen) once per frame too, and their positions only when they move, so each unit only has to
+hand its row to pygame.
+
+Removing a unit only marks its row as dead. The dead rows are dropped all at once when there are enough of them to
+be worth moving the others.
+"""
+import numpy as np
+import pygame.surfarray
+import mmv.util.Palette as pal
+
+# shapes of the units in the store
+RECT = 0
+CIRCLE = 1
+ELLIPSE = 2
+
+# type and shape of every field kept in the store, by name
+FIELDS = {'x': (np.int32, ()),
+          'y': (np.int32, ()),
+          'w': (np.int32, ()),
+          'h': (np.int32, ()),
+          'radius': (np.int32, ()),
+          'line_width': (np.int32, ()),
+          'color': (np.uint8, (3,)),
+          'dissonance': (np.float64, ()),
+          'fade': (np.bool_, ()),
+          'fade_speed': (np.int32, ()),
+          'delete_after_fade': (np.bool_, ()),
+          'should_delete': (np.bool_, ())}
+
+# fields that change where units are drawn, and fields that change the color they are drawn with
+GEOMETRY_FIELDS = ('x', 'y', 'w', 'h', 'radius', 'line_width')
+COLOR_FIELDS = ('color', 'dissonance')
+
+# number of rows the arrays start with
+INITIAL_CAPACITY = 256
+
+# fewest dead rows worth compacting, and the fraction of the rows they have to be
+MIN_COMPACT = 256
+COMPACT_RATIO = 0.25
+
+
+class StoredField:
+    """
+    A field of a unit that lives in the arrays of a NoteUnitStore while the unit is in one, and in the unit itself
+    otherwise.
+    """
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, unit, owner=None):
+        if unit is None:
+            return self
+        store = unit.store
+        if store is None:
+            return unit.__dict__[self.name]
+        return store.get(self.name, unit.row)
+
+    def __set__(self, unit, value):
+        store = unit.store
+        if store is None:
+            unit.__dict__[self.name] = value
+        else:
+            store.set(self.name, unit.row, value)
+
+
+class NoteUnitStore:
+
+    def __init__(self):
+        # number of rows used, dead ones included
+        self.count = 0
+        # number of dead rows
+        self.dead = 0
+        # every field of every row, by field name
+        self.columns = {name: np.zeros((INITIAL_CAPACITY,) + shape, dtype=dtype)
+                        for name, (dtype, shape) in FIELDS.items()}
+        # shape of every row, and whether it holds a unit
+        self.shapes = np.zeros(INITIAL_CAPACITY, dtype=np.uint8)
+        self.alive = np.zeros(INITIAL_CAPACITY, dtype=np.bool_)
+        # the unit of every row, or None for dead rows
+        self.units = []
+        # names of the fields each type of unit has, by type
+        self.type_fields = {}
+
+        # the surface the rows are ready to be drawn on, or None if anything changed since they were
+        self.ready = None
+        # whether the colors or the positions and sizes of the rows changed since they were last worked out
+        self.colors_stale = True
+        self.geometry_stale = True
+        # the colors the rows are drawn with, mapped to the pixel format of the surface they were worked out for
+        self.draw_colors = []
+        self.colors_surface = None
+        # the fields that say where the rows are drawn, as lists
+        self.draw_x = []
+        self.draw_y = []
+        self.draw_w = []
+        self.draw_h = []
+        self.draw_radii = []
+        self.draw_line_widths = []
+
+    def __len__(self):
+        return self.count - self.dead
+
+    def add(self, unit, shape):
+        """
+        Moves the fields of a unit into a new row, making the unit a view of it.
+        """
+        if self.count == len(self.alive):
+            self.grow()
+        row = self.count
+        self.count += 1
+        fields = self.get_fields(type(unit))
+        values = unit.__dict__
+        for name in fields:
+            self.columns[name][row] = values.pop(name)
+        self.shapes[row] = shape
+        self.alive[row] = True
+        self.units.append(unit)
+        unit.store = self
+        unit.row = row
+        self.invalidate()
+
+    def remove(self, unit):
+        """
+        Moves the fields of a unit back into it and marks its row as dead.
+        """
+        row = unit.row
+        self.detach(unit)
+        self.alive[row] = False
+        self.units[row] = None
+        self.dead += 1
+
+    def detach(self, unit):
+        """
+        Copies the fields of a unit from its row back into the unit, so it works without the store.
+        """
+        row = unit.row
+        values = unit.__dict__
+        for name in self.get_fields(type(unit)):
+            values[name] = self.get(name, row)
+        unit.store = None
+        unit.row = -1
+
+    def get_fields(self, unit_type):
+        """
+        Returns the names of the stored fields units of the given type have.
+        """
+        fields = self.type_fields.get(unit_type)
+        if fields is None:
+            fields = [name for name in FIELDS if isinstance(getattr(unit_type, name, None), StoredField)]
+            self.type_fields[unit_type] = fields
+        return fields
+
+    def get(self, name, row):
+        """
+        Returns a field of a row as a python value (a tuple for colors).
+        """
+        value = self.columns[name][row]
+        if name == 'color':
+            return tuple(value.tolist())
+        return value.item()
+
+    def set(self, name, row, value):
+        """
+        Sets a field of a row.
+        """
+        self.columns[name][row] = value
+        if name in COLOR_FIELDS:
+            self.colors_stale = True
+            self.ready = None
+        elif name in GEOMETRY_FIELDS:
+            self.geometry_stale = True
+            self.ready = None
+
+    def invalidate(self):
+        """
+        Makes the colors and positions of every row be worked out again before they're drawn.
+        """
+        self.colors_stale = True
+        self.geometry_stale = True
+        self.ready = None
+
+    def grow(self):
+        """
+        Doubles the number of rows the arrays can hold.
+        """
+        capacity = len(self.alive) * 2
+        for name, column in self.columns.items():
+            grown = np.zeros((capacity,) + column.shape[1:], dtype=column.dtype)
+            grown[:self.count] = column[:self.count]
+            self.columns[name] = grown
+        for name in ('shapes', 'alive'):
+            column = getattr(self, name)
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[:self.count] = column[:self.count]
+            setattr(self, name, grown)
+
+    def update(self):
+        """
+        Fades every unit that fades, and flags the ones that faded out to be deleted. Returns the units that were
+        flagged before this update (they were drawn once more, black), so they can be removed now.
+        """
+        n = self.count
+        columns = self.columns
+        alive = self.alive[:n]
+        should_delete = columns['should_delete'][:n]
+        expired = [self.units[row] for row in np.flatnonzero(should_delete & alive).tolist()]
+
+        # circles don't fade
+        fades = alive & (self.shapes[:n] != CIRCLE)
+        fading = np.flatnonzero(fades & columns['fade'][:n])
+        if len(fading):
+            colors = columns['color']
+            colors[fading] = pal.fade_all(colors[fading], columns['fade_speed'][fading])
+            self.colors_stale = True
+            self.ready = None
+        faded = fades & columns['delete_after_fade'][:n] & ~columns['color'][:n].any(axis=1)
+        should_delete |= faded
+        return expired
+
+    def prepare(self, surface):
+        """
+        Works out whatever changed of the colors, positions and sizes the rows are drawn with on the given surface.
+        """
+        n = self.count
+        columns = self.columns
+        if self.colors_stale or surface is not self.colors_surface:
+            # rects are darker the more dissonant their note is
+            amounts = np.trunc(columns['dissonance'][:n] * -10)
+            amounts = np.where(self.shapes[:n] == RECT, np.clip(amounts, -255, 255), 0)
+            colors = pal.brighten_all(columns['color'][:n], amounts)
+            # mapped colors are single ints, which are much faster to hand over than tuples
+            self.draw_colors = pygame.surfarray.map_array(surface, colors[:, None, :])[:, 0].tolist() if n else []
+            self.colors_surface = surface
+            self.colors_stale = False
+        if self.geometry_stale:
+            self.draw_x = columns['x'][:n].tolist()
+            self.draw_y = columns['y'][:n].tolist()
+            self.draw_w = columns['w'][:n].tolist()
+            self.draw_h = columns['h'][:n].tolist()
+            self.draw_radii = columns['radius'][:n].tolist()
+            self.draw_line_widths = columns['line_width'][:n].tolist()
+            self.geometry_stale = False
+        self.ready = surface
+
+    def compact(self):
+        """
+        Drops the dead rows, keeping the others in order, if there are enough of them.
+        """
+        if not self.dead or self.dead < max(MIN_COMPACT, self.count * COMPACT_RATIO):
+            return
+        keep = np.flatnonzero(self.alive[:self.count])
+        k = len(keep)
+        for column in self.columns.values():
+            column[:k] = column[keep]
+        self.shapes[:k] = self.shapes[keep]
+        self.alive[:k] = True
+        self.alive[k:self.count] = False
+        self.units = [unit for unit in self.units if unit is not None]
+        for row, unit in enumerate(self.units):
+            unit.row = row
+        self.count = k
+        self.dead = 0
+        self.invalidate()
+
+    def clear(self):
+        """
+        Removes every unit, moving their fields back into them.
+        """
+        for unit in self.units:
+            if unit is not None:
+                self.detach(unit)
+        self.alive[:self.count] = False
+        self.units = []
+        self.count = 0
+        self.dead = 0
+        self.invalidate()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+"""
+This is a VizNote that doesn't hold any data of its own: its properties are read from a record of a NoteStore
+whenever they are used. Views are created on demand and thrown away once the note is done, so a song with millions
+of notes never has more than a handful of note objects alive.
+
+Chords aren't transcribed for songs kept in a NoteStore, so the chord attributes of a view are always None.
+"""
+import mmv.core.VizNote as vn
+
+
+class NoteView(vn.VizNote):
+
+    # a view never has quantization errors or chords
+    offset_error = 0.
+    length_error = 0.
+    chord_in_beat = None
+    chord_in_half_bar = None
+    chord_in_bar = None
+
+    def __init__(self, store, index):
+        # the NoteStore the note is in
+        self.store = store
+        # index of the note's record in the store
+        self.index = index
+        self._note = None
+
+    def __eq__(self, other):
+        return isinstance(other, NoteView) and other.store is self.store and other.index == self.index
+
+    def __hash__(self):
+        return hash((id(self.store), self.index))
+
+    @property
+    def pitch(self):
+        return int(self.store.records['pitch'][self.index])
+
+    @property
+    def velocity(self):
+        return int(self.store.records['velocity'][self.index])
+
+    @property
+    def track(self):
+        return int(self.store.records['track'][self.index])
+
+    @property
+    def channel(self):
+        return int(self.store.records['channel'][self.index])
+
+    @property
+    def offset(self):
+        return int(self.store.records['start'][self.index]) / float(self.store.table.ticks_per_quarter)
+
+    @property
+    def quarter_length(self):
+        return int(self.store.records['duration'][self.index]) / float(self.store.table.ticks_per_quarter)
@@ -3,12 +3,14 @@
 
 """
 import pygame
-import music21
 import mmv.util.Utilities as util
 import math
 import mmv.core.Unit as unit
 import mmv.util.ColorHelper as colorhelper
 import mmv.util.MusicComp as muse
+import mmv.core.VizNote as vn
+import mmv.core.Layout as lay
+import mmv.core.Background as bg
 
 
 class BasePreset:
@@ -26,22 +28,121 @@ class BasePreset:
         self.viz_manager = viz_manager
         self.lowest_pitch = float("inf")
         self.highest_pitch = 0
-        self.notes_played = []
+        # ChordInfo of the last chord played
         self.latest_chord = None
         self.key = None
         self.num_tracks = 0
-
-    def first_load(self, score):
+        # SongAnalysis of the song, set in first_load
+        self.analysis = None
+        # TensionTable of the song, for presets that use the tension or dissonance of notes. None until it's needed
+        self.tension_table = None
+        # where notes are drawn on the screen, built in first_load and recomputed when the display is resized
+        self.layout = lay.Layout()
+        # the units that never change, drawn behind everything else
+        self.background = bg.Background()
+        # the layers the units of the preset are on. lower layers are drawn first
+        self.layers = [0]
+
+    def first_load(self, analysis):
         """
         Runs once to gather and store any information relative to the
-        song before each frame of the visualization is made.
+        song before each frame of the visualization is made. The SongAnalysis
+        of the song holds its key, edge pitches and track statistics, computed
+        once and shared by every preset.
+
+        This runs on a worker thread while the main thread keeps drawing, so it
+        shouldn't touch the screen or the units of the viz manager: anything
+        that's static and is always displayed is drawn in first_draw.
+
+        YOUR CODE GOES BELOW
+        """
+        pass
+
+    def first_draw(self):
+        """
+        Runs once on the main thread after first_load, before any note is played. Sets the background of the preset
+        for its layout, and draws anything that's on the screen from the start.
+
+        YOUR CODE GOES BELOW
+        """
+        self.background.set_units(self.get_background(self.layout))
+
+    def set_layout(self, lowest_pitch, highest_pitch, num_tracks=1):
+        """
+        Builds the layout of the preset for the current size of the display. Its background is set in first_draw.
+        """
+        size = self.viz_manager.main_frame.display.size
+        self.layout = lay.Layout(size.x, size.y, lowest_pitch, highest_pitch, num_tracks)
 
-        This will also draw anything that's static and is always displayed (i.e. grid lines).
+    def on_resize(self, width, height):
+        """
+        Called on the main thread when the display is resized. Recomputes the layout and the background of the
+        preset.
+        """
+        if self.layout.resize(width, height):
+            self.background.set_units(self.get_background(self.layout))
+
+    def get_background(self, layout):
+        """
+        Returns the units that never change while a song plays (i.e. grid lines), for the given layout. They are
+        drawn once into the background of the preset, so they shouldn't be added to the units of the viz manager.
+
+        YOUR CODE GOES BELOW
+        """
+        return []
+
+    @staticmethod
+    def get_track_dividers(layout):
+        """
+        Returns white lines down the left edge of the column of every track.
+        """
+        if layout.track_width <= 0:
+            return []
+        return [unit.LineUnit(x, 0, x, layout.height, (255, 255, 255), 1)
+                for x in range(0, layout.width, layout.track_width)]
+
+    def prepare_notes(self, notes):
+        """
+        Runs on a worker thread, a few bars at a time ahead of the playhead, to precompute anything the preset
+        needs for the given notes. The chords of the notes are already set, but the key of the song might not be
+        known yet. Notes can reach per_note_on before they were prepared, so this is only ever a head start.
 
         YOUR CODE GOES BELOW
         """
         pass
 
+    def get_tension_table(self):
+        """
+        Returns the TensionTable of the song, waiting for it (or computing it) if it isn't known yet. Only call this
+        from prepare_notes, on the preparer's thread.
+        """
+        if self.tension_table is None:
+            self.tension_table = self.analysis.tension
+        return self.tension_table
+
+    def find_tension_table(self):
+        """
+        Returns the TensionTable of the song if it's known, or None. Never waits for it, so it's safe to call while
+        playing.
+        """
+        if self.tension_table is None and self.analysis is not None and self.analysis.is_known('tension'):
+            self.tension_table = self.analysis.tension
+        return self.tension_table
+
+    def get_note_tension(self, viz_note):
+        """
+        Returns the tension of a note, or 0 if the tension of the song isn't known yet.
+        """
+        table = self.find_tension_table()
+        return table.get_tension(viz_note) if table is not None else 0
+
+    def get_note_dissonance(self, viz_note):
+        """
+        Returns the dissonance of a note, or 0 if the tension of the song isn't known yet.
+        """
+        table = self.find_tension_table()
+        return table.get_dissonance(viz_note) if table is not None else 0
+
     def per_note_on(self, screen, message):
         """
         Draws given message.
@@ -64,7 +165,7 @@ class PresetTest(BasePreset):
     """
     For testing purposes.
     """
-    def first_load(self, score):
+    def first_load(self, analysis):
         screen_x = self.viz_manager.main_frame.display.size.x
         screen_y = self.viz_manager.main_frame.display.size.y
 
@@ -91,19 +192,16 @@ class PresetSimpleColorCircleRelative(BasePreset):
         - radius of circle is determined by velocity
     """
 
-    def first_load(self, score):
-        self.lowest_pitch, self.highest_pitch = util.get_edge_pitches(score)
+    def first_load(self, analysis):
+        self.lowest_pitch, self.highest_pitch = analysis.edge_pitches
+        self.set_layout(self.lowest_pitch, self.highest_pitch)
 
     def per_note_on(self, screen, viz_note):
-        screen_x = self.viz_manager.main_frame.display.size.x
-        screen_y = self.viz_manager.main_frame.display.size.y
+        layout = self.layout
         color = colorhelper.simple_note_to_color_tuple(viz_note)
-        y = util.graph_note_y(viz_note, self.highest_pitch, self.lowest_pitch, screen_y)
-        r = int(viz_note.note.volume.velocity) // 2
-        circle = unit.CircleNoteUnit(screen_x // 2, 0, color, viz_note, r)
+        r = viz_note.velocity // 2
+        circle = unit.CircleNoteUnit(layout.center_x - r, layout.pitch_y[viz_note.pitch], color, viz_note, r)
         circle.id = id(viz_note)
-        circle = util.create_unit_in_center_of_quadrant(circle, (0, 0), (screen_x, screen_y))
-        circle.y = y
         self.viz_manager.units.append(circle)
 
     def per_note_off(self, screen, viz_note):
@@ -119,16 +217,15 @@ class PresetSimpleColorCircleMaxPitch(BasePreset):
         - radius of circle is determined by the velocity
     """
 
+    def first_load(self, analysis):
+        self.set_layout(0, 255)
+
     def per_note_on(self, screen, viz_note):
         note = viz_note.note
-        screen_x = self.viz_manager.main_frame.display.size.x
-        screen_y = self.viz_manager.main_frame.display.size.y
-        color = colorhelper.simple_note_to_color_tuple(note)
-        y = util.graph_note_y(viz_note, 255, 0, screen_y)
-        r = int(note.volume.velocity) // 2
-        circle = unit.CircleNoteUnit(screen_x // 2, 0, color, note, r)
-        circle = util.create_unit_in_center_of_quadrant(circle, (0, 0), (screen_x, screen_y))
-        circle.y = y
+        layout = self.layout
+        color = colorhelper.simple_note_to_color_tuple(viz_note)
+        r = viz_note.velocity // 2
+        circle = unit.CircleNoteUnit(layout.center_x - r, layout.pitch_y[viz_note.pitch], color, note, r)
         self.viz_manager.units.append(circle)
 
     def per_note_off(self, screen, message):
@@ -142,16 +239,15 @@ class PresetPianoRollFading(BasePreset):
     Notes with greater pitch go higher on the screen, lower notes go lower.
     """
 
-    def first_load(self, score):
-        self.lowest_pitch, self.highest_pitch = util.get_edge_pitches(score)
+    def first_load(self, analysis):
+        self.lowest_pitch, self.highest_pitch = analysis.edge_pitches
+        self.set_layout(self.lowest_pitch, self.highest_pitch)
 
     def per_note_on(self, screen, viz_note):
-        screen_x = self.viz_manager.main_frame.display.size.x
-        screen_y = self.viz_manager.main_frame.display.size.y
-        y = util.graph_note_y(viz_note, self.highest_pitch, self.lowest_pitch, screen_y)
+        y = self.layout.pitch_y[viz_note.pitch]
         color = colorhelper.get_rand_color()
-        note_rect = unit.RectNoteUnit(screen_x // 2, y, color, viz_note, 200, 20)
-        note_rect.x -= (note_rect.w // 2)  # subtracts half the width as the offset to make the unit center
+        # subtracts half the width as the offset to make the unit center
+        note_rect = unit.RectNoteUnit(self.layout.center_x - 100, y, color, viz_note, 200, 20)
         note_rect.fade = True
         note_rect.delete_after_fade = True
         self.viz_manager.units.append(note_rect)
@@ -164,18 +260,15 @@ class PresetPianoRoll(BasePreset):
     Notes with greater pitch go higher on the screen, lower notes go lower.
     """
 
-    def first_load(self, score):
-        self.lowest_pitch, self.highest_pitch = util.get_edge_pitches(score)
+    def first_load(self, analysis):
+        self.lowest_pitch, self.highest_pitch = analysis.edge_pitches
+        self.set_layout(self.lowest_pitch, self.highest_pitch)
 
     def per_note_on(self, screen, viz_note):
         note = viz_note.note
-        screen_x = self.viz_manager.main_frame.display.size.x
-        screen_y = self.viz_manager.main_frame.display.size.y
-        y = util.graph_note_y(note, self.highest_pitch, self.lowest_pitch, screen_y)
+        y = self.layout.pitch_y[viz_note.pitch]
         color = colorhelper.get_rand_color()
-        note_rect = unit.RectNoteUnit(screen_x // 2, y, color, note, 200, 20)
-        note_rect = util.create_unit_in_center_of_quadrant(note_rect, (0, 0), (screen_x, screen_y))
-        note_rect.y = y
+        note_rect = unit.RectNoteUnit(self.layout.center_x - 100, y, color, note, 200, 20)
         self.viz_manager.units.append(note_rect)
 
     def per_note_off(self, screen, message):
@@ -187,19 +280,19 @@ class PresetMonochromePianoRoll(BasePreset):
     Similar to PianoRoll, but in black-white monochrome.
     """
 
-    def first_load(self, score):
-        self.lowest_pitch, self.highest_pitch = util.get_edge_pitches(score)
+    def first_load(self, analysis):
+        self.lowest_pitch, self.highest_pitch = analysis.edge_pitches
+        self.set_layout(self.lowest_pitch, self.highest_pitch)
+
+    def first_draw(self):
+        super().first_draw()
         self.viz_manager.screen.fill((0, 0, 255))
 
     def per_note_on(self, screen, viz_note):
         note = viz_note.note
-        screen_x = self.viz_manager.main_frame.display.size.x
-        screen_y = self.viz_manager.main_frame.display.size.y
-        y = util.graph_note_y(note, self.highest_pitch, self.lowest_pitch, screen_y)
-        color = colorhelper.midi_to_monochrome(viz_note.note.pitch.midi)
-        note_rect = unit.RectNoteUnit(0, 0, color, note, 200, 20)
-        note_rect = util.create_unit_in_center_of_quadrant(note_rect, (0, 0), (screen_x, screen_y))
-        note_rect.y = y
+        y = self.layout.pitch_y[viz_note.pitch]
+        color = colorhelper.midi_to_monochrome(viz_note.pitch)
+        note_rect = unit.RectNoteUnit(self.layout.center_x - 100, y, color, note, 200, 20)
         self.viz_manager.units.append(note_rect)
 
     def per_note_off(self, screen, message):
@@ -211,17 +304,15 @@ class PresetColorPianoRoll(BasePreset):
     This is a basic piano roll preset, except with color.
     """
 
-    def first_load(self, score):
-        self.lowest_pitch, self.highest_pitch = util.get_edge_pitches(score)
+    def first_load(self, analysis):
+        self.lowest_pitch, self.highest_pitch = analysis.edge_pitches
+        self.set_layout(self.lowest_pitch, self.highest_pitch)
 
     def per_note_on(self, screen, viz_note):
-        viz_note = viz_note.note
-        screen_x = self.viz_manager.main_frame.display.size.x
-        screen_y = self.viz_manager.main_frame.display.size.y
+        note = viz_note.note
         color = colorhelper.simple_note_to_color_tuple(viz_note)
-        note_rect = unit.RectNoteUnit((screen_x // 2) - 100, 0, color, viz_note, 200, 20)
-        note_rect = util.create_unit_in_center_of_quadrant(note_rect, (0, 0), (screen_x, screen_y))
-        note_rect.y = util.graph_note_y(viz_note, self.highest_pitch, self.lowest_pitch, screen_y)
+        y = self.layout.pitch_y[viz_note.pitch]
+        note_rect = unit.RectNoteUnit(self.layout.center_x - 100, y, color, note, 200, 20)
         self.viz_manager.units.append(note_rect)
 
     def per_note_off(self, screen, message):
@@ -234,30 +325,30 @@ class PresetStaticPianoRoll(BasePreset):
     This preset is good for looking at the whole song as a whole.
     """
 
-    def first_load(self, score):
+    def __init__(self, viz_manager, name, desc):
+        super().__init__(viz_manager, name, desc)
+        # a rect unit for each note of the song, made in first_load and added to the screen in first_draw
+        self.note_rects = []
+
+    def first_load(self, analysis):
         # graph each note on the screen based off of pitch, offset, and length
-        self.viz_manager.screen.fill((0, 0, 0))
-        notes = []
-        for note in score.flat.notes:
-            if isinstance(note, music21.note.Note):
-                notes.append(note)
-            if isinstance(note, music21.chord.Chord):
-                chord_notes = note._notes
-                for chord_note in chord_notes:
-                    if isinstance(chord_note, music21.note.Note):
-                        new_note = chord_note
-                        new_note.offset += note.offset
-                        new_note.quarterLength = note.quarterLength
-                        notes.append(new_note)
+        notes = self.viz_manager.notes
+        self.note_rects = []
 
         for note in notes:
-            if isinstance(note, music21.note.Note):
+            if isinstance(note, vn.VizNote):
                 screen_x = self.viz_manager.main_frame.display.size.x
                 screen_y = self.viz_manager.main_frame.display.size.y
                 rect = util.create_note_rect(notes, note, pygame.Rect(0, 0, screen_x, screen_y))
                 color = colorhelper.get_rand_color()
                 note_rect = unit.RectNoteUnit(rect.left, rect.top, color, note, rect.width, rect.height)
-                self.viz_manager.units.append(note_rect)
+                self.note_rects.append(note_rect)
+
+    def first_draw(self):
+        super().first_draw()
+        self.viz_manager.screen.fill((0, 0, 0))
+        for note_rect in self.note_rects:
+            self.viz_manager.units.append(note_rect)
 
 
 class PresetTwoTrackColorPianoRoll(BasePreset):
@@ -266,36 +357,30 @@ class PresetTwoTrackColorPianoRoll(BasePreset):
     Each note is drawn onto the screen in a piano roll fashion.
     Notes with greater pitch go higher on the screen, lower notes go lower.
     """
-    def first_load(self, score):
-        self.lowest_pitch, self.highest_pitch = util.get_edge_pitches(score)
+    def first_load(self, analysis):
+        self.lowest_pitch, self.highest_pitch = analysis.edge_pitches
+        # the left half of the screen is track 1, the right half track 2
+        self.set_layout(self.lowest_pitch, self.highest_pitch, 2)
+
+    def get_background(self, layout):
+        # white line down the center of the screen
+        return [unit.LineUnit(layout.center_x, 0, layout.center_x, layout.height, (255, 255, 255), 1)]
 
     def per_note_on(self, screen, viz_note):
         note = viz_note.note
-        screen_x = self.viz_manager.main_frame.display.size.x
-        screen_y = self.viz_manager.main_frame.display.size.y
-        color = colorhelper.simple_note_to_color_tuple(note)
+        layout = self.layout
+        color = colorhelper.simple_note_to_color_tuple(viz_note)
 
         # variables for note_rect sizes and y position
-        y = util.graph_note_y(note, self.highest_pitch, self.lowest_pitch, screen_y)
+        y = layout.pitch_y[viz_note.pitch]
         w = 180
         h = 15
 
         # Put note in left or right part of the screen, depending on what track it belongs to
         # print("Track: {0}".format(viz_note.track))
-        if viz_note.track is 2:
-            note_rect = unit.RectNoteUnit(0, 0, color, note, w, h)
-            note_rect = util.create_unit_in_center_of_quadrant(note_rect, (screen_x // 2, 0), (screen_x, screen_y))
-            note_rect.y = y
+        if viz_note.track == 2 or viz_note.track == 1:
+            note_rect = unit.RectNoteUnit(layout.track_center[viz_note.track] - w // 2, y, color, note, w, h)
             self.viz_manager.units.append(note_rect)
-        elif viz_note.track is 1:
-            note_rect = unit.RectNoteUnit(0, 0, color, note, w, h)
-            note_rect = util.create_unit_in_center_of_quadrant(note_rect, (0, 0), (screen_x // 2, screen_y))
-            note_rect.y = y
-            self.viz_manager.units.append(note_rect)
-
-        # Add white line down center of the screen
-        line_unit = unit.LineUnit(screen_x // 2, 0, screen_x // 2, screen_y, (255, 255, 255), 1)
-        self.viz_manager.units.append(line_unit)
 
     def per_note_off(self, screen, message):
         self.viz_manager.remove_unit(message.note)
@@ -309,31 +394,24 @@ class PresetMultiTrackColorCircle(BasePreset):
         super().__init__(viz_manager, name, desc)
         self.num_tracks = 0
 
-    def first_load(self, score):
-        self.lowest_pitch, self.highest_pitch = util.get_edge_pitches(score)
-        self.num_tracks = len(score.parts)
+    def first_load(self, analysis):
+        self.lowest_pitch, self.highest_pitch = analysis.edge_pitches
+        self.num_tracks = analysis.num_tracks
+        self.set_layout(self.lowest_pitch, self.highest_pitch, self.num_tracks)
+
+    def get_background(self, layout):
+        # track divider lines
+        return self.get_track_dividers(layout)
 
     def per_note_on(self, screen, viz_note):
         note = viz_note.note
-        screen_x = self.viz_manager.main_frame.display.size.x
-        screen_y = self.viz_manager.main_frame.display.size.y
-        color = colorhelper.simple_note_to_color_tuple(note)
+        layout = self.layout
+        color = colorhelper.simple_note_to_color_tuple(viz_note)
         r = 15
-        circle_note = unit.CircleNoteUnit(0, 0, color, note, r)
-
-        interval = screen_x // self.num_tracks
 
-        # Add white line down center of the screen
-        for i in range(0, screen_x, interval):
-            line = unit.LineUnit(i, 0, i, screen_y, (255, 255, 255), 1)
-            self.viz_manager.units.append(line)
-
-        x = interval * (viz_note.track - 1)
-        # print("Printing note {0} in track {1} in interval {2}".format(note, viz_note.track, x))
-        circle_note = util.create_unit_in_center_of_quadrant(circle_note, (0, 0), ((x + interval), screen_y))
-        # print("Circle note x={0}, y={1}".format(circle_note.x, circle_note.y))
-        # circle_note.x += (self.num_tracks - 1) * interval
-        circle_note.y = util.graph_note_y(note, self.highest_pitch, self.lowest_pitch, screen_y)
+        # the circle goes in the middle of its track's column
+        x = layout.track_center[viz_note.track] - r
+        circle_note = unit.CircleNoteUnit(x, layout.pitch_y[viz_note.pitch], color, note, r)
         self.viz_manager.units.append(circle_note)
 
     def per_note_off(self, screen, message):
@@ -344,27 +422,21 @@ class PresetMultiTrackColorPianoRoll(BasePreset):
     """
 
     """
-    def first_load(self, score):
-        self.lowest_pitch, self.highest_pitch = util.get_edge_pitches(score)
-        self.num_tracks = len(score.parts)
+    def first_load(self, analysis):
+        self.lowest_pitch, self.highest_pitch = analysis.edge_pitches
+        self.num_tracks = analysis.num_tracks
+        self.set_layout(self.lowest_pitch, self.highest_pitch, self.num_tracks)
 
     def per_note_on(self, screen, viz_note):
         note = viz_note.note
-        screen_x = self.viz_manager.main_frame.display.size.x
-        screen_y = self.viz_manager.main_frame.display.size.y
-        color = colorhelper.simple_note_to_color_tuple(note)
-        track_width = screen_x // self.num_tracks
-
-        h = screen_y // (self.highest_pitch - (self.lowest_pitch - 1))
-        rect_note = unit.RectNoteUnit(0, 0, color, note, track_width, h)
+        layout = self.layout
+        color = colorhelper.simple_note_to_color_tuple(viz_note)
+        # the note fills the row of its pitch across its track's column
+        x = layout.track_left[viz_note.track]
+        y = layout.cropped_y[viz_note.pitch]
+        rect_note = unit.RectNoteUnit(x, y, color, note, layout.track_width, layout.row_height)
         rect_note.id = id(viz_note)     # this is an important line!
 
-        region_x = track_width * (viz_note.track - 1)
-        y = util.graph_note_y(note, self.highest_pitch, self.lowest_pitch, screen_y, True)
-
-        rect_note = util.create_unit_in_center_of_quadrant(rect_note, (region_x, 0), (region_x + track_width, screen_y))
-        rect_note.y = y
-
         self.viz_manager.units.append(rect_note)
 
     def per_note_off(self, screen, viz_note):
@@ -375,54 +447,39 @@ class PresetMultiTrackChords(BasePreset):
     """
 
     """
-    def first_load(self, score):
-        self.lowest_pitch, self.highest_pitch = util.get_edge_pitches(score)
-        self.num_tracks = len(score.parts)
+    def first_load(self, analysis):
+        self.lowest_pitch, self.highest_pitch = analysis.edge_pitches
+        self.num_tracks = analysis.num_tracks
+        self.set_layout(self.lowest_pitch, self.highest_pitch, self.num_tracks)
 
     def per_note_on(self, screen, viz_note):
         note = viz_note.note
-        screen_x = self.viz_manager.main_frame.display.size.x
-        screen_y = self.viz_manager.main_frame.display.size.y
-        color = colorhelper.scale_degree_to_color(note, self.viz_manager.key)
-        track_width = screen_x // self.num_tracks
-
-        h = screen_y // (self.highest_pitch - (self.lowest_pitch - 1))
-        rect_note = unit.RectNoteUnit(0, 0, color, note, track_width, h)
+        layout = self.layout
+        color = colorhelper.scale_degree_to_color(viz_note, self.viz_manager.key)
+        # the note fills the row of its pitch across its track's column
+        x = layout.track_left[viz_note.track]
+        y = layout.cropped_y[viz_note.pitch]
+        rect_note = unit.RectNoteUnit(x, y, color, note, layout.track_width, layout.row_height)
         rect_note.id = id(viz_note)
 
-        region_x = track_width * (viz_note.track - 1)
-        y = util.graph_note_y(note, self.highest_pitch, self.lowest_pitch, screen_y, True)
-
-        rect_note = util.create_unit_in_center_of_quadrant(rect_note, (region_x, 0), (region_x + track_width, screen_y))
-        rect_note.y = y
-
         self.viz_manager.units.append(rect_note)
 
         # chord stuff
-        self.notes_played.append(viz_note)
-        recent_notes = muse.get_recent_notes(self.notes_played)
-        chord = muse.get_chord(recent_notes)
-        chord_name = chord.pitchedCommonName
-        s1 = str(chord_name)
-        s2 = ""
-        if isinstance(self.latest_chord, music21.chord.Chord):
-            s2 = str(self.latest_chord.pitchedCommonName)
-        if s1 != s2:
-            print("new chord: " + str(chord_name))
+        chord = self.viz_manager.chord_tracker.chord
+        if self.latest_chord is None or chord.id != self.latest_chord.id:
+            print("new chord: " + chord.name)
 
             if self.latest_chord is None:
                 self.latest_chord = chord
 
-            root = self.latest_chord.root()
-            note = music21.note.Note(root)
-            self.viz_manager.remove_unit(note, id(note), type(unit.RectChordUnit))
+            note = muse.get_root_note(self.latest_chord)
+            self.viz_manager.remove_unit(note, the_type=unit.RectChordUnit)
 
             self.latest_chord = chord
-            root = self.latest_chord.root()
-            note = music21.note.Note(root)
+            note = muse.get_root_note(self.latest_chord)
 
             color = colorhelper.scale_degree_to_color(note, self.viz_manager.key)
-            rect_chord = unit.RectChordUnit(0, 0, color, note, screen_x, screen_y, 20)
+            rect_chord = unit.RectChordUnit(0, 0, color, note, layout.width, layout.height, 20)
             rect_chord.id = id(note)
 
             self.viz_manager.units.append(rect_chord)
@@ -442,28 +499,26 @@ class PresetMultiTrackChordsCircle(BasePreset):
         self.current_chord_unit = None
         self.chord_particle_unit = None
 
-    def first_load(self, score):
-        self.lowest_pitch, self.highest_pitch = util.get_edge_pitches(score)
-        self.num_tracks = len(score.parts)
-        display_size = self.viz_manager.main_frame.display.size
-        x = display_size.x // 2
-        y = display_size.y // 2
+    def first_load(self, analysis):
+        self.lowest_pitch, self.highest_pitch = analysis.edge_pitches
+        self.num_tracks = analysis.num_tracks
+        self.set_layout(self.lowest_pitch, self.highest_pitch, self.num_tracks)
 
-        # draw the three circles
+    def get_background(self, layout):
+        x = layout.center_x
+        y = layout.center_y
+
+        # the three circles
         circle_unit_outer = unit.CircleUnit(x, y, 210, 2, (255, 255, 255))
-        circle_unit_outer.layer = 1
         circle_unit_middle = unit.CircleUnit(x, y, 140, 2, (255, 255, 255))
-        circle_unit_middle.layer = 1
         circle_unit_inner = unit.CircleUnit(x, y, 70, 2, (255, 255, 255))
-        circle_unit_inner.layer = 1
-        self.viz_manager.units.append(circle_unit_outer)
-        self.viz_manager.units.append(circle_unit_middle)
-        self.viz_manager.units.append(circle_unit_inner)
+        background = [circle_unit_outer, circle_unit_middle, circle_unit_inner]
 
+        # chords are placed around the outer circle, which moves with the middle of the screen
         self.circle_origin = circle_unit_outer.x, circle_unit_outer.y
         self.circle_radius = 210
 
-        # draw the 12 lines that separate the circle into 12 quadrants
+        # the 12 lines that separate the circle into 12 quadrants
         for i in range(0, 12):
             x_inner = circle_unit_outer.x + (circle_unit_inner.radius * math.cos(math.radians(-90 + (30 * i) + (0.5 * 30))))
             y_inner = circle_unit_outer.y + (circle_unit_inner.radius * math.sin(math.radians(-90 + (30 * i) + (0.5 * 30))))
@@ -471,40 +526,29 @@ class PresetMultiTrackChordsCircle(BasePreset):
             y_outer = circle_unit_outer.y + (circle_unit_outer.radius * math.sin(math.radians(-90 + (30 * i) + (0.5 * 30))))
 
             line_unit = unit.LineUnit(x_inner, y_inner, x_outer, y_outer, (255, 255, 255), 2)
-            line_unit.layer = 1
-            self.viz_manager.units.append(line_unit)
+            background.append(line_unit)
 
-        self.viz_manager.sort_units()
+        return background
 
     def per_note_on(self, screen, viz_note):
         note = viz_note.note
-        screen_x = self.viz_manager.main_frame.display.size.x
-        screen_y = self.viz_manager.main_frame.display.size.y
-        color = colorhelper.scale_degree_to_color(note, self.viz_manager.key)
-        track_width = screen_x // self.num_tracks
-
-        h = screen_y // (self.highest_pitch - (self.lowest_pitch - 1))
-        rect_note = unit.RectNoteUnit(0, 0, color, note, track_width, h)
+        layout = self.layout
+        color = colorhelper.scale_degree_to_color(viz_note, self.viz_manager.key)
+        # the note fills the row of its pitch across its track's column
+        x = layout.track_left[viz_note.track]
+        y = layout.cropped_y[viz_note.pitch]
+        rect_note = unit.RectNoteUnit(x, y, color, note, layout.track_width, layout.row_height)
         rect_note.id = id(viz_note)
 
-        region_x = track_width * (viz_note.track - 1)
-        y = util.graph_note_y(note, self.highest_pitch, self.lowest_pitch, screen_y, True)
-
-        rect_note = util.create_unit_in_center_of_quadrant(rect_note, (region_x, 0), (region_x + track_width, screen_y))
-        rect_note.y = y
-
         self.viz_manager.units.append(rect_note)
-        self.viz_manager.sort_units()
-        self.notes_played.append(viz_note)
 
         # dissonance stuff
-        dissonance = muse.get_dissonance_of_note(viz_note, self.viz_manager, self.notes_played)
+        dissonance = self.viz_manager.chord_tracker.get_dissonance(viz_note.pitch)
         # print("dissonance: " + str(dissonance))
         rect_note.dissonance = dissonance
 
         # chord stuff
-        recent_notes = muse.get_recent_notes(self.notes_played)
-        chord = muse.get_chord(recent_notes)
+        chord = self.viz_manager.chord_tracker.chord
 
         # quarter-note chords
         # chord = viz_note.chord_in_beat
@@ -515,26 +559,20 @@ class PresetMultiTrackChordsCircle(BasePreset):
         # bar chords
         # chord = viz_note.chord_in_bar
 
-        chord_name = chord.pitchedCommonName
-        s1 = str(chord_name)
-        s2 = ""
-        if isinstance(self.latest_chord, music21.chord.Chord):
-            s2 = str(self.latest_chord.pitchedCommonName)
-        if s1 != s2:
-            print("new chord: " + str(chord_name) + "\t(" + str(chord.quality) + ")")
+        if self.latest_chord is None or chord.id != self.latest_chord.id:
+            print("new chord: " + chord.name + "\t(" + chord.quality + ")")
 
             if self.latest_chord is None:
                 self.latest_chord = chord
 
             self.latest_chord = chord
-            root = self.latest_chord.root()
-            note = music21.note.Note(root)
+            note = muse.get_root_note(self.latest_chord)
             quality = self.latest_chord.quality
 
             color = colorhelper.scale_degree_to_color(note, self.viz_manager.key)
             x, y = muse.get_pos_on_circle_of_fifths(note, self.circle_origin, self.circle_radius, self.viz_manager.key, quality)
 
-            particle_unit = unit.ParticleSpaceUnit(screen, x // 2, y // 2, screen_x, screen_y, color)
+            particle_unit = unit.ParticleSpaceUnit(screen, x // 2, y // 2, layout.width, layout.height, color)
 
             if self.current_chord_unit is not None:
                 self.current_chord_unit.remove_particles()
@@ -563,33 +601,36 @@ class PresetTensionCornell(BasePreset):
     """
 
     """
-    def first_load(self, score):
-        self.key = score.analyze('key')         # uses the Krumhansl-Schmuckler key determination algorithm
-        self.num_tracks = len(score.parts)
-        self.lowest_pitch, self.highest_pitch = util.get_edge_pitches(score)
+    def first_load(self, analysis):
+        self.num_tracks = analysis.num_tracks
+        self.lowest_pitch, self.highest_pitch = analysis.edge_pitches
+        self.analysis = analysis
+        # the tension of the notes is only needed once they play, so it's got in prepare_notes
+        self.tension_table = None
+        self.set_layout(self.lowest_pitch, self.highest_pitch, self.num_tracks)
+
+    def prepare_notes(self, notes):
+        # waits for the tension of every note on the preparer's thread, so the preset loads without it and
+        # nothing is analyzed while playing
+        self.get_tension_table()
+
+    def get_background(self, layout):
+        # track divider lines
+        return self.get_track_dividers(layout)
 
     def per_note_on(self, screen, viz_note):
-        self.notes_played.append(viz_note)
-        tension = muse.get_sequential_tension(viz_note, self.notes_played, self.key)
+        tension = self.get_note_tension(viz_note)
         # print("Tension: {0} from note {1} in track {2}".format(tension, viz_note.note.name, viz_note.track))
         screen.fill((tension, tension, tension))
+        self.viz_manager.main_frame.display.invalidate()
         note = viz_note.note
-        screen_x = self.viz_manager.main_frame.display.size.x
-        screen_y = self.viz_manager.main_frame.display.size.y
-        color = colorhelper.simple_note_to_color_tuple(note)
+        layout = self.layout
+        color = colorhelper.simple_note_to_color_tuple(viz_note)
         r = 15
-        circle_note = unit.CircleNoteUnit(0, 0, color, note, r)
 
-        interval = screen_x // self.num_tracks
-
-        # Add white line down center of the screen
-        for i in range(0, screen_x, interval):
-            line = unit.LineUnit(i, 0, i, screen_y, (255, 255, 255), 1)
-            self.viz_manager.units.append(line)
-
-        x = interval * (viz_note.track - 1)
-        circle_note = util.create_unit_in_center_of_quadrant(circle_note, (0, 0), ((x + interval), screen_y))
-        circle_note.y = util.graph_note_y(note, self.highest_pitch, self.lowest_pitch, screen_y)
+        # the circle goes in the middle of its track's column
+        x = layout.track_center[viz_note.track] - r
+        circle_note = unit.CircleNoteUnit(x, layout.pitch_y[viz_note.pitch], color, note, r)
         self.viz_manager.units.append(circle_note)
 
     def per_note_off(self, screen, message):
@@ -601,42 +642,29 @@ class PresetChordRoot(BasePreset):
     This preset aims to detect chords being played and displays the root note of each chord.
     It also draws a piano roll visualization of the notes, just like normal piano roll.
     """
-    def first_load(self, score):
-        self.lowest_pitch, self.highest_pitch = util.get_edge_pitches(score)
+    def first_load(self, analysis):
+        self.lowest_pitch, self.highest_pitch = analysis.edge_pitches
+        self.set_layout(self.lowest_pitch, self.highest_pitch)
 
     def per_note_on(self, screen, message):
-        self.notes_played.append(message)
-        recent_notes = muse.get_recent_notes(self.notes_played)
-        chord = muse.get_chord(recent_notes)
-        chord_name = chord.pitchedCommonName
+        chord = self.viz_manager.chord_tracker.chord
         # dbg = self.viz_manager.main_frame.debugger.textbox
-        s1 = str(chord_name)
-        s2 = ""
-        if isinstance(self.latest_chord, music21.chord.Chord):
-            s2 = str(self.latest_chord.pitchedCommonName)
-        if s1 != s2:
-            print("new chord: " + str(chord_name))
-            # util.print_line_to_panel(dbg, "new chord: " + str(chord_name) + "\n")
-
-            screen_x = self.viz_manager.main_frame.display.size.x
-            screen_y = self.viz_manager.main_frame.display.size.y
+        if self.latest_chord is None or chord.id != self.latest_chord.id:
+            print("new chord: " + chord.name)
+            # util.print_line_to_panel(dbg, "new chord: " + chord.name + "\n")
 
             if self.latest_chord is None:
                 self.latest_chord = chord
 
-            root = self.latest_chord.root()
-            note = music21.note.Note(root)
+            note = muse.get_root_note(self.latest_chord)
             self.viz_manager.remove_unit(note)
 
             self.latest_chord = chord
-            root = self.latest_chord.root()
-            note = music21.note.Note(root)
+            note = muse.get_root_note(self.latest_chord)
 
             color = colorhelper.simple_note_to_color_tuple(note)
-            rect_note = unit.RectNoteUnit(300, 0, color, note, 200, 60)
-            rect_note.h = 60
-            rect_note = util.create_unit_in_center_of_quadrant(rect_note, (0, 0), (screen_x, screen_y))
-            rect_note.y = util.graph_note_y(note, self.highest_pitch, self.lowest_pitch, screen_y)
+            y = self.layout.pitch_y[note.pitch.midi]
+            rect_note = unit.RectNoteUnit(self.layout.center_x - 100, y, color, note, 200, 60)
 
             self.viz_manager.units.append(rect_note)
 
@@ -658,26 +686,23 @@ class PresetInstrumentGroups(BasePreset):
         Percussion - rhombus
         Other (i.e. sound effects) - circle (not filled)
     """
-    def first_load(self, score):
-        self.lowest_pitch, self.highest_pitch = util.get_edge_pitches(score)
-        self.num_tracks = len(score.parts)
+    def first_load(self, analysis):
+        self.lowest_pitch, self.highest_pitch = analysis.edge_pitches
+        self.num_tracks = analysis.num_tracks
+        self.set_layout(self.lowest_pitch, self.highest_pitch, self.num_tracks)
+
+    def get_background(self, layout):
+        # track divider lines
+        return self.get_track_dividers(layout)
 
     def per_note_on(self, screen, viz_note):
         note = viz_note.note
-        screen_x = self.viz_manager.main_frame.display.size.x
-        screen_y = self.viz_manager.main_frame.display.size.y
-
-        # Add track divider lines
-        col_wid = screen_x // self.num_tracks
-        for i in range(0, screen_x, col_wid):
-            line = unit.LineUnit(i, 0, i, screen_y, (255, 255, 255), 1)
-            self.viz_manager.units.append(line)
+        layout = self.layout
 
-        color = colorhelper.simple_note_to_color_tuple(note)
+        color = colorhelper.simple_note_to_color_tuple(viz_note)
         vn = None
-        y = util.graph_note_y(note, self.highest_pitch, self.lowest_pitch, screen_y)
-        x_interval = col_wid * (viz_note.track - 1)
-        x = (x_interval * 2 + col_wid) // 2
+        y = layout.pitch_y[viz_note.pitch]
+        x = layout.track_center[viz_note.track]
         offset = 0
 
         instr_midi = self.viz_manager.instrument_map[viz_note.track-1]
@@ -718,51 +743,53 @@ class PresetJulien(BasePreset):
     """
 
     """
-    def first_load(self, score):
-        self.key = score.analyze('key')                 # uses the Krumhansl-Schmuckler key determination algorithm
-        self.num_tracks = len(score.parts)
-        self.lowest_pitch, self.highest_pitch = util.get_edge_pitches(score)
-
-        # Add track divider lines
-        screen_x = self.viz_manager.main_frame.display.size.x
-        screen_y = self.viz_manager.main_frame.display.size.y
-        col_wid = screen_x // self.num_tracks
-        for i in range(0, screen_x, col_wid):
-            line = unit.LineUnit(i, 0, i, screen_y, (255, 255, 255), 1)
-            self.viz_manager.units.append(line)
+    def __init__(self, viz_manager, name, desc):
+        super().__init__(viz_manager, name, desc)
+        # the tension rects are on their own layer
+        self.layers = [0, 1]
+
+    def first_load(self, analysis):
+        self.num_tracks = analysis.num_tracks
+        self.lowest_pitch, self.highest_pitch = analysis.edge_pitches
+        self.analysis = analysis
+        # the tension of the notes is only needed once they play, so it's got in prepare_notes
+        self.tension_table = None
+        self.set_layout(self.lowest_pitch, self.highest_pitch, self.num_tracks)
+
+    def prepare_notes(self, notes):
+        # waits for the tension of every note on the preparer's thread, so the preset loads without it and
+        # nothing is analyzed while playing
+        self.get_tension_table()
+
+    def get_background(self, layout):
+        # track divider lines
+        return self.get_track_dividers(layout)
 
     def per_note_on(self, screen, viz_note):
-        self.notes_played.append(viz_note)
         note = viz_note.note
-        screen_x = self.viz_manager.main_frame.display.size.x
-        screen_y = self.viz_manager.main_frame.display.size.y
+        layout = self.layout
 
         # Create red rectangle of tension
-        tension = muse.get_sequential_tension(viz_note, self.notes_played, self.key)
+        tension = self.get_note_tension(viz_note)
         alpha = tension + 40
         if alpha > 215:
             alpha = 215
-        mid_x = screen_x // 3
-        mid_y = screen_y // 3
+        mid_x = layout.width // 3
+        mid_y = layout.height // 3
         color = colorhelper.change_color_brightness((30, 0, 0), tension)
         rect = unit.RectNoteUnit(mid_x, mid_y, color, None, mid_x, mid_y)
 
         # Adds tension rect to background (i.e. everything else is drawn on top)
         rect.layer = 1
         self.viz_manager.units.append(rect)
-        self.viz_manager.sort_units()
-        # self.notes_played.append(viz_note)
-
-        col_wid = screen_x // self.num_tracks
 
         # use note's dissonance to determine color brightness brightness
-        color2 = colorhelper.simple_note_to_color_tuple(note)
-        dissonance = muse.get_dissonance_of_note(viz_note, self.viz_manager, self.notes_played)
+        color2 = colorhelper.simple_note_to_color_tuple(viz_note)
+        dissonance = self.get_note_dissonance(viz_note)
         color3 = colorhelper.change_color_brightness(color2, -dissonance)
 
-        note_y = util.graph_note_y(note, self.highest_pitch, self.lowest_pitch, screen_y)
-        x_interval = col_wid * (viz_note.track - 1)
-        note_x = (x_interval * 2 + col_wid) // 2
+        note_y = layout.pitch_y[viz_note.pitch]
+        note_x = layout.track_center[viz_note.track]
 
         # List of instrument groups and instruments in them
         strings = list(range(25, 52, 1))
@@ -797,28 +824,19 @@ class PresetJulien(BasePreset):
         self.viz_manager.units.append(vn)
 
         # draws rectangles on sides representing the root of the last chord played
-        self.notes_played.append(viz_note)
-        recent_notes = muse.get_recent_notes(self.notes_played)
-        chord = muse.get_chord(recent_notes)
-        chord_name = chord.pitchedCommonName
-        s1 = str(chord_name)
-        s2 = ""
-        if isinstance(self.latest_chord, music21.chord.Chord):
-            s2 = str(self.latest_chord.pitchedCommonName)
-        if s1 != s2:
+        chord = self.viz_manager.chord_tracker.chord
+        if self.latest_chord is None or chord.id != self.latest_chord.id:
             if self.latest_chord is None:
                 self.latest_chord = chord
 
-            root = self.latest_chord.root()
-            note = music21.note.Note(root)
-            self.viz_manager.remove_unit(note, id(note), type(unit.RectChordUnit))
+            note = muse.get_root_note(self.latest_chord)
+            self.viz_manager.remove_unit(note, the_type=unit.RectChordUnit)
 
             self.latest_chord = chord
-            root = self.latest_chord.root()
-            note = music21.note.Note(root)
+            note = muse.get_root_note(self.latest_chord)
 
             color = colorhelper.scale_degree_to_color(note, self.viz_manager.key)
-            rect_chord = unit.RectChordUnit(0, 0, color, note, screen_x, screen_y, 20)
+            rect_chord = unit.RectChordUnit(0, 0, color, note, layout.width, layout.height, 20)
             rect_chord.id = id(note)
 
             self.viz_manager.units.append(rect_chord)
@@ -828,11 +846,11 @@ class PresetParticles(BasePreset):
     """
 
     """
-    def first_load(self, score):
+    def first_draw(self):
+        super().first_draw()
         w, h = self.viz_manager.main_frame.display.size
         particles = unit.ParticleSpaceUnit(self.viz_manager.screen, 0, 0, w, h, (100, 123, 87), self.viz_manager)
         self.viz_manager.units.append(particles)
-        pass
 
     def per_note_on(self, screen, viz_note):
         # h, w = self.viz_manager.main_frame.display.size
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+"""
+This class holds the analysis of the currently loaded song: its key (overall and over time), edge pitches, number
+of tracks, statistics about each track, its beats and bars, the index of its chords and the tension of every
+note.
+
+Every value is computed the first time something asks for it and then kept, so the presets, the song preparer and
+the UI all share a single result. Loading a preset on a song that is already loaded doesn't analyze anything again.
+Values that are already known when the song is loaded (i.e. from the song cache) can be given up front. Values
+being computed in other processes (see AnalysisExecutor) are expected: asking for one waits for it rather than
+computing it again, and they are merged in as they arrive.
+
+The analysis can be used from the loading threads and the main thread at the same time.
+"""
+import threading
+import numpy as np
+import mmv.midi.ChordIndex as ci
+import mmv.midi.KeyTimeline as kt
+import mmv.midi.MeterIndex as mi
+import mmv.midi.NoteTable as nt
+import mmv.midi.SongCache as sc
+import mmv.midi.TensionTable as tt
+import mmv.util.MusicComp as muse
+
+
+class SongAnalysis:
+
+    def __init__(self, table=None, key=None, edge_pitches=None):
+        """
+        :param table:           NoteTable of the song
+        :param key:             key of the song, if already known
+        :param edge_pitches:    lowest and highest pitches of the song, if already known
+        """
+        # the notes the analysis is about
+        self.table = table if table is not None else nt.NoteTable()
+        # every value computed so far, by name
+        self.results = {}
+        # functions that wait for the values being computed somewhere else and return them, by name
+        self.expected = {}
+        self.lock = threading.RLock()
+
+        if key is not None:
+            self.results['key'] = key
+        if edge_pitches is not None:
+            self.results['edge_pitches'] = tuple(edge_pitches)
+        elif self.table.edge_pitches is not None:
+            self.results['edge_pitches'] = tuple(self.table.edge_pitches)
+
+    def get(self, name, compute):
+        """
+        Returns the value with the given name, calling compute to find it the first time. If the value is expected
+        from somewhere else, it is waited for instead, and only computed if that fails.
+        """
+        wait = self.expected.get(name)
+        if wait is not None and name not in self.results:
+            # the lock isn't held while waiting, so the value can be merged in meanwhile
+            try:
+                self.put(name, wait())
+            except Exception:
+                with self.lock:
+                    self.expected.pop(name, None)
+        with self.lock:
+            if name not in self.results:
+                self.results[name] = compute()
+            return self.results[name]
+
+    def put(self, name, value):
+        """
+        Stores a value computed somewhere else (i.e. by the AnalysisExecutor), unless it is already known.
+        """
+        with self.lock:
+            self.results.setdefault(name, value)
+            self.expected.pop(name, None)
+
+    def expect(self, name, wait):
+        """
+        Has the value with the given name be waited for, by calling wait, instead of computed, until it is put.
+        wait returns the value, or raises an exception if it couldn't be found.
+        """
+        with self.lock:
+            if name not in self.results:
+                self.expected[name] = wait
+
+    def is_known(self, name):
+        """
+        Returns true if the value with the given name has already been computed.
+        """
+        return name in self.results
+
+    def is_expected(self, name):
+        """
+        Returns true if the value with the given name has already been computed, or is being computed somewhere
+        else.
+        """
+        return name in self.results or name in self.expected
+
+    @property
+    def key(self):
+        """
+        The key of the song, as a music21.key.Key, or None if the song is empty.
+        """
+        return self.get('key', lambda: muse.analyze_key(self.table))
+
+    @property
+    def edge_pitches(self):
+        """
+        The lowest and highest pitches of the song.
+        """
+        def compute():
+            if len(self.table) == 0:
+                return 255, 0
+            return int(self.table.pitch.min()), int(self.table.pitch.max())
+        return self.get('edge_pitches', compute)
+
+    @property
+    def num_tracks(self):
+        """
+        The number of tracks that contain notes.
+        """
+        return self.table.num_tracks
+
+    @property
+    def track_stats(self):
+        """
+        A list with a dict for each track, holding its number of 'notes', its 'lowest' and 'highest' pitches and
+        its 'instrument'. Tracks are in order, so the stats of track 1 come first.
+        """
+        def compute():
+            count = self.table.num_tracks
+            # tracks are numbered from 1
+            index = self.table.track.astype(np.int64) - 1
+            notes = np.bincount(index, minlength=count)
+            lowest = np.full(count, 255, dtype=np.int64)
+            highest = np.zeros(count, dtype=np.int64)
+            np.minimum.at(lowest, index, self.table.pitch)
+            np.maximum.at(highest, index, self.table.pitch)
+
+            stats = []
+            for i in range(count):
+                instrument = self.table.instruments[i] if i < len(self.table.instruments) else 0
+                stats.append({'notes': int(notes[i]),
+                              'lowest': int(lowest[i]),
+                              'highest': int(highest[i]),
+                              'instrument': instrument})
+            return stats
+        return self.get('track_stats', compute)
+
+    @property
+    def key_timeline(self):
+        """
+        The KeyTimeline of the song, to find the key at any point when the song modulates.
+        """
+        return self.get('key_timeline', lambda: kt.KeyTimeline(self.table))
+
+    @property
+    def meter(self):
+        """
+        The MeterIndex of the song, which finds the notes of any beat, half-bar or bar and the bar at a time.
+        """
+        return self.get('meter', lambda: mi.MeterIndex(self.table))
+
+    @property
+    def chord_index(self):
+        """
+        The ChordIndex of the song, to find the notes a track plays at the same time as a note.
+        """
+        return self.get('chord_index', lambda: ci.ChordIndex(self.table))
+
+    @property
+    def chords(self):
+        """
+        The chords of the beat, half-bar and bar of every note, in the form the SongCache keeps them.
+        """
+        return self.get('chords', lambda: sc.get_table_chords(self.table, self.meter))
+
+    @property
+    def tension(self):
+        """
+        The TensionTable of the song: the tension, dissonance and chord of every note, in table order.
+        """
+        return self.get('tension', lambda: tt.TensionTable(self.table, self.key, self.chord_index,
+                                                           self.key_timeline))
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""
+This class runs slow loading work (parsing a song, preparing a preset) on a worker thread, so the window and the
+pygame display keep running while it happens.
+
+The work is split into named stages that run one after the other. Progress, the final result and any error are
+delivered back on the wx main thread with wx.CallAfter, along with how long each stage took. Starting a new job
+cancels the one that is running: the old job stops at its next stage and its result is thrown away. A job that is
+cancelled or fails hands its data to its cancel callback, so anything its stages started in the background can be
+stopped.
+"""
+import threading
+import time
+import traceback
+import wx
+
+
+class SongLoader:
+
+    def __init__(self, on_progress=None):
+        # called on the main thread with (stage name, stage number, number of stages) before each stage starts
+        self.on_progress = on_progress
+        # cancel event of the job that is currently running
+        self.cancel_event = None
+        self.thread = None
+        # true from when a job starts until its result (or error) has been delivered
+        self.running = False
+
+    def is_running(self):
+        """
+        Returns true if a job is currently running.
+        """
+        return self.running
+
+    def start(self, stages, data, on_done, on_error=None, on_cancel=None):
+        """
+        Starts running the stages on a worker thread, cancelling any job that is already running.
+
+        :param stages:      list of (name, function) tuples. each function takes the data dict and stores its
+                            results in it
+        :param data:        dict passed to every stage
+        :param on_done:     called on the main thread with (data, timings) once every stage is done, where timings
+                            is a list of (stage name, seconds) tuples
+        :param on_error:    called on the main thread with (stage name, exception, traceback string) if a stage fails
+        :param on_cancel:   called with the data dict if the job is cancelled or a stage fails, on whichever thread
+                            finds out
+        """
+        self.cancel()
+        cancel_event = threading.Event()
+        self.cancel_event = cancel_event
+        self.running = True
+        self.thread = threading.Thread(target=self.run, args=(stages, data, on_done, on_error, on_cancel,
+                                                                  cancel_event))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def cancel(self):
+        """
+        Cancels the running job, if any. The job stops at the start of its next stage.
+        """
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+        self.running = False
+
+    def run(self, stages, data, on_done, on_error, on_cancel, cancel_event):
+        """
+        Runs every stage on the worker thread.
+        """
+        timings = []
+        for i, (name, stage) in enumerate(stages):
+            if cancel_event.is_set():
+                if on_cancel is not None:
+                    on_cancel(data)
+                return
+            if self.on_progress is not None:
+                wx.CallAfter(self.deliver, cancel_event, False, self.on_progress, name, i + 1, len(stages))
+
+            start = time.perf_counter()
+            try:
+                stage(data)
+            except Exception as e:
+                if on_cancel is not None:
+                    on_cancel(data)
+                if on_error is not None:
+                    wx.CallAfter(self.deliver, cancel_event, True, on_error, name, e, traceback.format_exc())
+                else:
+                    wx.CallAfter(self.deliver, cancel_event, True, None)
+                return
+            timings.append((name, time.perf_counter() - start))
+
+        wx.CallAfter(self.finish, cancel_event, on_done, on_cancel, data, timings)
+
+    def finish(self, cancel_event, on_done, on_cancel, data, timings):
+        """
+        Delivers the result of a job on the main thread, or hands its data to on_cancel if it was cancelled in the
+        meantime.
+        """
+        if cancel_event.is_set():
+            if on_cancel is not None:
+                on_cancel(data)
+            return
+        self.deliver(cancel_event, True, on_done, data, timings)
+
+    def deliver(self, cancel_event, finished, callback, *args):
+        """
+        Calls the callback on the main thread, unless its job was cancelled in the meantime.
+        """
+        if cancel_event.is_set():
+            return
+        if finished:
+            self.running = False
+        if callback is not None:
+            callback(*args)
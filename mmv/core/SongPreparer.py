@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+"""
+This class prepares a song in the background while it is already playing.
+
+A song can be played as soon as its notes and timeline exist. Everything else (the chords of the notes, the key of
+the song and its key timeline, and whatever the preset precomputes from the notes) is prepared a few bars at a time
+on a worker thread, always starting with the bars at the playhead. The bars of the first lookahead window are
+prepared before the song is handed over, so playback never starts on unprepared notes.
+
+If the playhead catches up anyway, nothing waits for the preparation: notes are played without their chords, the
+presets use their default colors until the key is known, and the preparer jumps to the playhead. The bars it
+skipped are prepared once it reaches the end of the song.
+"""
+import threading
+import time
+import traceback
+import numpy as np
+import wx
+import mmv.midi.SongCache as sc
+import mmv.util.Utilities as util
+
+# number of bars in each chunk a song is prepared in. chunks are whole bars, so the chords of a bar are never split
+# between two chunks
+BARS_PER_CHUNK = 4
+
+# how far the preparation is ahead of the playhead when the song starts, in ms
+LOOKAHEAD = 5000
+
+
+class SongPreparer:
+
+    def __init__(self, song=None, cache=None, lookahead=LOOKAHEAD):
+        """
+        :param song:        dict of the song, as filled by the loading stages of the VizManager. must hold the
+                            'parser', 'analysis', 'notes', 'timeline', 'cache_key' and 'cached' entries
+        :param cache:       SongCache to save the song to once it is fully prepared, if it wasn't cached
+        :param lookahead:   how far ahead of the playhead to prepare before the song starts, in ms
+        """
+        self.song = song
+        self.cache = cache
+        self.lookahead = lookahead
+        # the notes of the song, sorted by offset
+        self.notes = []
+        # index of the first note of each chunk, followed by the number of notes
+        self.bounds = [0]
+        # time each chunk starts at, in ms
+        self.start_times = np.zeros(0)
+        # whether the chords of each chunk are done
+        self.chords_done = []
+        # whether the current preset has prepared each chunk
+        self.preset_done = []
+        # the preset that prepares the notes ahead of the playhead, if any
+        self.preset = None
+        # the key of the song, or None until it is found
+        self.key = None
+        # the KeyTimeline of the song, or None until it is found
+        self.key_timeline = None
+        self.key_done = False
+        # chords created so far, shared by every chunk of the song
+        self.built_chords = {}
+        # number of chunks the playhead reached before their chords were done
+        self.chunks_behind = 0
+        # position of the playhead, in ms. kept up to date by the main thread
+        self.playhead = 0.
+        # called on the main thread with the key and the key timeline once they are found
+        self.on_key_found = None
+        # called on the main thread with (seconds spent preparing, chunks behind) once every chunk is done
+        self.on_finished = None
+        # called on the main thread with a message and its details when something fails in the background
+        self.on_error = None
+
+        self.lock = threading.Lock()
+        # set whenever there is new work to do
+        self.wake_event = threading.Event()
+        self.cancel_event = threading.Event()
+        self.thread = None
+        # seconds spent preparing the song so far
+        self.busy_time = 0.
+        self.finished = False
+        # whether the song was saved to the cache
+        self.saved = False
+
+        if song is not None:
+            self.split(song)
+
+    def split(self, song):
+        """
+        Splits the notes of the song into chunks of BARS_PER_CHUNK bars.
+        """
+        self.notes = song['notes']
+        count = len(self.notes)
+        if count:
+            meter = song['analysis'].meter
+            self.bounds = meter.first_notes['bar'][::BARS_PER_CHUNK].tolist()
+            if self.bounds[-1] != count:
+                self.bounds.append(count)
+            self.start_times = meter.times['bar'][::BARS_PER_CHUNK][:len(self.bounds) - 1]
+        store = song.get('store')
+        num_chunks = len(self.bounds) - 1
+        self.chords_done = [False] * num_chunks
+        self.preset_done = [False] * num_chunks
+
+        # a cached song already knows its key, but its key timeline is still found in the background
+        if song['analysis'].is_known('key'):
+            self.key = song['analysis'].key
+        if song['analysis'].is_known('key_timeline'):
+            self.key_timeline = song['analysis'].key_timeline
+            self.key_done = True
+
+        # chords aren't transcribed for songs in a note store, and the store already is their cache
+        if store is not None:
+            self.chords_done = [True] * num_chunks
+            self.saved = True
+
+    def __len__(self):
+        return len(self.bounds) - 1
+
+    def prepare_until(self, time):
+        """
+        Prepares every chunk that starts before the given time (in ms), on the calling thread. The song is waiting
+        for these few bars to start, so their chords are transcribed here unless the chords of the whole song are
+        already back from the worker processes.
+        """
+        for i in range(len(self)):
+            if self.start_times[i] >= time:
+                break
+            self.prepare_chunk(i, wait=False)
+
+    def start(self):
+        """
+        Starts preparing the rest of the song on a worker thread.
+        """
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def cancel(self):
+        """
+        Stops the worker thread after the chunk it is preparing.
+        """
+        self.cancel_event.set()
+        self.wake_event.set()
+
+    def set_preset(self, preset):
+        """
+        Sets the preset that prepares the notes, and has it prepare every chunk again starting at the playhead.
+        """
+        with self.lock:
+            self.preset = preset
+            self.preset_done = [False] * len(self)
+            self.finished = False
+        self.wake_event.set()
+
+    def get_chunk(self, time):
+        """
+        Returns the index of the chunk playing at the given time (in ms).
+        """
+        return max(int(np.searchsorted(self.start_times, time, side='right')) - 1, 0)
+
+    def next_chunk(self):
+        """
+        Returns the index of the next chunk to prepare, or None if every chunk is done. Chunks at and after the
+        playhead come first, then the ones that were skipped.
+        """
+        with self.lock:
+            current = self.get_chunk(self.playhead)
+            order = list(range(current, len(self))) + list(range(0, current))
+            for i in order:
+                if not self.chords_done[i] or (self.preset is not None and not self.preset_done[i]):
+                    return i
+        return None
+
+    def prepare_chunk(self, i, wait=True):
+        """
+        Transcribes the chords of a chunk and has the preset prepare its notes. If wait is false, chords still being
+        found in a worker process are transcribed instead of waited for.
+        """
+        first, last = self.bounds[i], self.bounds[i + 1]
+        if not self.chords_done[i]:
+            if self.start_times[i] < self.playhead:
+                self.chunks_behind += 1
+            cached = self.song['cached']
+            if cached is not None:
+                sc.apply_chords(self.notes, cached['chords'], first, last, self.built_chords)
+            elif self.song['analysis'].is_known('chords') or (wait and self.song['analysis'].is_expected('chords')):
+                # the chords are found in a worker process
+                sc.apply_chords(self.notes, self.song['analysis'].chords, first, last, self.built_chords)
+            else:
+                util.transcribe_chords(self.notes, first, last, self.built_chords, self.song['analysis'].meter)
+            with self.lock:
+                self.chords_done[i] = True
+
+        preset = self.preset
+        if preset is not None and not self.preset_done[i]:
+            preset.prepare_notes(self.notes[first:last])
+            with self.lock:
+                # the preset might have changed while it was preparing
+                if preset is self.preset:
+                    self.preset_done[i] = True
+
+    def is_key_ready(self):
+        """
+        Returns true if the key of the song and its key timeline can be found without waiting for a worker process.
+        """
+        analysis = self.song['analysis']
+        return all(analysis.is_known(name) or not analysis.is_expected(name) for name in ('key', 'key_timeline'))
+
+    def find_key(self):
+        """
+        Analyzes the key of the song, and how it changes over time.
+        """
+        self.key = self.song['analysis'].key
+        self.key_timeline = self.song['analysis'].key_timeline
+        self.key_done = True
+
+    def run(self):
+        """
+        Runs the worker thread. If preparing the song fails, the error is reported and the rest of the song is
+        played without being prepared.
+        """
+        try:
+            self.prepare()
+        except Exception:
+            wx.CallAfter(self.deliver, self.on_error, "Preparing the song failed", traceback.format_exc())
+
+    def prepare(self):
+        """
+        Prepares chunks until the song is fully prepared, then waits for more work.
+        """
+        while not self.cancel_event.is_set():
+            i = self.next_chunk()
+            if i is None and self.key_done:
+                if not self.finished:
+                    self.finish()
+                self.wake_event.wait()
+                self.wake_event.clear()
+                continue
+
+            start = time.perf_counter()
+            if i is not None:
+                self.prepare_chunk(i)
+            # the key is found between chunks, so the chunk at the playhead is never kept waiting. while it is still
+            # being found in a worker process, chunks are prepared without it until there are none left
+            if not self.key_done and (i is None or self.is_key_ready()):
+                self.find_key()
+                wx.CallAfter(self.deliver, self.on_key_found, self.key, self.key_timeline)
+            self.busy_time += time.perf_counter() - start
+
+    def finish(self):
+        """
+        Saves the song to the cache the first time it is fully prepared, and reports how the preparation went.
+        """
+        self.finished = True
+        song = self.song
+        if song['cached'] is None and self.cache is not None and not self.saved:
+            self.saved = True
+            error = self.cache.save(song['cache_key'], song['parser'].table, self.notes, self.key,
+                                    song['analysis'].edge_pitches)
+            if error is not None:
+                wx.CallAfter(self.deliver, self.on_error, "Couldn't save the song to the cache", str(error))
+        wx.CallAfter(self.deliver, self.on_finished, self.busy_time, self.chunks_behind)
+
+    def deliver(self, callback, *args):
+        """
+        Calls the callback on the main thread, unless the preparer was cancelled in the meantime.
+        """
+        if self.cancel_event.is_set() or callback is None:
+            return
+        callback(*args)
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+"""
+This class is a precompiled timeline of every note in the currently loaded song.
+
+It is built once when a song is loaded. Each note is stored with the absolute time (in ms from the start of the
+song) it should be turned on and off, with any quantization errors already folded in. The events are sorted by
+their start time and never change afterwards, so playback only has to move a cursor forward through them.
+
+A timeline can also be built on a NoteStore. Its notes are already sorted, so nothing is compiled: the cursor is
+moved with the store's block index and the times of a note are only computed when it is played.
+"""
+import numpy as np
+import mmv.midi.NoteStore as nstore
+
+
+class Timeline:
+
+    def __init__(self, notes=None, tempo_map=None):
+        # the notes of the song, sorted by the time they start playing
+        self.notes = ()
+        # the time each note is turned on, in ms from the start of the song
+        self.on_times = np.zeros(0)
+        # the time each note is turned off, in ms from the start of the song
+        self.off_times = np.zeros(0)
+        # index of the next note to be played
+        self.cursor = 0
+        # time the last note of the song is turned off, in ms
+        self.length = 0.
+        # the NoteStore the notes are read from, if the timeline is built on one
+        self.store = None
+        self.tempo_map = tempo_map
+
+        if isinstance(notes, nstore.NoteStore) and tempo_map is not None:
+            self.build_from_store(notes, tempo_map)
+        elif notes and tempo_map is not None:
+            self.build(notes, tempo_map)
+
+    def __len__(self):
+        return len(self.notes)
+
+    def build(self, notes, tempo_map):
+        """
+        Compiles the timeline from a list of VizNotes and the TempoMap of the song.
+        """
+        offsets = np.array([float(n.offset + n.offset_error) for n in notes])
+        lengths = np.array([float(n.quarter_length + n.length_error) for n in notes])
+        on_times = tempo_map.offsets_to_ms(offsets)
+        off_times = tempo_map.offsets_to_ms(offsets + lengths)
+
+        # a stable sort keeps notes with the same start time in their original order
+        order = np.argsort(on_times, kind='stable')
+        self.on_times = on_times[order]
+        self.off_times = off_times[order]
+        self.on_times.flags.writeable = False
+        self.off_times.flags.writeable = False
+        self.notes = tuple(notes[i] for i in order.tolist())
+        self.length = float(self.off_times.max()) if len(self.off_times) else 0.
+        self.reset()
+
+    def build_from_store(self, store, tempo_map):
+        """
+        Uses the notes of a NoteStore, without reading them.
+        """
+        self.store = store
+        self.notes = store
+        self.tempo_map = tempo_map
+        self.length = tempo_map.ticks_to_ms(store.end_tick)
+        self.reset()
+
+    def get_on_time(self, i):
+        """
+        Returns the time the note at the given index is turned on, in ms.
+        """
+        if self.store is not None:
+            return self.tempo_map.ticks_to_ms(int(self.store.records['start'][i]))
+        return float(self.on_times[i])
+
+    def get_off_time(self, i):
+        """
+        Returns the time the note at the given index is turned off, in ms.
+        """
+        if self.store is not None:
+            record = self.store.records[i]
+            return self.tempo_map.ticks_to_ms(int(record['start']) + int(record['duration']))
+        return float(self.off_times[i])
+
+    def reset(self):
+        """
+        Moves the cursor back to the start of the song.
+        """
+        self.cursor = 0
+
+    def advance(self, time):
+        """
+        Moves the cursor up to the given time (in ms from the start of the song) and returns the indices of every
+        note that starts between the old and new cursor position.
+        """
+        start = self.cursor
+        if self.store is not None:
+            end = max(self.store.find(int(self.tempo_map.ms_to_ticks(time))), start)
+        else:
+            end = max(int(np.searchsorted(self.on_times, time, side='right')), start)
+        self.cursor = end
+        return range(start, end)
+
+    def is_finished(self):
+        """
+        Returns true if every note in the timeline has been played.
+        """
+        return self.cursor >= len(self.notes)
+
+    @property
+    def position(self):
+        """
+        Start time of the last note played, in ms.
+        """
+        if self.cursor == 0:
+            return 0.
+        return self.get_on_time(self.cursor - 1)
+
+    @property
+    def progress(self):
+        """
+        Fraction of the notes in the song that have been played, from 0 to 1.
+        """
+        if not len(self.notes):
+            return 0.
+        return self.cursor / len(self.notes)
@@ -12,6 +12,8 @@ import pygame
 from math import sqrt
 import pyignition.PyIgnition as ignition
 import pyignition.particles as particles
+import mmv.util.Palette as pal
+import mmv.core.NoteUnitStore as nus
 
 
 class BaseUnit:
@@ -23,6 +25,8 @@ class BaseUnit:
         self.should_delete = False
         self.id = None
         self.layer = 0
+        # handle of the unit in the viz manager's registry, or None if it isn't in it
+        self.handle = None
 
     def Move(self, x, y):
         """
@@ -43,6 +47,20 @@ class BaseUnit:
         """
         pass
 
+    def get_rects(self):
+        """
+        Returns a list of the rects the object draws in, or None if it can't tell. The display redraws the whole
+        screen every frame while an object that can't tell is on it.
+        """
+        return None
+
+    def get_look(self):
+        """
+        Returns everything besides its rects that changes how the object is drawn. The display only redraws an
+        object when its rects or its look changed since the last frame.
+        """
+        return self.color
+
 
 class LineUnit(BaseUnit):
     """
@@ -60,6 +78,12 @@ class LineUnit(BaseUnit):
         """
         pygame.draw.line(screen, self.color, (self.x, self.y), (self.end_x, self.end_y), self.width)
 
+    def get_rects(self):
+        left = min(self.x, self.end_x) - self.width - 1
+        top = min(self.y, self.end_y) - self.width - 1
+        return [pygame.Rect(left, top, abs(self.end_x - self.x) + self.width * 2 + 3,
+                            abs(self.end_y - self.y) + self.width * 2 + 3)]
+
 
 class CircleUnit(BaseUnit):
     """
@@ -73,6 +97,9 @@ class CircleUnit(BaseUnit):
     def draw(self, screen):
         pygame.draw.circle(screen, self.color, (self.x, self.y), self.radius, self.width)
 
+    def get_rects(self):
+        return [get_circle_rect(self.x, self.y, self.radius)]
+
 
 class ParticleSpaceUnit(BaseUnit):
     """
@@ -124,6 +151,10 @@ class ParticleSpaceUnit(BaseUnit):
     def remove_particles(self):
         self.death = True
 
+    def get_rects(self):
+        # particles can go anywhere, and move every frame
+        return None
+
     def get_color(self, r, g, b, a):
         """ converts rgba values of 0 - 255 to the equivalent in 0 - 1"""
         return (r / 255.0, g / 255.0, b / 255.0, a / 255.0)
@@ -134,6 +165,19 @@ class NoteUnit(BaseUnit):
     This object represents a note in some shape or form.
     Has the ability to fade over time.
     """
+    # the store the fields of the note live in and its row there, while the viz manager keeps it in one
+    store = None
+    row = -1
+
+    x = nus.StoredField()
+    y = nus.StoredField()
+    color = nus.StoredField()
+    should_delete = nus.StoredField()
+    dissonance = nus.StoredField()
+    fade = nus.StoredField()
+    fade_speed = nus.StoredField()
+    delete_after_fade = nus.StoredField()
+
     def __init__(self, x=0, y=0, color=None, note=None, fade=False, fade_speed=5, delete_after_fade=False, dissonance=0):
         super().__init__(x, y, color)
         self.note = note
@@ -144,16 +188,7 @@ class NoteUnit(BaseUnit):
 
     def update(self):
         if self.fade:
-            r = self.color[0] - int(self.fade_speed)
-            g = self.color[1] - int(self.fade_speed)
-            b = self.color[2] - int(self.fade_speed)
-            if r < 0:
-                r = 0
-            if g < 0:
-                g = 0
-            if b < 0:
-                b = 0
-            self.color = (r, g, b)
+            self.color = pal.brighten(self.color, -self.fade_speed)
 
         if self.delete_after_fade:
             if self.color[0] + self.color[1] + self.color[2] == 0:
@@ -164,18 +199,34 @@ class NoteUnit(BaseUnit):
         self.fade = toggle
         self.delete_after_fade = delete_after
 
+    def get_look(self):
+        return self.color, self.dissonance
+
 
 class CircleNoteUnit(NoteUnit):
     """
     This object represents a single note as a circle on the screen.
     """
+    radius = nus.StoredField()
+
     def __init__(self, x, y, color, note, radius=0, fade=False, fade_speed=5, delete_after_fade=False):
         super().__init__(x, y, color, note, fade, fade_speed, delete_after_fade)
         self.radius = radius
 
     def draw(self, screen):
+        store = self.store
+        if store is not None:
+            if store.ready is not screen:
+                store.prepare(screen)
+            row = self.row
+            pygame.draw.circle(screen, store.draw_colors[row], (store.draw_x[row], store.draw_y[row]),
+                               store.draw_radii[row], 0)
+            return
         pygame.draw.circle(screen, self.color, (self.x, self.y), self.radius, 0)
 
+    def get_rects(self):
+        return [get_circle_rect(self.x, self.y, self.radius)]
+
     def update(self):
         pass
 
@@ -184,25 +235,30 @@ class RectNoteUnit(NoteUnit):
     """
     This object represents a single note as a rectangle on the screen.
     """
+    w = nus.StoredField()
+    h = nus.StoredField()
+
     def __init__(self, x, y, color, note, width=0, height=0, fade=False, fade_speed=5, delete_after_fade=False):
         super().__init__(x, y, color, note, fade, fade_speed, delete_after_fade)
         self.w = width
         self.h = height
 
     def draw(self, screen):
-        r, g, b = self.color
-        r -= self.dissonance * 10
-        g -= self.dissonance * 10
-        g -= self.dissonance * 10
-        if r < 0:
-            r = 0
-        if g < 0:
-            g = 0
-        if b < 0:
-            b = 0
-        new_color = (r, g, b)
+        store = self.store
+        if store is not None:
+            # the store already darkened the color by the dissonance
+            if store.ready is not screen:
+                store.prepare(screen)
+            row = self.row
+            pygame.draw.rect(screen, store.draw_colors[row],
+                             (store.draw_x[row], store.draw_y[row], store.draw_w[row], store.draw_h[row]))
+            return
+        new_color = pal.brighten(self.color, -self.dissonance * 10)
         pygame.draw.rect(screen, new_color, pygame.Rect(self.x, self.y, self.w, self.h))
 
+    def get_rects(self):
+        return [pygame.Rect(self.x, self.y, self.w, self.h)]
+
 
 class AlphaRectNoteUnit(RectNoteUnit):
     """
@@ -215,25 +271,23 @@ class AlphaRectNoteUnit(RectNoteUnit):
         self.alpha = alpha
 
     def draw(self, screen):
-        r, g, b = self.color
-        r -= self.dissonance * 10
-        g -= self.dissonance * 10
-        g -= self.dissonance * 10
-        if r < 0:
-            r = 0
-        if g < 0:
-            g = 0
-        if b < 0:
-            b = 0
+        r, g, b = pal.brighten(self.color, -self.dissonance * 10)
         s = pygame.Surface((self.w, self.h), pygame.SRCALPHA | pygame.HWSURFACE)
         s.fill((r, g, b, self.alpha))
         screen.blit(s, (self.x, self.y))
 
+    def get_look(self):
+        return self.color, self.dissonance, self.alpha
+
 
 class EllipseNoteUnit(NoteUnit):
     """
     This object represents a single note as an ellipse (stretched out circle) on a screen.
     """
+    w = nus.StoredField()
+    h = nus.StoredField()
+    line_width = nus.StoredField()
+
     def __init__(self, x, y, color, note, width=0, height=0, line_width=0, fade=False, fade_speed=5, delete_after_fade=False):
         super().__init__(x, y, color, note, fade, fade_speed, delete_after_fade)
         self.w = width
@@ -241,8 +295,20 @@ class EllipseNoteUnit(NoteUnit):
         self.line_width = line_width
 
     def draw(self, screen):
+        store = self.store
+        if store is not None:
+            if store.ready is not screen:
+                store.prepare(screen)
+            row = self.row
+            pygame.draw.ellipse(screen, store.draw_colors[row],
+                                (store.draw_x[row], store.draw_y[row], store.draw_w[row], store.draw_h[row]),
+                                store.draw_line_widths[row])
+            return
         pygame.draw.ellipse(screen, self.color, pygame.Rect(self.x, self.y, self.w, self.h), self.line_width)
 
+    def get_rects(self):
+        return [pygame.Rect(self.x, self.y, self.w, self.h)]
+
 
 class DiamondNoteUnit(NoteUnit):
     """
@@ -260,6 +326,10 @@ class DiamondNoteUnit(NoteUnit):
                   (self.x - self.radius, self.y)]
         pygame.draw.polygon(screen, self.color, points, self.thickness)
 
+    def get_rects(self):
+        return [pygame.Rect(self.x - self.radius - 1, self.y - self.radius - 2, self.radius * 2 + 3,
+                            self.radius * 2 + 5)]
+
 
 class TriangleNoteUnit(NoteUnit):
     """
@@ -276,6 +346,10 @@ class TriangleNoteUnit(NoteUnit):
                   (self.x - int(self.side_length // 2), self.y - int((sqrt(3)/6) * self.side_length))]
         pygame.draw.polygon(screen, self.color, points, self.thickness)
 
+    def get_rects(self):
+        # the triangle fits in the circle around its center
+        return [get_circle_rect(self.x, self.y, int(self.side_length) + 1)]
+
 
 class RectChordUnit(NoteUnit):
     """
@@ -290,3 +364,14 @@ class RectChordUnit(NoteUnit):
     def draw(self, screen):
         pygame.draw.rect(screen, self.color, pygame.Rect(self.x, self.y, self.sw, self.h))
         pygame.draw.rect(screen, self.color, pygame.Rect((self.x + self.w) - self.sw, self.y, self.sw, self.h))
+
+    def get_rects(self):
+        return [pygame.Rect(self.x, self.y, self.sw, self.h),
+                pygame.Rect((self.x + self.w) - self.sw, self.y, self.sw, self.h)]
+
+
+def get_circle_rect(x, y, radius):
+    """
+    Returns a rect that holds a circle, with a pixel to spare on each side.
+    """
+    return pygame.Rect(x - radius - 1, y - radius - 1, radius * 2 + 3, radius * 2 + 3)
@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+"""
+This class holds the units of the visualization, in the order they are drawn.
+
+It can be used like the list it replaces (append, iterate, remove, clear), but it also indexes every unit by its
+note, its id and its type when it's added, so the viz manager finds the units of a note that ended without looking
+at every unit on the screen. Every unit gets a handle that stays the same for as long as it's registered.
+
+Units are kept in one bucket per layer, and lower layers are drawn first. A unit is appended to the bucket of its
+layer when it's added, so units never have to be sorted by layer: within a layer, they are drawn in the order they
+were added.
+
+Rect, circle and ellipse note units have their fields kept in a NoteUnitStore, so update fades them all at once;
+every other unit is updated on its own.
+
+Removing a unit only empties its slot, so units can be removed while the registry is being iterated over, and
+nothing is shifted. The empty slots are dropped all at once by compact, which the display calls at the end of every
+frame.
+"""
+import bisect
+import mmv.core.Unit as Unit
+import mmv.core.NoteUnitStore as nus
+
+# shape in the store of the types of units kept there. only these exact types are, since subclasses may draw
+# themselves differently
+STORED_SHAPES = {Unit.RectNoteUnit: nus.RECT,
+                 Unit.CircleNoteUnit: nus.CIRCLE,
+                 Unit.EllipseNoteUnit: nus.ELLIPSE}
+
+
+def get_note_key(note):
+    """
+    Returns what units are indexed by for the given note: its midi pitch, or None if it has none. Notes that are
+    equal always have the same key.
+    """
+    if note is None:
+        return None
+    pitch = getattr(note, 'pitch', None)
+    # music21 notes have a Pitch, VizNotes and NoteViews have the midi pitch itself
+    return getattr(pitch, 'midi', pitch)
+
+
+class UnitRegistry:
+
+    def __init__(self):
+        # the units of every layer in drawing order, with None in the slots of removed units until the next
+        # compaction, by layer
+        self.layers = {}
+        # the layers that have a bucket, from the first drawn to the last
+        self.layer_order = []
+        # layer and slot of every registered unit, by handle
+        self.positions = {}
+        # number of empty slots, by layer
+        self.removed = {}
+        # the handle given to the next unit added
+        self.next_handle = 0
+        # the fields of the rect, circle and ellipse note units, and every other unit by handle
+        self.store = nus.NoteUnitStore()
+        self.objects = {}
+        # the registered units by note key (only units that have a note), by id and by type. each value maps
+        # handles to units, in the order they were added
+        self.by_note = {}
+        self.by_id = {}
+        self.by_type = {}
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __iter__(self):
+        """
+        Iterates over the units in drawing order. Units removed along the way are skipped, and units added along the
+        way are included if their layer hasn't been passed yet.
+        """
+        for layer in list(self.layer_order):
+            slots = self.layers[layer]
+            i = 0
+            while i < len(slots):
+                unit = slots[i]
+                if unit is not None:
+                    yield unit
+                i += 1
+
+    def __contains__(self, unit):
+        return getattr(unit, 'handle', None) in self.positions
+
+    def add_layers(self, layers):
+        """
+        Makes buckets for the given layers up front, so adding the first unit of a layer doesn't have to.
+        """
+        for layer in layers:
+            self.get_bucket(layer)
+
+    def get_bucket(self, layer):
+        """
+        Returns the slots of a layer, making its bucket if it doesn't have one yet.
+        """
+        slots = self.layers.get(layer)
+        if slots is None:
+            slots = self.layers[layer] = []
+            self.removed[layer] = 0
+            bisect.insort(self.layer_order, layer)
+        return slots
+
+    def append(self, unit):
+        """
+        Adds a unit on top of every other unit of its layer. Returns its handle. Its note, id and layer must be set
+        beforehand, since they're indexed now.
+        """
+        handle = self.next_handle
+        self.next_handle += 1
+        unit.handle = handle
+        layer = unit.layer
+        slots = self.layers.get(layer)
+        if slots is None:
+            slots = self.get_bucket(layer)
+        self.positions[handle] = (layer, len(slots))
+        slots.append(unit)
+        shape = STORED_SHAPES.get(type(unit))
+        if shape is not None and unit.color is not None:
+            self.store.add(unit, shape)
+        else:
+            self.objects[handle] = unit
+        if hasattr(unit, 'note'):
+            add_to_index(self.by_note, get_note_key(unit.note), handle, unit)
+        add_to_index(self.by_id, unit.id, handle, unit)
+        add_to_index(self.by_type, type(unit), handle, unit)
+        return handle
+
+    def get(self, handle):
+        """
+        Returns the unit with the given handle, or None if it was removed.
+        """
+        position = self.positions.get(handle)
+        return None if position is None else self.layers[position[0]][position[1]]
+
+    def remove(self, unit):
+        """
+        Removes a unit. Raises ValueError if it isn't registered.
+        """
+        handle = getattr(unit, 'handle', None)
+        position = self.positions.get(handle)
+        if position is None or self.layers[position[0]][position[1]] is not unit:
+            raise ValueError("unit is not registered")
+        del self.positions[handle]
+        layer, slot = position
+        self.layers[layer][slot] = None
+        self.removed[layer] += 1
+        if self.objects.pop(handle, None) is None:
+            self.store.remove(unit)
+        if hasattr(unit, 'note'):
+            remove_from_index(self.by_note, get_note_key(unit.note), handle)
+        remove_from_index(self.by_id, unit.id, handle)
+        remove_from_index(self.by_type, type(unit), handle)
+        unit.handle = None
+
+    def get_by_note(self, note):
+        """
+        Returns a list of the units of notes equal to the given one, in the order they were added.
+        """
+        units = self.by_note.get(get_note_key(note))
+        if not units:
+            return []
+        return [unit for unit in units.values() if unit.note == note]
+
+    def get_by_id(self, id):
+        """
+        Returns a list of the units with the given id.
+        """
+        return list(self.by_id.get(id, {}).values())
+
+    def get_by_type(self, the_type):
+        """
+        Returns a list of the units of exactly the given type.
+        """
+        return list(self.by_type.get(the_type, {}).values())
+
+    def update(self):
+        """
+        Updates every unit, and removes the ones that were flagged to be deleted.
+        """
+        for unit in self.store.update():
+            self.remove(unit)
+        for unit in list(self.objects.values()):
+            if unit.should_delete is True:
+                self.remove(unit)
+            else:
+                unit.update()
+
+    def compact(self):
+        """
+        Drops the slots of removed units, keeping the others in order. Only the layers that had units removed are
+        touched.
+        """
+        for layer, removed in self.removed.items():
+            if removed:
+                self.set_order(layer, [unit for unit in self.layers[layer] if unit is not None])
+        self.store.compact()
+
+    def update_layers(self):
+        """
+        Moves the units whose layer changed since they were added to the top of their new layer.
+        """
+        moved = [unit for layer in self.layer_order for unit in self.layers[layer]
+                 if unit is not None and unit.layer != layer]
+        for unit in moved:
+            self.remove(unit)
+        self.compact()
+        for unit in moved:
+            self.append(unit)
+
+    def set_order(self, layer, units):
+        """
+        Replaces the slots of a layer with the given units of that layer, in the given order.
+        """
+        self.layers[layer] = units
+        self.removed[layer] = 0
+        positions = self.positions
+        for i, unit in enumerate(units):
+            positions[unit.handle] = (layer, i)
+
+    def clear(self):
+        """
+        Removes every unit.
+        """
+        for unit in self:
+            unit.handle = None
+        self.store.clear()
+        self.objects.clear()
+        # the buckets stay, since the layers are usually the same for the next units
+        for layer in self.layer_order:
+            self.layers[layer] = []
+            self.removed[layer] = 0
+        self.positions.clear()
+        self.by_note.clear()
+        self.by_id.clear()
+        self.by_type.clear()
+
+
+def add_to_index(index, key, handle, unit):
+    """
+    Adds a unit under the given key of an index.
+    """
+    units = index.get(key)
+    if units is None:
+        index[key] = units = {}
+    units[handle] = unit
+
+
+def remove_from_index(index, key, handle):
+    """
+    Removes a unit from under the given key of an index, and the key itself once it has no units left.
+    """
+    units = index.get(key)
+    if units is not None:
+        units.pop(handle, None)
+        if not units:
+            del index[key]
@@ -11,6 +11,19 @@ import util.Utilities as util
 import mmv.midi.Player as play
 import mmv.core.Preset as pr
 import mmv.midi.MidiParser as mp
+import mmv.core.Timeline as tl
+import mmv.core.NoteScheduler as ns
+import mmv.midi.SongCache as sc
+import mmv.midi.NoteStore as nstore
+import mmv.midi.KeyTimeline as kt
+import mmv.midi.MeterIndex as mi
+import mmv.core.SongLoader as sl
+import mmv.core.SongPreparer as sp
+import mmv.core.SongAnalysis as sa
+import mmv.core.AnalysisExecutor as ae
+import mmv.core.ChordTracker as ct
+import mmv.core.UnitRegistry as ur
+import mmv.util.Palette as pal
 import random
 import mmv.util.MusicComp as muse
 
@@ -27,7 +40,7 @@ class VizManager:
         self.main_frame = main_frame
         # Current frame of the visualization
         self.curr_frame = None  # 0, if a song or preset is loaded
-        # Midi file parser. This contains the actual file path and musc21 score.
+        # Midi file parser. This contains the actual file path, the note table and the musc21 score.
         self.parser = mp.MidiParser()
         # the midi player
         self.player = play.Player()
@@ -38,6 +51,9 @@ class VizManager:
         # the start time of the song, in ticks
         self.start_time = 0
 
+        # the tick the song was paused on, or None if it isn't paused
+        self.pause_time = None
+
         # bool for if the song is playing
         self.is_playing = False
 
@@ -47,8 +63,8 @@ class VizManager:
         # bool for if a preset is loaded
         self.preset_loaded = False
 
-        # the list of units to draw to the screen
-        self.units = []
+        # the units to draw to the screen, in drawing order and indexed by note, id and type
+        self.units = ur.UnitRegistry()
 
         # the list of notes in the currently open file, one after the other with chords broken down
         self.notes = []
@@ -56,22 +72,45 @@ class VizManager:
         # a dictionary mapping each track to its proper instrument
         self.instrument_map = [0 for x in range(16)]
 
-        # the list of the currently playing notes
-        # it is a list of tuples. first value is note, second is the tick it was played on
-        self.current_notes = []
+        # the currently playing notes, kept in order of when they should be turned off
+        self.current_notes = ns.NoteScheduler()
 
-        # the list of the next notes to be played (more than 1 if they occur simultaneously)
-        # it is a list of tuples. first value is note, second is the tick it should play on
-        self.next_notes = []
+        # precompiled timeline of every note in the currently open file, built when the song is loaded
+        self.timeline = tl.Timeline()
 
         # the next id to be used by a unit
         self.next_id = 0
 
-        # the key of the currently loaded song. set to 'C major' by default by the MidiParser.
+        # the key the currently loaded song is in at the playhead, or None until it has been analyzed
         self.key = None
+        # the keys of the currently loaded song over time, empty until they have been analyzed
+        self.key_timeline = kt.KeyTimeline()
+
+        # the lowest and highest pitches of the currently loaded song
+        self.edge_pitches = (255, 0)
+
+        # the analysis of the currently loaded song, shared by every preset
+        self.analysis = sa.SongAnalysis()
+        # number of the bar and beat playing at the playhead, for presets that follow the meter
+        self.current_bar = 0
+        self.current_beat = 0
+
+        # the chord of the last few notes played, shared by every preset
+        self.chord_tracker = ct.ChordTracker()
+
+        # cache of previously parsed songs
+        self.cache = sc.SongCache()
 
-        # the offset of the last note in the song
-        self.last_offset = 0.
+        # worker threads that load songs and presets without freezing the window
+        self.song_loader = sl.SongLoader(self.on_load_progress)
+        self.preset_loader = sl.SongLoader(self.on_load_progress)
+        # worker processes that analyze songs while they load, and the analyses of the current song still running
+        self.analysis_executor = ae.AnalysisExecutor()
+        self.analysis_executor.start()
+        self.analysis_futures = {}
+
+        # prepares the chords, key and preset data of the current song ahead of the playhead
+        self.preparer = sp.SongPreparer()
 
         # dictionary of active particle effects. this exists because deleting units with particle effects in them
         # deletes the particles immediately, and sometimes we want a smooth ending to the effects
@@ -181,76 +220,250 @@ class VizManager:
 
     def load_song_from_path(self, path):
         """
-        Reads file at given path, if possible, and saves as an object.
+        Starts reading the file at the given path on a worker thread. The song replaces the current one as soon as
+        its first bars are prepared, and opening another file in the meantime cancels the load. The rest of the song
+        is prepared in the background while it plays.
         """
-        bsy = wx.BusyInfo("Loading song from path: " + path)
-
         # cleanup everything
+        self.preset_loader.cancel()
+        self.preparer.cancel()
+        for future in self.analysis_futures.values():
+            future.cancel()
+        self.notes_off()
         self.current_notes.clear()
-        self.next_notes.clear()
         self.is_playing = False
         self.should_play = False
         self.preset_loaded = False
+        self.units.clear()
+
+        stages = [("parse", self.parse_song),
+                  ("notes", self.create_song_notes),
+                  ("timeline", self.compile_song_timeline),
+                  ("first bars", self.prepare_song_start)]
+        self.song_loader.start(stages, {'path': path}, self.on_song_loaded, self.on_load_error, self.on_song_dropped)
+
+    def parse_song(self, song):
+        """
+        Loading stage: reads the midi file, or its parsed copy if the song is cached.
+        """
+        song['cache_key'] = self.cache.get_key(song['path'])
+        song['cached'] = None
+        song['parser'] = mp.MidiParser()
+
+        # very large songs are kept in a memory-mapped note store, and only its header is read here
+        song['store'] = self.cache.load_store(song['cache_key'])
+        if song['store'] is None:
+            song['cached'] = self.cache.load(song['cache_key'])
+
+        cached = song['cached']
+        if song['store'] is not None:
+            song['parser'].load_table(song['path'], song['store'].table)
+        elif cached is not None:
+            song['parser'].load_table(song['path'], cached['table'])
+        else:
+            table = song['parser'].parse_file(song['path'])
+            if len(table) >= nstore.MIN_NOTES:
+                # songs too large for the cache, or whose store can't be written, are played from the table in
+                # memory instead
+                try:
+                    song['store'] = self.cache.save_store(song['cache_key'], table)
+                except OSError:
+                    song['store'] = None
+                if song['store'] is not None:
+                    song['parser'].load_table(song['path'], song['store'].table)
+
+        song['analysis'] = sa.SongAnalysis(song['parser'].table,
+                                           cached['key'] if cached is not None else None,
+                                           cached['edge_pitches'] if cached is not None else None)
+        if song['store'] is not None:
+            song['analysis'].put('meter', mi.MeterIndex(song['parser'].table, song['parser'].tempo_map,
+                                                        song['store']))
+
+        # the rest of the analysis runs in worker processes while the song keeps loading. cached songs already
+        # know their key and chords, and songs in a note store don't use chords
+        names = list(ae.ANALYSES)
+        if cached is not None:
+            names.remove('key')
+        if cached is not None or song['store'] is not None:
+            names.remove('chords')
+        song['analysis_futures'] = self.analysis_executor.analyze(
+            song['analysis'], names, song['store'].path if song['store'] is not None else None)
+
+    def create_song_notes(self, song):
+        """
+        Loading stage: creates the VizNotes of the song. Their chords are transcribed later by the SongPreparer.
+        Songs in a note store don't get VizNotes: the store hands out a view of each note when it is used.
+        """
+        if song['store'] is not None:
+            song['notes'] = song['store']
+        else:
+            song['notes'] = util.get_viz_notes_from_table(song['parser'].table)
+
+    def compile_song_timeline(self, song):
+        """
+        Loading stage: compiles the timeline of the song.
+        """
+        song['timeline'] = tl.Timeline(song['notes'], song['parser'].tempo_map)
 
-        # parse file
-        self.parser.parse_file(path)
+    def prepare_song_start(self, song):
+        """
+        Loading stage: prepares the first bars of the song, so it can start playing while the rest is prepared.
+        """
+        song['preparer'] = sp.SongPreparer(song, self.cache)
+        song['preparer'].prepare_until(song['preparer'].lookahead)
+
+    def on_song_loaded(self, song, timings):
+        """
+        Called on the main thread once the first bars of a song are ready. Makes it the current song and starts
+        preparing the rest of it.
+        """
+        self.parser = song['parser']
+        self.notes = song['notes']
+        self.timeline = song['timeline']
+        self.analysis = song['analysis']
+        self.edge_pitches = self.analysis.edge_pitches
         self.instrument_map = self.parser.instruments
-        self.units.clear()
         self.tempo = self.parser.get_tempo()
-        self.notes = util.get_viz_notes(self.parser.score)
-        self.key = muse.analyze_key(self.parser.score)
+
+        self.analysis_futures = song['analysis_futures']
+        self.preparer = song['preparer']
+        self.preparer.on_key_found = self.on_key_found
+        self.preparer.on_finished = self.on_song_prepared
+        self.preparer.on_error = self.on_prepare_error
+        self.key = self.preparer.key
+        self.chord_tracker.set_key(self.key)
+        if self.preparer.key_timeline is not None:
+            self.key_timeline = self.preparer.key_timeline
+        else:
+            self.key_timeline = kt.KeyTimeline()
+        self.preparer.start()
+
+        self.main_frame.statusbar.SetStatusText(song['path'], 0)
+        self.main_frame.statusbar.SetStatusText("Key: " + (str(self.key) if self.key else "analyzing..."), 4)
+        self.main_frame.statusbar.SetStatusText("Tempo: " + str(self.tempo) + " bpm", 2)
+
+        if song['store'] is not None:
+            line = "\nSong opened as a note store (" + str(len(song['store'])) + " notes): ready in "
+        elif song['cached'] is not None:
+            line = "\nSong cache hit: ready in "
+        else:
+            line = "\nSong cache miss: ready in "
+        line += str(int(sum(t[1] for t in timings) * 1000)) + " ms\n"
+        for stage, seconds in timings:
+            line += "\t" + stage + ": " + str(int(seconds * 1000)) + " ms\n"
+        util.print_line_to_panel(self.main_frame.debugger.textbox, line)
+
+    def on_song_dropped(self, song):
+        """
+        Called when loading a song is cancelled or fails. Cancels the analyses it started, since the song is never
+        played.
+        """
+        for future in song.get('analysis_futures', {}).values():
+            future.cancel()
+
+    def on_key_found(self, key, key_timeline):
+        """
+        Called on the main thread once the key of the current song and its key timeline have been analyzed.
+        """
+        self.key_timeline = key_timeline
+        self.set_key(key)
+
+    def set_key(self, key):
+        """
+        Sets the key the song is in at the playhead.
+        """
+        self.key = key
+        self.chord_tracker.set_key(key)
         self.main_frame.statusbar.SetStatusText("Key: " + str(self.key), 4)
 
-        # Print track instruments to debugger
+    def on_resize(self, width, height):
+        """
+        Called when the display is resized. Has every preset recompute its layout for the new size.
+        """
+        for preset in self.presets.values():
+            preset.on_resize(width, height)
 
-        self.main_frame.statusbar.SetStatusText("Tempo: " + str(self.tempo) + " bpm", 2)
-        bsy = None
+    def set_palette(self, name):
+        """
+        Switches the palette every preset colors notes with. Units already on the screen keep their colors.
+        """
+        pal.set_palette(name)
+
+    def on_song_prepared(self, seconds, chunks_behind):
+        """
+        Called on the main thread once every note of the current song has been prepared.
+        """
+        line = "\nSong prepared in the background in " + str(int(seconds * 1000)) + " ms"
+        if chunks_behind:
+            line += " (" + str(chunks_behind) + " chunks played before they were ready)"
+        util.print_line_to_panel(self.main_frame.debugger.textbox, line + "\n")
+
+    def on_prepare_error(self, message, details):
+        """
+        Called on the main thread when something fails while the current song is prepared in the background. The
+        song keeps playing, without whatever wasn't prepared.
+        """
+        self.main_frame.statusbar.SetStatusText(message, 0)
+        util.print_line_to_panel(self.main_frame.debugger.textbox, "\n" + message + ":\n" + details + "\n")
+
+    def on_load_progress(self, stage, number, count):
+        """
+        Called on the main thread before each loading stage starts.
+        """
+        self.main_frame.statusbar.SetStatusText("Loading: " + stage + " (" + str(number) + "/" + str(count) + ")", 0)
+
+    def on_load_error(self, stage, error, trace):
+        """
+        Called on the main thread when a loading stage fails.
+        """
+        self.main_frame.statusbar.SetStatusText("Loading failed during " + stage + ": " + str(error), 0)
+        util.print_line_to_panel(self.main_frame.debugger.textbox, "\n" + trace + "\n")
 
     def load_preset(self):
         """
-        Loads the currently selected preset. Calls its on_first_load function.
+        Loads the currently selected preset on a worker thread. Calls its first_load function, and its first_draw
+        function on the main thread once that's done.
         """
         # clears all current units
+        self.notes_off()
+        self.current_notes.clear()
+        self.is_playing = False
+        self.preset_loaded = False
         self.units.clear()
+        self.units.add_layers(self.preset.layers)
         self.screen.fill((0, 0, 0))
+        self.main_frame.display.invalidate()
+
+        preset = self.preset
+        analysis = self.analysis
+        stages = [("preset", lambda data: preset.first_load(analysis))]
+        self.preset_loader.start(stages, {}, self.on_preset_loaded, self.on_load_error)
 
-        bsy = wx.BusyInfo("Initial Loading...")
-        self.preset.first_load(self.parser.score)
-        bsy = None
+    def on_preset_loaded(self, data, timings):
+        """
+        Called on the main thread once the preset has finished its first load.
+        """
         dbg = self.main_frame.debugger.textbox
 
         # part = self.parser.score.parts[0]   # Gets first track/part of song
 
         self.should_play = False
-        self.next_notes = []
-
-        # get the offset of the first note in the song
-        # so we can put it in next_notes
-        first_offset = self.notes[0].note.offset
-        for n in self.notes:
-            if n.note.offset == first_offset:
-                ticks = pygame.time.get_ticks()
-                new_next_note = [n]
-                # new_next_note.append(ticks + util.offet_ms(n.offset, self.tempo))
-                try:
-                    mts = n.notes.midiTickStart
-                except AttributeError:
-                    mts = util.offet_ms(n.note.offset, self.tempo)
-                try:
-                    oq_error = n.note.editorial.offsetQuantizationError
-                    mts += oq_error
-                except AttributeError:
-                    pass
-
-                new_next_note.append(ticks + mts)
-                self.next_notes.append(new_next_note)
+        self.current_notes.clear()
+        self.timeline.reset()
+        self.chord_tracker.reset()
+        self.preparer.playhead = 0.
+        self.preparer.set_preset(self.preset)
+        self.preset.first_draw()
 
-            if n.note.offset > self.last_offset:
-                self.last_offset = n.note.offset
+        # the song clock starts paused, and begins counting once the song is played
+        self.start_time = pygame.time.get_ticks()
+        self.pause_time = self.start_time
 
         self.preset_loaded = True
+        # first_draw may have drawn straight to the screen
+        self.main_frame.display.invalidate()
         print("Preset Loaded")
-        util.print_line_to_panel(dbg, "\nPreset Loaded\n\n")
+        util.print_line_to_panel(dbg, "\nPreset Loaded in " + str(int(timings[0][1] * 1000)) + " ms\n\n")
 
     def pause(self):
         """
@@ -260,138 +473,93 @@ class VizManager:
 
     def update(self):
         """
-
+        Plays and stops every note that is due since the last update.
         """
+        ticks = pygame.time.get_ticks()
         if not self.is_playing:
             if self.should_play:
                 self.should_play = False
                 self.is_playing = True
-                self.start_time = pygame.time.get_ticks()
+                self.start_time = ticks
+                self.pause_time = None
+            elif self.pause_time is None:
+                self.pause_time = ticks
             return
-        # determine whether or not to play something
-        ticks = pygame.time.get_ticks()
 
-        # see if any current notes are done playing and must be set to off
-        # then remove them from current_notes
-        for n in self.current_notes:
-            if len(n) > 1:
-                if ticks >= n[1]:
-                    self.player.NoteOff(n[0].note.pitch.midi, n[0].note.volume.velocity)
-                    self.preset.per_note_off(self.screen, n[0])
-                    self.current_notes.remove(n)
-
-        if self.next_notes is not None and len(self.next_notes) > 0:
-            if ticks >= self.next_notes[0][1]:
-                # move next_notes to current_notes
-                for n in self.next_notes:
-                    new_current_note = [n[0]]
-                    # new_current_note.append(None)
-                    self.current_notes.append(new_current_note)
-                self.next_notes.clear()
-
-                # get the new next notes
-                current_offset = self.current_notes[len(self.current_notes) - 1][0].note.offset
-                if current_offset < self.last_offset:
-                    for n in self.notes:
-                        if n.note.offset > current_offset:
-                            new_offset = n.note.offset
-                            for m in self.notes:
-                                if m.note.offset == new_offset:
-                                    ticks = pygame.time.get_ticks()
-                                    new_next_note = [m]
-
-                                    oq_error = 0
-                                    qlq_error = 0
-                                    mts = 0
-                                    try:
-                                        oq_error = m.note.editorial.offsetQuantizationError
-                                    except AttributeError:
-                                        pass
-                                    try:
-                                        qlq_error = m.note.editorial.quarterLengthQuantizationError
-                                    except AttributeError:
-                                        pass
-                                    try:
-                                        mts = m.note.midiTickStart
-                                    except AttributeError:
-                                        pass
-
-                                    offset = util.offet_ms((m.note.offset - current_offset), self.tempo) + \
-                                             util.offet_ms(oq_error, self.tempo)
-                                    new_next_note.append(ticks + offset)
-                                    self.next_notes.append(new_next_note)
-                            break
-
-                # if we have reached the last note(s), set next_notes to none so we know not to keep checking for more
+        # don't count the time spent paused towards the song's progress
+        if self.pause_time is not None:
+            self.start_time += ticks - self.pause_time
+            self.pause_time = None
+        song_time = ticks - self.start_time
+        self.preparer.playhead = song_time
+        meter = self.analysis.meter
+        self.current_bar = meter.get_at('bar', song_time)
+        self.current_beat = meter.get_at('beat', song_time)
+
+        # turn off the current notes that are done playing
+        self.current_notes.start_frame()
+        for n in self.current_notes.pop_expired(song_time):
+            self.player.NoteOff(n.pitch, n.velocity)
+            self.preset.per_note_off(self.screen, n)
+
+        # play the notes that are due and draw them to the screen (via preset)
+        for i in self.timeline.advance(song_time):
+            viz_note = self.timeline.notes[i]
+            self.current_notes.schedule(viz_note, self.timeline.get_off_time(i))
+
+            track = viz_note.track
+            # instrument = self.track_instrument_map[track - 1]
+            instrument = self.instrument_map[track - 1]
+            if instrument < 130:
+                if instrument > 0:
+                    self.player.set_instrument(instrument - 1)
                 else:
-                    self.next_notes.clear()
-
-                # set the ticks length of each current note and
-                # play the note and draw it to the screen (via preset)
-                for n in self.current_notes:
-                    if len(n) < 2:
-                        # print("note " + str(n[0].name) + " had no tick value set")
-                        length = n[0].note.quarterLength
-
-                        qlq_error = 0
-                        try:
-                            qlq_error = n[0].note.editorial.quarterLengthQuantizationError
-                        except AttributeError:
-                            pass
-                        length_ms = util.offet_ms(length, self.tempo) + util.offet_ms(qlq_error, self.tempo)
-                        n.append(ticks + length_ms)
-                        track = n[0].track
-                        # instrument = self.track_instrument_map[track - 1]
-                        instrument = self.instrument_map[track - 1]
-                        if instrument < 130:
-                            if instrument > 0:
-                                self.player.set_instrument(instrument - 1)
-                            else:
-                                self.player.set_instrument(instrument)
-                            self.player.NoteOn(n[0].note.pitch.midi, n[0].note.volume.velocity)
-                        else:       # if instrument is not 1-129
-                            self.player.set_instrument(20, 10)
-                            self.player.NoteOn(n[0].note.pitch.midi, n[0].note.volume.velocity, channel=10)
-
-                        self.preset.per_note_on(self.screen, n[0])
+                    self.player.set_instrument(instrument)
+                self.player.NoteOn(viz_note.pitch, viz_note.velocity)
+            else:       # if instrument is not 1-129
+                self.player.set_instrument(20, 10)
+                self.player.NoteOn(viz_note.pitch, viz_note.velocity, channel=10)
+
+            # follow the song when it modulates
+            key = self.key_timeline.key_at(viz_note.offset)
+            if key is not None and key is not self.key:
+                self.set_key(key)
+
+            self.chord_tracker.push(viz_note.pitch)
+            self.preset.per_note_on(self.screen, viz_note)
 
     def remove_unit(self, note=None, id=None, the_type=None):
         """
         Removes whichever units in the units list that are associated with that note.
         :param note: the note with which to match to a unit
+        :param id: the id of the units to remove instead, if given
+        :param the_type: only remove units of exactly this type, if given
         :return: none
         """
-        for unit in self.units:
-            # Check if unit is subclass of noteunit
-            if issubclass(type(unit), Unit.NoteUnit):
-                if id is not None:
-                    if the_type is None:
-                        if unit.id == id:
-                            self.units.remove(unit)
-                    else:
-                        if unit.id == id and type(unit) == the_type:
-                            self.units.remove(unit)
-                elif unit.note == note:
-                    if the_type is None:
-                        self.units.remove(unit)
-                    else:
-                        if type(unit) == the_type:
-                            self.units.remove(unit)
-                    # print("unit removed. list size: " + str(len(self.units)))
-            elif isinstance(unit, Unit.ParticleSpaceUnit):
-                if unit.id == id:
+        if id is not None:
+            for unit in self.units.get_by_id(id):
+                # particle spaces are removed whatever the type asked for
+                if isinstance(unit, Unit.ParticleSpaceUnit) or \
+                        (isinstance(unit, Unit.NoteUnit) and (the_type is None or type(unit) == the_type)):
+                    self.units.remove(unit)
+        else:
+            for unit in self.units.get_by_note(note):
+                if isinstance(unit, Unit.NoteUnit) and (the_type is None or type(unit) == the_type):
                     self.units.remove(unit)
 
     def sort_units(self):
-        self.units.sort(key=lambda x: x.layer)
+        """
+        Moves the units whose layer was changed after they were added. Units added to a layer are already in place.
+        """
+        self.units.update_layers()
 
     def notes_off(self):
         for note in self.current_notes:
-            self.player.NoteOff(note[0].note.pitch.midi, note[0].note.volume.velocity)
+            self.player.NoteOff(note.pitch, note.velocity)
 
     def notes_on(self):
         for note in self.current_notes:
-            self.player.NoteOn(note[0].note.pitch.midi, note[0].note.volume.velocity)
+            self.player.NoteOn(note.pitch, note.velocity)
 
     def get_next_id(self):
         id = self.next_id
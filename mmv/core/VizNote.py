@@ -2,21 +2,57 @@
 """
 This is a wrapper class for a music21.Note object which contains more useful information than what a single
 music21.Note object would contain. This was implemented primarily to handle multitrack notes.
+
+The properties needed for playback are stored directly on the VizNote, so notes read straight from a NoteTable
+don't need a music21.Note at all. One is only created the first time the note attribute is used.
 """
 import music21
 
 
 class VizNote:
 
-    def __init__(self, note):
+    def __init__(self, note=None, pitch=0, velocity=0, offset=0., quarter_length=0., track=-1, channel=0):
         self.chord_in_beat = None
         self.chord_in_half_bar = None
         self.chord_in_bar = None
 
+        self.pitch = pitch
+        self.velocity = velocity
+        self.offset = offset
+        self.quarter_length = quarter_length
+        self.channel = channel
+        # quantization errors of the offset and length, in quarter lengths
+        self.offset_error = 0.
+        self.length_error = 0.
+
+        self._note = None
         if isinstance(note, music21.note.Note):
-            self.note = note
-        else:
-            self.note = None
+            self._note = note
+            self.pitch = note.pitch.midi
+            self.velocity = note.volume.velocity or 0
+            self.offset = note.offset
+            self.quarter_length = note.quarterLength
+            try:
+                self.offset_error = note.editorial.offsetQuantizationError
+            except AttributeError:
+                pass
+            try:
+                self.length_error = note.editorial.quarterLengthQuantizationError
+            except AttributeError:
+                pass
 
-        self.track = -1
+        self.track = track
+        # position of the note in the song's NoteTable, or -1 if it didn't come from one
+        self.index = -1
 
+    @property
+    def note(self):
+        """
+        The music21.Note of this note, created on first use.
+        """
+        if self._note is None:
+            self._note = music21.note.Note(self.pitch)
+            self._note.quarterLength = self.quarter_length
+            self._note.offset = self.offset
+            self._note.volume.velocity = self.velocity
+        return self._note
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+"""
+This class indexes the notes of a NoteTable by (track, start tick), so the notes a track plays at the same time
+(the chord a note belongs to) can be found without scanning the song.
+
+The notes are sorted by start tick and then by track, so the notes of each (track, tick) group sit in one
+contiguous slice of the sorted order, in the order they are played. The chord of a note is then the slice of its
+group up to its rank in it. The index is only arrays, which the TensionTable uses to find the chord of every note
+at once.
+"""
+import numpy as np
+
+
+class ChordIndex:
+
+    def __init__(self, table=None):
+        # ticks per quarter note of the table, to turn offsets into ticks
+        self.ticks_per_quarter = 480
+        # midi pitch of each note of the table
+        self.pitch = np.zeros(0, dtype=np.uint8)
+        # rows of the table, sorted by start tick and then by track
+        self.order = np.zeros(0, dtype=np.int64)
+        # position in self.order of the first note of each group
+        self.first = np.zeros(0, dtype=np.int64)
+        # group of each note of the table, in table order
+        self.group = np.zeros(0, dtype=np.int64)
+        # position of each note within its group, in table order
+        self.rank = np.zeros(0, dtype=np.int64)
+
+        if table is not None:
+            self.build(table)
+
+    def __len__(self):
+        return len(self.first)
+
+    def build(self, table):
+        """
+        Indexes the notes of a NoteTable.
+        """
+        self.ticks_per_quarter = table.ticks_per_quarter
+        self.pitch = table.pitch
+        count = len(table)
+        if count == 0:
+            return
+        track = np.asarray(table.track)
+        start = np.asarray(table.start)
+        # the table is sorted by start tick, so a stable sort keeps each group in the order it is played
+        self.order = np.lexsort((track, start))
+        sorted_track = track[self.order]
+        sorted_start = start[self.order]
+        new_group = np.ones(count, dtype=bool)
+        new_group[1:] = (sorted_start[1:] != sorted_start[:-1]) | (sorted_track[1:] != sorted_track[:-1])
+        group_sorted = np.cumsum(new_group) - 1
+        self.first = np.flatnonzero(new_group)
+
+        self.group = np.empty(count, dtype=np.int64)
+        self.group[self.order] = group_sorted
+        self.rank = np.empty(count, dtype=np.int64)
+        self.rank[self.order] = np.arange(count) - self.first[group_sorted]
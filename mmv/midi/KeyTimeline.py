@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+"""
+This class finds the key of a song over time, so colors and dissonance follow the song when it modulates.
+
+Keys are found the same way music21 analyzes a key (the Aarden-Essen key profiles): the pitch classes of a
+passage are weighted by how long they sound, and the key whose profile correlates best with them wins. Instead of
+building a music21 stream for every passage, the pitch-class durations of every window of the song are computed
+at once with numpy, and all 24 keys are scored with a single matrix product.
+
+Each window is WINDOW quarter lengths long, and there is one every HOP quarter lengths. The key only changes when
+another key fits a window clearly better than the current one, so passing chromatic notes don't make it flicker.
+The timeline is a sorted list of the offsets the key changes at, so finding the key at a time is a binary search.
+
+Notes can also be pushed one at a time (i.e. from live input), which updates the timeline as they come. Each
+window is analyzed as soon as a note starts after it ends, and gives the same key as building the timeline from
+the whole song.
+"""
+import bisect
+import collections
+import numpy as np
+import music21
+
+# length of the passage each key is found from, in quarter lengths
+WINDOW = 16.
+# distance between two windows, in quarter lengths
+HOP = 4.
+# how much better another key has to fit a window than the current key to replace it
+SWITCH_MARGIN = 0.05
+
+# Aarden-Essen key profiles, as used by music21's default key analysis
+MAJOR_WEIGHTS = [17.7661, 0.145624, 14.9265, 0.160186, 19.8049, 11.3587,
+                 0.291248, 22.062, 0.145624, 8.15494, 0.232998, 4.95122]
+MINOR_WEIGHTS = [18.2648, 0.737619, 14.0499, 16.8599, 0.702494, 14.4362,
+                 0.702494, 18.6161, 4.56621, 1.93186, 7.37619, 1.75623]
+
+# name of the tonic of each major and minor key, with the fewest accidentals
+MAJOR_TONICS = ['C', 'D-', 'D', 'E-', 'E', 'F', 'F#', 'G', 'A-', 'A', 'B-', 'B']
+MINOR_TONICS = ['C', 'C#', 'D', 'E-', 'E', 'F', 'F#', 'G', 'G#', 'A', 'B-', 'B']
+
+
+def get_profiles():
+    """
+    Returns a 24x12 array of the mean-centered profile of every key: the 12 major keys, then the 12 minor keys.
+    """
+    profiles = []
+    for weights in (MAJOR_WEIGHTS, MINOR_WEIGHTS):
+        weights = np.array(weights) - np.mean(weights)
+        for tonic in range(12):
+            profiles.append(np.roll(weights, tonic))
+    return np.array(profiles)
+
+
+# mean-centered profile of every key, and its norm
+PROFILES = get_profiles()
+PROFILE_NORMS = np.sqrt((PROFILES ** 2).sum(axis=1))
+
+# music21 Key of each of the 24 keys, created on first use
+KEYS = {}
+
+
+def get_key(index):
+    """
+    Returns the music21 Key of a key index (0 to 11 for major keys by tonic, 12 to 23 for minor keys).
+    """
+    if index not in KEYS:
+        if index < 12:
+            KEYS[index] = music21.key.Key(MAJOR_TONICS[index], 'major')
+        else:
+            KEYS[index] = music21.key.Key(MINOR_TONICS[index - 12].lower(), 'minor')
+    return KEYS[index]
+
+
+def correlate(histograms):
+    """
+    Returns the correlation of each pitch-class histogram (an Nx12 array) with the profile of every key, as an
+    Nx24 array. Empty histograms correlate with nothing.
+    """
+    histograms = np.atleast_2d(np.asarray(histograms, dtype=np.float64))
+    centered = histograms - histograms.mean(axis=1, keepdims=True)
+    norms = np.sqrt((centered ** 2).sum(axis=1, keepdims=True))
+    scores = centered.dot(PROFILES.T)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scores = scores / (norms * PROFILE_NORMS)
+    scores[~np.isfinite(scores)] = 0.
+    return scores
+
+
+def find_key_index(table):
+    """
+    Returns the index (see get_key) of the key of a whole NoteTable, or -1 if it has no notes.
+    """
+    if len(table) == 0:
+        return -1
+    histogram = np.bincount(np.asarray(table.pitch) % 12, weights=table.quarter_lengths, minlength=12)
+    scores = correlate(histogram)[0]
+    best = int(np.argmax(scores))
+    if scores[best] == 0.:
+        return -1
+    return best
+
+
+def find_key(table):
+    """
+    Returns the music21 Key of a whole NoteTable, or None if it has no notes. This gives the same key as
+    analyzing the song with music21.
+    """
+    index = find_key_index(table)
+    return get_key(index) if index >= 0 else None
+
+
+def get_sounding_time(starts, ends, times):
+    """
+    Returns how long notes (given by their sorted start and end times) have sounded in total before each time.
+    """
+    ends = np.sort(ends)
+    start_count = np.searchsorted(starts, times, side='right')
+    end_count = np.searchsorted(ends, times, side='right')
+    start_sums = np.concatenate(([0.], np.cumsum(starts)))
+    end_sums = np.concatenate(([0.], np.cumsum(ends)))
+    return (times * start_count - start_sums[start_count]) - (times * end_count - end_sums[end_count])
+
+
+class KeyTimeline:
+
+    def __init__(self, table=None, window=WINDOW, hop=HOP):
+        # length of the passage each key is found from, in quarter lengths
+        self.window = window
+        # distance between two windows, in quarter lengths
+        self.hop = hop
+        # offsets the key changes at, in quarter lengths, sorted
+        self.offsets = []
+        # index (see get_key) of the key starting at each offset
+        self.keys = []
+
+        # notes pushed one at a time that can still sound in a window to come, as (offset, end, pitch class)
+        self.recent = collections.deque()
+        # offset of the next window to analyze the pushed notes at
+        self.next_hop = 0.
+        # offset the last of the pushed notes ends at
+        self.end = 0.
+
+        if table is not None:
+            self.build(table)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def build(self, table):
+        """
+        Finds the key of every window of a NoteTable, and keeps the offsets the key changes at.
+        """
+        self.offsets = []
+        self.keys = []
+        if len(table) == 0:
+            return
+        starts = table.offsets
+        ends = starts + table.quarter_lengths
+        pcs = np.asarray(table.pitch) % 12
+
+        hops = np.arange(0., float(ends.max()) + self.hop, self.hop)
+        first, last = self.get_window(hops)
+        edges = np.concatenate((first, last))
+        histograms = np.zeros((len(hops), 12))
+        for pc in range(12):
+            mine = pcs == pc
+            if not mine.any():
+                continue
+            sounding = get_sounding_time(starts[mine], ends[mine], edges)
+            histograms[:, pc] = sounding[len(hops):] - sounding[:len(hops)]
+
+        scores = correlate(histograms)
+        for offset, row in zip(hops.tolist(), scores):
+            self.add_window(offset, row)
+
+    def get_window(self, hop):
+        """
+        Returns where the window of a hop (or of an array of hops) starts and ends. Windows are centered on the
+        middle of their hop, so a key starts where the music in it does.
+        """
+        return hop + self.hop / 2. - self.window / 2., hop + self.hop / 2. + self.window / 2.
+
+    def add_window(self, offset, scores):
+        """
+        Adds the key scores of the window at an offset to the end of the timeline.
+        """
+        best = int(np.argmax(scores))
+        if scores[best] <= 0.:
+            return
+        if not self.keys:
+            self.offsets.append(offset)
+            self.keys.append(best)
+        elif best != self.keys[-1] and scores[best] - scores[self.keys[-1]] > SWITCH_MARGIN:
+            self.offsets.append(offset)
+            self.keys.append(best)
+
+    def key_at(self, offset):
+        """
+        Returns the music21 Key at an offset (in quarter lengths), or None if no key is known yet.
+        Before the first key change, the first key is used.
+        """
+        if not self.keys:
+            return None
+        i = bisect.bisect_right(self.offsets, offset) - 1
+        return get_key(self.keys[max(i, 0)])
+
+    def get_tonics(self, offsets):
+        """
+        Returns the pitch class of the tonic at each offset of an array, using C if no key is known.
+        """
+        if not self.keys:
+            return np.zeros(len(offsets), dtype=np.int64)
+        tonics = np.array([index % 12 for index in self.keys], dtype=np.int64)
+        i = np.searchsorted(np.array(self.offsets), offsets, side='right') - 1
+        return tonics[np.maximum(i, 0)]
+
+    def push(self, pitch, offset, quarter_length):
+        """
+        Adds a note that was just played (i.e. from live input). Notes must be pushed in the order they start.
+        Every window that ends before the note starts is analyzed and the timeline updated, since no note pushed
+        later can sound in it.
+        """
+        while offset >= self.get_window(self.next_hop)[1]:
+            self.analyze_next()
+        self.recent.append((offset, offset + quarter_length, pitch % 12))
+        self.end = max(self.end, offset + quarter_length)
+
+    def flush(self):
+        """
+        Analyzes the windows that are left once every note was pushed (i.e. at the end of a song).
+        """
+        while self.recent and self.next_hop < self.end + self.hop:
+            self.analyze_next()
+
+    def analyze_next(self):
+        """
+        Analyzes the window of the next hop from the pushed notes, and moves on to the hop after it.
+        """
+        start, end = self.get_window(self.next_hop)
+        # notes that ended before this window can't sound in the next ones either
+        while self.recent and self.recent[0][1] <= start:
+            self.recent.popleft()
+        histogram = np.zeros(12)
+        for note_start, note_end, pc in self.recent:
+            histogram[pc] += max(0., min(note_end, end) - max(note_start, start))
+        self.add_window(self.next_hop, correlate(histogram)[0])
+        self.next_hop += self.hop
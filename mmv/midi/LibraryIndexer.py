@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+"""
+Builds a searchable index of a midi library without opening the GUI.
+
+Every *.mid file under the given directories is read by a pool of worker processes, which find its key, tempo,
+pitch range, track count, note count and duration. The results go in an SQLite database, one row per file.
+
+Indexing is incremental. Files whose size and modification time haven't changed are skipped. A file that only
+changed modification time is hashed and skipped if its contents are the same. Files that can't be read are stored
+with their error, so they are retried only once they change. A worker that crashes doesn't stop the other files.
+
+Usage: python -m mmv.midi.LibraryIndexer [--db PATH] [--workers N] [--full] DIRECTORY [DIRECTORY ...]
+"""
+import os
+import sys
+import time
+import hashlib
+import sqlite3
+import argparse
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+import mmv.midi.SmfReader as smf
+import mmv.midi.TempoMap as tm
+import mmv.util.MusicComp as muse
+
+# file extensions that are indexed
+MIDI_EXTENSIONS = ('.mid', '.midi')
+
+# bump this whenever the analysis changes, so every file is indexed again
+INDEX_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS songs (
+    path        TEXT PRIMARY KEY,
+    size        INTEGER NOT NULL,
+    mtime       REAL NOT NULL,
+    hash        TEXT NOT NULL,
+    version     INTEGER NOT NULL,
+    key         TEXT,
+    tempo       REAL,
+    lowest      INTEGER,
+    highest     INTEGER,
+    tracks      INTEGER,
+    notes       INTEGER,
+    duration    REAL,
+    error       TEXT
+);
+CREATE INDEX IF NOT EXISTS songs_key ON songs (key);
+CREATE INDEX IF NOT EXISTS songs_tempo ON songs (tempo);
+"""
+
+COLUMNS = ['path', 'size', 'mtime', 'hash', 'version', 'key', 'tempo', 'lowest', 'highest', 'tracks', 'notes',
+           'duration', 'error']
+
+
+def get_default_db():
+    """
+    Returns the path of the index used when none is given.
+    """
+    return os.path.join(os.path.expanduser("~"), ".mmv", "library.db")
+
+
+def find_midi_files(directories):
+    """
+    Yields the path of every midi file under the given directories.
+    """
+    for directory in directories:
+        for root, dirs, files in os.walk(directory):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(MIDI_EXTENSIONS):
+                    yield os.path.abspath(os.path.join(root, name))
+
+
+def analyze_file(path, known_hash=None):
+    """
+    Runs in a worker process. Reads the midi file at the given path and returns its row of the index as a dict.
+
+    If the file's hash is known_hash, the file isn't analyzed and the returned dict only holds its 'path', 'hash',
+    'size' and 'mtime'.
+    Errors are returned in the 'error' entry instead of being raised, so one bad file never breaks the pool.
+    """
+    row = {'path': path, 'version': INDEX_VERSION, 'error': None}
+    try:
+        stat = os.stat(path)
+        row['size'] = stat.st_size
+        row['mtime'] = stat.st_mtime
+        with open(path, 'rb') as f:
+            data = f.read()
+        row['hash'] = hashlib.sha1(data).hexdigest()
+        if row['hash'] == known_hash:
+            return {'path': path, 'hash': known_hash, 'size': row['size'], 'mtime': row['mtime']}
+
+        table = smf.read_bytes(data)
+        tempo_map = tm.TempoMap(table.tempo_changes, table.ticks_per_quarter)
+        key = muse.analyze_key(table)
+        row['key'] = str(key) if key is not None else None
+        row['tempo'] = round(tempo_map.tempo_at(0), 3)
+        row['tracks'] = table.num_tracks
+        row['notes'] = len(table)
+        if len(table):
+            row['lowest'] = int(table.pitch.min())
+            row['highest'] = int(table.pitch.max())
+            row['duration'] = round(tempo_map.ticks_to_ms(int((table.start + table.duration).max())) / 1000.0, 3)
+    except Exception as e:
+        row.setdefault('size', 0)
+        row.setdefault('mtime', 0.)
+        row.setdefault('hash', "")
+        row['error'] = type(e).__name__ + ": " + str(e)
+    return row
+
+
+class LibraryIndexer:
+
+    def __init__(self, db_path=None, workers=None):
+        # path of the SQLite index
+        self.db_path = db_path or get_default_db()
+        # number of worker processes, defaults to one per cpu
+        self.workers = workers
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(self.db_path)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def get_known(self):
+        """
+        Returns a dict mapping the path of every indexed file to its (size, mtime, hash, version).
+        """
+        rows = self.db.execute("SELECT path, size, mtime, hash, version FROM songs")
+        return {r[0]: r[1:] for r in rows}
+
+    def get_work(self, directories, full=False):
+        """
+        Returns the files that need to be indexed as a list of (path, known hash) tuples, and the number of files
+        that are up to date.
+        """
+        known = self.get_known()
+        work = []
+        up_to_date = 0
+        for path in find_midi_files(directories):
+            entry = known.get(path)
+            if entry is None or full or entry[3] != INDEX_VERSION:
+                work.append((path, None))
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if stat.st_size == entry[0] and stat.st_mtime == entry[1]:
+                up_to_date += 1
+            else:
+                work.append((path, entry[2]))
+        return work, up_to_date
+
+    def store(self, row):
+        """
+        Writes the row of a file to the index.
+        """
+        if 'version' not in row:
+            # unchanged contents, only the file's stats changed
+            self.db.execute("UPDATE songs SET size = ?, mtime = ? WHERE path = ?",
+                            (row['size'], row['mtime'], row['path']))
+            return
+        values = [row.get(c) for c in COLUMNS]
+        self.db.execute("INSERT OR REPLACE INTO songs (" + ", ".join(COLUMNS) + ") VALUES (" +
+                        ", ".join("?" * len(COLUMNS)) + ")", values)
+
+    def index(self, directories, full=False, report=print):
+        """
+        Indexes every midi file under the given directories and returns a dict of statistics.
+
+        :param full:    index every file again, even the ones that didn't change
+        :param report:  called with a line of text to report progress
+        """
+        start = time.perf_counter()
+        work, up_to_date = self.get_work(directories, full)
+        stats = {'indexed': 0, 'unchanged': up_to_date, 'failed': 0, 'crashed': 0}
+
+        if work:
+            self.run_pool(work, stats, report)
+
+        self.db.commit()
+        stats['seconds'] = time.perf_counter() - start
+        stats['files_per_second'] = len(work) / stats['seconds'] if stats['seconds'] > 0 else 0.
+        return stats
+
+    def run_pool(self, work, stats, report):
+        """
+        Analyzes the files on a process pool and stores the results. If a worker dies, the files that didn't
+        finish are split in halves, and each half is analyzed again on a new pool, until the file that crashes is
+        found. It is stored as failed.
+        """
+        done = set()
+        start = time.perf_counter()
+        with concurrent.futures.ProcessPoolExecutor(self.workers) as pool:
+            futures = {pool.submit(analyze_file, path, known_hash): path for path, known_hash in work}
+            try:
+                for future in concurrent.futures.as_completed(futures):
+                    self.store_result(future.result(), done, stats, report)
+                    if len(done) % 100 == 0:
+                        self.db.commit()
+                        rate = len(done) / (time.perf_counter() - start)
+                        report(str(len(done)) + "/" + str(len(work)) + " files, " + str(round(rate, 1)) +
+                               " files/s")
+            except BrokenProcessPool:
+                # keep the files that finished before the pool broke
+                for future, path in futures.items():
+                    if path not in done and future.done() and not future.cancelled() and future.exception() is None:
+                        self.store_result(future.result(), done, stats, report)
+                remaining = [w for w in work if w[0] not in done]
+                if len(remaining) == 1:
+                    self.store_crash(remaining[0][0], stats, report)
+                    return
+                # the pool can't tell which file crashed it, so each half of the remaining files gets a new pool.
+                # only the halves that break again are split further
+                middle = len(remaining) // 2
+                for half in (remaining[:middle], remaining[middle:]):
+                    if half:
+                        self.run_pool(half, stats, report)
+
+    def store_result(self, row, done, stats, report):
+        """
+        Stores the row of a file a worker analyzed, and counts it in the statistics.
+        """
+        self.store(row)
+        done.add(row['path'])
+        if 'version' not in row:
+            stats['unchanged'] += 1
+        elif row['error']:
+            stats['failed'] += 1
+            report("failed: " + row['path'] + " (" + row['error'] + ")")
+        else:
+            stats['indexed'] += 1
+
+    def store_crash(self, path, stats, report):
+        """
+        Stores a file that crashed a worker process as failed.
+        """
+        stats['crashed'] += 1
+        report("crashed: " + path)
+        row = {'path': path, 'size': 0, 'mtime': 0., 'hash': "", 'version': INDEX_VERSION,
+               'error': "worker process crashed"}
+        # the file's stats are kept, so it's only tried again once it changes
+        try:
+            stat = os.stat(path)
+            row['size'] = stat.st_size
+            row['mtime'] = stat.st_mtime
+        except OSError:
+            pass
+        self.store(row)
+
+def main():
+    parser = argparse.ArgumentParser(description="Index the key, tempo, range, tracks and duration of midi files")
+    parser.add_argument("directories", nargs="+", help="directories to search for midi files")
+    parser.add_argument("--db", default=None, help="path of the index (default: ~/.mmv/library.db)")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes")
+    parser.add_argument("--full", action="store_true", help="index every file again, even if it didn't change")
+    args = parser.parse_args()
+
+    indexer = LibraryIndexer(args.db, args.workers)
+    try:
+        stats = indexer.index(args.directories, args.full)
+    finally:
+        indexer.close()
+
+    print("indexed " + str(stats['indexed']) + ", unchanged " + str(stats['unchanged']) + ", failed " +
+          str(stats['failed']) + ", crashed " + str(stats['crashed']) + " in " + str(round(stats['seconds'], 2)) +
+          " s (" + str(round(stats['files_per_second'], 1)) + " files/s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+"""
+This class divides a song into beats, half-bars and bars, following its time signatures, and indexes which notes
+are in each of them.
+
+Bars start at the first tick and at every time signature change, and last as long as their time signature says.
+Beats are the unit of the time signature (a quarter in 4/4, an eighth in 5/8), except in compound meters where
+they are dotted (6/8 and 12/8 have beats of three eighths). Notes are sorted by start tick, so the notes of a beat,
+half-bar or bar are one contiguous range of the note table: finding them is an array lookup, and finding the bar of
+a note is a binary search.
+
+The start time of every beat, half-bar and bar is also kept, along with a grid of evenly spaced times, so finding
+the bar playing at the playhead doesn't search at all: the grid gives the bar at the start of the playhead's cell,
+and no cell holds more than a bar line or two.
+"""
+import numpy as np
+import mmv.midi.TempoMap as tm
+
+# the levels the song is divided into, from shortest to longest
+LEVELS = ('beat', 'half_bar', 'bar')
+
+# most cells in the grid of a level, so songs with very short beats don't get huge grids
+MAX_GRID_CELLS = 1 << 16
+
+
+def get_beat_length(numerator, denominator, ticks_per_quarter):
+    """
+    Returns the length of a beat of a time signature, in ticks.
+    """
+    unit = ticks_per_quarter * 4 // denominator
+    if denominator >= 8 and numerator > 3 and numerator % 3 == 0:
+        return unit * 3
+    return unit
+
+
+class MeterIndex:
+
+    def __init__(self, table=None, tempo_map=None, store=None):
+        """
+        :param table:       NoteTable of the song
+        :param tempo_map:   TempoMap of the song. one is made from the table if it isn't given
+        :param store:       NoteStore the table belongs to, if any. its index is searched instead of the start
+                            column, so the notes aren't all read from disk
+        """
+        # (tick, numerator, denominator) of every time signature, starting with the one on tick 0
+        self.time_signatures = [(0, 4, 4)]
+        # tick each beat, half-bar and bar starts on, by level
+        self.ticks = {level: np.zeros(1, dtype=np.int64) for level in LEVELS}
+        # time each beat, half-bar and bar starts at in ms, by level
+        self.times = {level: np.zeros(1) for level in LEVELS}
+        # index of the first note of each beat, half-bar and bar, followed by the number of notes, by level
+        self.first_notes = {level: np.zeros(2, dtype=np.int64) for level in LEVELS}
+        # length of a cell of the grid of each level in ms, and the number of the beat, half-bar or bar playing at
+        # the start of each cell
+        self.grid_steps = {level: 1. for level in LEVELS}
+        self.grids = {level: np.zeros(1, dtype=np.int64) for level in LEVELS}
+        # start tick of each note
+        self.note_starts = np.zeros(0, dtype=np.int64)
+
+        if table is not None:
+            self.build(table, tempo_map, store)
+
+    def __len__(self):
+        return len(self.ticks['bar'])
+
+    def build(self, table, tempo_map=None, store=None):
+        """
+        Divides the song of a NoteTable into beats, half-bars and bars.
+        """
+        if tempo_map is None:
+            tempo_map = tm.TempoMap(table.tempo_changes, table.ticks_per_quarter)
+        tpq = table.ticks_per_quarter
+        self.note_starts = np.asarray(table.start)
+        count = len(table)
+        if table.end_tick is not None:
+            end = table.end_tick + 1
+        else:
+            end = int((table.start + table.duration).max()) + 1 if count else 1
+
+        # keep the last time signature on any given tick, and start in 4/4 if the song doesn't say
+        signatures = {}
+        for tick, numerator, denominator in sorted(table.time_signatures or [], key=lambda x: x[0]):
+            if tick < end:
+                signatures[tick] = (numerator, denominator)
+        signatures.setdefault(0, (4, 4))
+        self.time_signatures = [(tick,) + signatures[tick] for tick in sorted(signatures)]
+
+        ticks = {level: [] for level in LEVELS}
+        for i, (tick, numerator, denominator) in enumerate(self.time_signatures):
+            segment_end = self.time_signatures[i + 1][0] if i + 1 < len(self.time_signatures) else end
+            bar_length = max(tpq * 4 * numerator // denominator, 1)
+            beat_length = max(get_beat_length(numerator, denominator, tpq), 1)
+            bars = np.arange(tick, segment_end, bar_length, dtype=np.int64)
+            beats = (bars[:, None] + np.arange(0, bar_length, beat_length, dtype=np.int64)).ravel()
+            half_bars = (bars[:, None] + np.array([0, bar_length // 2], dtype=np.int64)).ravel()
+            ticks['bar'].append(bars)
+            ticks['beat'].append(beats[beats < segment_end])
+            ticks['half_bar'].append(np.unique(half_bars[half_bars < segment_end]))
+
+        for level in LEVELS:
+            level_ticks = np.concatenate(ticks[level])
+            times = tempo_map.ticks_to_ms(level_ticks)
+            self.ticks[level] = level_ticks
+            self.times[level] = times
+            if store is not None:
+                first_notes = np.array([store.find(t - 1) for t in level_ticks.tolist()], dtype=np.int64)
+            else:
+                first_notes = np.searchsorted(self.note_starts, level_ticks, side='left')
+            self.first_notes[level] = np.append(first_notes, count)
+
+            # the grid is fine enough that each cell holds at most one start, unless that needs too many cells
+            step = float(np.diff(times).min()) if len(times) > 1 else 1.
+            step = max(step, float(times[-1]) / MAX_GRID_CELLS, 1.)
+            cells = np.arange(int(times[-1] // step) + 1) * step
+            self.grid_steps[level] = step
+            self.grids[level] = np.maximum(np.searchsorted(times, cells, side='right') - 1, 0)
+
+    def count(self, level):
+        """
+        Returns the number of beats, half-bars or bars in the song.
+        """
+        return len(self.ticks[level])
+
+    def get_notes(self, level, number):
+        """
+        Returns the index of the first note of a beat, half-bar or bar, and the index right after its last note.
+        """
+        return int(self.first_notes[level][number]), int(self.first_notes[level][number + 1])
+
+    def get_number(self, level, note):
+        """
+        Returns the number of the beat, half-bar or bar the note at the given index is in.
+        """
+        return int(np.searchsorted(self.ticks[level], self.note_starts[note], side='right')) - 1
+
+    def get_numbers(self, level):
+        """
+        Returns the number of the beat, half-bar or bar of every note, as an array.
+        """
+        return np.searchsorted(self.ticks[level], self.note_starts, side='right') - 1
+
+    def get_at(self, level, time):
+        """
+        Returns the number of the beat, half-bar or bar playing at the given time (in ms), in constant time.
+        """
+        grid = self.grids[level]
+        times = self.times[level]
+        cell = min(max(int(time // self.grid_steps[level]), 0), len(grid) - 1)
+        number = int(grid[cell])
+        while number + 1 < len(times) and times[number + 1] <= time:
+            number += 1
+        return number
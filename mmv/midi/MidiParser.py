@@ -1,10 +1,14 @@
 #!/usr/bin/env python
 """
 This class is responsible for reading a given compatible MIDI file and
-storing it in memory as a MidiBlock object.
+storing it in memory as a NoteTable object.
+
+The music21 score of the file is only built when something asks for it, since
+playback only needs the note table.
 """
-from music21 import midi, exceptions21
-from util.Constants import INSTRUMENTS
+from music21 import midi
+import mmv.midi.SmfReader as smf
+import mmv.midi.TempoMap as tm
 
 
 class MidiParser:
@@ -12,81 +16,65 @@ class MidiParser:
     def __init__(self):
         # Path of the song loaded, default is empty string.
         self.path = "No file detected"
-        # Music21 object of the song.
-        self.score = None
+        # Compact table of every note in the song.
+        self.table = None
+        # Music21 object of the song, built on first use.
+        self._score = None
+        # Every tempo change in the song, used to convert offsets to ms.
+        self.tempo_map = tm.TempoMap()
         # a dictionary mapping each track to its proper instrument
         self.instruments = [0 for x in range(16)]
 
+    @property
+    def score(self):
+        """
+        The music21 Score object of the song. Parsing it is slow, so only analysis that
+        really needs music21 should use it.
+        """
+        if self._score is None and self.table is not None:
+            self._score = midi.translate.midiFilePathToStream(self.path)
+        return self._score
+
     def parse_file(self, path):
         """
-        Reads file at given path, if possible, and returns a music21 Score object.
+        Reads file at given path, if possible, and returns its NoteTable.
         """
         self.path = path
-        self.score = midi.translate.midiFilePathToStream(path)
+        self._score = None
+        self.table = smf.read_file(path)
+        self.tempo_map = tm.TempoMap(self.table.tempo_changes, self.table.ticks_per_quarter)
         self.get_instruments()
-        return self.score
+        return self.table
+
+    def load_table(self, path, table):
+        """
+        Uses an already parsed NoteTable (i.e. from the song cache) for the file at the given path.
+        """
+        self.path = path
+        self._score = None
+        self.table = table
+        self.tempo_map = tm.TempoMap(self.table.tempo_changes, self.table.ticks_per_quarter)
+        self.get_instruments()
+        return self.table
 
     def is_empty(self):
         """
         Returns true if no song is loaded, false if there is.
         """
-        if (self.path is (None or "")) or (self.score is None):
+        if (self.path is (None or "")) or (self.table is None):
             return bool(True)
         else:
             return bool(False)
 
     def get_tempo(self):
         """
-        Returns the tempo of the song, as a float. Takes a music21.stream.Score object as the argument.
-        This function assumes there are no tempo changes within the file.
-        """
-        quarter_length = None
-        the_note = None
-        seconds = None
-        for note in self.score.flat.notesAndRests:
-            if note.quarterLength > 0.0:
-                try:
-                    seconds = note.seconds
-                except exceptions21.Music21Exception:
-                    seconds = None
-                if seconds is not None:
-                    quarter_length = note.quarterLength
-                    the_note = note
-                    break
-
-        if quarter_length is None or seconds is None:
-            return self.get_tempo_old()
-
-        full_quarter_length = seconds * (1.0 / quarter_length)
-        tempo = 60.0 / full_quarter_length
-
-        return tempo
-
-    def get_tempo_old(self):
-        """
-        Returns the tempo of the song, as a float. Takes a music21.stream.Score object as the argument.
-        This function assumes there are no tempo changes within the file.
+        Returns the starting tempo of the song, as a float.
+        Use tempo_map to follow the tempo changes within the file.
         """
-        seconds = self.score.secondsMap[0]['durationSeconds']
-        # print(seconds)
-        last_note = self.score.flat.notes[len(self.score.flat.notes) - 1]
-        quarter_length = last_note.quarterLength
-        offset = last_note.offset
-        total_length = offset + quarter_length
-        beats = (total_length - (total_length % 4)) + 4
-        tempo = int(60.0 / float(seconds / beats))
-        return tempo
+        return self.tempo_map.tempo_at(0)
 
     def get_instruments(self):
         """
-        Extracts instruments from current score and saves them locally.
+        Extracts instruments from current note table and saves them locally.
         """
-        for part in self.score.parts:
-            instr = part.getInstrument(returnDefault=False)     # extract instrument obj from part
-            i = 0       # default instrument
-            if instr is not None:
-                if instr.instrumentName in INSTRUMENTS:
-                    i = INSTRUMENTS[instr.instrumentName]      # get midi val of instrument
-                j = list(self.score.parts).index(part)       # track index
-                # print("Track {0} has midi instrument {1}".format(j, i))
-                self.instruments[j] = i
+        self.instruments = list(self.table.instruments)
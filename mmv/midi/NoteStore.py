@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+"""
+This class keeps the notes of a very large song in a file of fixed-width records that is memory-mapped instead of
+read, so opening a song with millions of notes only reads the header and a small index.
+
+The file starts with a JSON header holding everything but the notes (tempo changes, instruments, edge pitches...),
+followed by the start tick of every BLOCK_SIZE-th note, and then one record per note, sorted by start tick. The
+records start on a page boundary, so the operating system only reads the pages of the notes that are used: as the
+playhead advances, only the notes around it are faulted in.
+
+Notes are handed out as NoteViews, lightweight VizNotes that read their properties from the record they point to.
+"""
+import os
+import json
+import numpy as np
+import mmv.midi.NoteTable as nt
+import mmv.core.NoteView as nv
+
+# first bytes of every note store file
+MAGIC = b'MMVNOTES'
+
+# bump this whenever the layout of the file changes
+STORE_VERSION = 2
+
+# number of notes per block of the index
+BLOCK_SIZE = 1024
+
+# songs with at least this many notes are kept in a note store instead of as VizNotes
+MIN_NOTES = 200000
+
+# records start on a multiple of this, so they line up with memory pages
+PAGE_SIZE = 4096
+
+# layout of a single note record (24 bytes)
+RECORD = np.dtype([('start', '<i8'),
+                   ('duration', '<i8'),
+                   ('track', '<u2'),
+                   ('pitch', 'u1'),
+                   ('velocity', 'u1'),
+                   ('channel', 'u1'),
+                   ('padding', 'V3')])
+
+
+def write(path, table):
+    """
+    Writes the notes of a NoteTable to a note store file at the given path.
+    """
+    count = len(table)
+    header = {'version': STORE_VERSION,
+              'count': count,
+              'ticks_per_quarter': table.ticks_per_quarter,
+              'tempo_changes': [list(t) for t in table.tempo_changes],
+              'time_signatures': [list(t) for t in table.time_signatures],
+              'num_tracks': table.num_tracks,
+              'instruments': list(table.instruments),
+              'edge_pitches': [int(table.pitch.min()), int(table.pitch.max())] if count else [255, 0],
+              'end_tick': int((table.start + table.duration).max()) if count else 0,
+              'block_size': BLOCK_SIZE}
+    header_bytes = json.dumps(header).encode()
+
+    index = np.ascontiguousarray(table.start[::BLOCK_SIZE], dtype='<i8')
+    index_offset = len(MAGIC) + 4 + len(header_bytes)
+    records_offset = -(-(index_offset + index.nbytes) // PAGE_SIZE) * PAGE_SIZE
+
+    records = np.zeros(count, dtype=RECORD)
+    records['start'] = table.start
+    records['duration'] = table.duration
+    records['track'] = table.track
+    records['pitch'] = table.pitch
+    records['velocity'] = table.velocity
+    records['channel'] = table.channel
+
+    # write to a temporary file first so a crash never leaves half a file behind
+    temp_path = path + ".tmp"
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(len(header_bytes).to_bytes(4, 'little'))
+            f.write(header_bytes)
+            f.write(index.tobytes())
+            f.write(b'\0' * (records_offset - index_offset - index.nbytes))
+            f.write(records.tobytes())
+        os.replace(temp_path, path)
+    except OSError:
+        # don't leave the partial file behind (i.e. when the disk is full)
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+class NoteStore:
+
+    def __init__(self, path):
+        """
+        Opens the note store file at the given path. Raises ValueError if it isn't a valid note store.
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError("Not a note store file: " + path)
+            header_length = int.from_bytes(f.read(4), 'little')
+            header = json.loads(f.read(header_length).decode())
+            if header.get('version') != STORE_VERSION:
+                raise ValueError("Unsupported note store version: " + str(header.get('version')))
+            count = header['count']
+            self.block_size = header['block_size']
+            num_blocks = -(-count // self.block_size)
+            index_offset = len(MAGIC) + 4 + header_length
+            # start tick of the first note of every block
+            self.block_starts = np.frombuffer(f.read(num_blocks * 8), dtype='<i8')
+
+        records_offset = -(-(index_offset + num_blocks * 8) // PAGE_SIZE) * PAGE_SIZE
+        # the notes themselves, only read from disk when they are used
+        if count:
+            self.records = np.memmap(path, dtype=RECORD, mode='r', offset=records_offset, shape=(count,))
+        else:
+            self.records = np.zeros(0, dtype=RECORD)
+        # tick the last note of the song ends on
+        self.end_tick = header['end_tick']
+
+        # a NoteTable whose columns are views of the records, for code that works on whole columns
+        self.table = nt.NoteTable(header['ticks_per_quarter'])
+        self.table.start = self.records['start']
+        self.table.duration = self.records['duration']
+        self.table.track = self.records['track']
+        self.table.pitch = self.records['pitch']
+        self.table.velocity = self.records['velocity']
+        self.table.channel = self.records['channel']
+        self.table.tempo_changes = [tuple(t) for t in header['tempo_changes']]
+        self.table.time_signatures = [tuple(t) for t in header['time_signatures']]
+        self.table.num_tracks = header['num_tracks']
+        self.table.instruments = header['instruments']
+        self.table.edge_pitches = tuple(header['edge_pitches'])
+        self.table.end_tick = self.end_tick
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, i):
+        """
+        Returns a NoteView of the note at the given index, or a list of them for a slice.
+        """
+        if isinstance(i, slice):
+            return [nv.NoteView(self, j) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("note index out of range")
+        return nv.NoteView(self, i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield nv.NoteView(self, i)
+
+    def find(self, tick):
+        """
+        Returns the number of notes that start on or before the given tick. Only the block around the tick is read.
+        """
+        block = int(np.searchsorted(self.block_starts, tick, side='right'))
+        if block == 0:
+            return 0
+        first = (block - 1) * self.block_size
+        last = min(block * self.block_size, len(self))
+        # copy the start ticks of the block, since the search needs them next to each other
+        starts = np.array(self.records['start'][first:last])
+        return first + int(np.searchsorted(starts, tick, side='right'))
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+"""
+This class stores every note of a song as compact parallel arrays (one column per property) instead of as
+music21 objects. It holds everything playback needs: pitch, velocity, track, channel, start tick and duration,
+along with the tempo and time signature changes and the instrument of each track.
+"""
+import numpy as np
+
+
+class NoteTable:
+
+    def __init__(self, ticks_per_quarter=480):
+        # number of midi ticks in a quarter note
+        self.ticks_per_quarter = ticks_per_quarter
+        # midi pitch of each note
+        self.pitch = np.zeros(0, dtype=np.uint8)
+        # velocity of each note
+        self.velocity = np.zeros(0, dtype=np.uint8)
+        # track each note belongs to, starting at 1
+        self.track = np.zeros(0, dtype=np.uint16)
+        # midi channel of each note, from 0 to 15
+        self.channel = np.zeros(0, dtype=np.uint8)
+        # tick each note starts on
+        self.start = np.zeros(0, dtype=np.int64)
+        # length of each note, in ticks
+        self.duration = np.zeros(0, dtype=np.int64)
+
+        # list of tuples. first value is the tick of the tempo change, second is the microseconds per quarter note
+        self.tempo_changes = []
+        # list of (tick, numerator, denominator) tuples, one per time signature change. empty means 4/4
+        self.time_signatures = []
+        # number of tracks that contain notes
+        self.num_tracks = 0
+        # the midi instrument of each track
+        self.instruments = [0 for x in range(16)]
+        # lowest and highest pitch, if already known (i.e. from a NoteStore header), so they aren't searched for
+        self.edge_pitches = None
+        # tick the last note ends on, if already known
+        self.end_tick = None
+
+    def __len__(self):
+        return len(self.pitch)
+
+    def set_notes(self, pitch, velocity, track, channel, start, duration):
+        """
+        Replaces the notes of the table. The notes are sorted by their start tick, keeping notes that start on the
+        same tick in the order they were given.
+        """
+        start = np.asarray(start, dtype=np.int64)
+        order = np.argsort(start, kind='stable')
+        self.pitch = np.asarray(pitch, dtype=np.uint8)[order]
+        self.velocity = np.asarray(velocity, dtype=np.uint8)[order]
+        self.track = np.asarray(track, dtype=np.uint16)[order]
+        self.channel = np.asarray(channel, dtype=np.uint8)[order]
+        self.start = start[order]
+        self.duration = np.asarray(duration, dtype=np.int64)[order]
+
+    @property
+    def offsets(self):
+        """
+        Start of each note, in quarter lengths.
+        """
+        return self.start / float(self.ticks_per_quarter)
+
+    @property
+    def quarter_lengths(self):
+        """
+        Length of each note, in quarter lengths.
+        """
+        return self.duration / float(self.ticks_per_quarter)
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+"""
+Reads Standard MIDI Files (*.mid) directly into a NoteTable, without building a music21 stream.
+
+Only what playback needs is kept: notes, tempo changes and the first program change of each track. Tracks that
+don't contain any notes (e.g. the conductor track) are dropped, the same way music21 drops them when it creates
+the parts of a score. Format 0 files are split into one track per channel.
+"""
+import struct
+import mmv.midi.NoteTable as nt
+import mmv.midi.TempoMap as tm
+
+# midi channel reserved for percussion
+PERCUSSION_CHANNEL = 9
+
+
+def read_file(path):
+    """
+    Reads the midi file at the given path and returns its NoteTable.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    return read_bytes(data)
+
+
+def read_bytes(data):
+    """
+    Reads the contents of a midi file and returns its NoteTable.
+    """
+    chunk_type, length = read_chunk_header(data, 0)
+    if chunk_type != b'MThd' or length < 6:
+        raise ValueError("Not a standard midi file")
+    fmt, num_chunks, division = struct.unpack('>HHH', data[8:14])
+
+    if division & 0x8000:
+        # SMPTE time. use a tick length that gives the exact same timing at the default tempo
+        fps = 256 - (division >> 8)
+        ticks_per_frame = division & 0xFF
+        ticks_per_quarter = (fps * ticks_per_frame) // 2
+        smpte = True
+    else:
+        ticks_per_quarter = division
+        smpte = False
+    if ticks_per_quarter <= 0:
+        raise ValueError("Invalid midi time division: " + str(division))
+
+    tracks = []
+    pos = 8 + length
+    while pos + 8 <= len(data) and len(tracks) < num_chunks:
+        chunk_type, length = read_chunk_header(data, pos)
+        body = data[pos + 8:pos + 8 + length]
+        pos += 8 + length
+        if chunk_type == b'MTrk':
+            try:
+                tracks.append(read_track(body))
+            except IndexError:
+                raise ValueError("Midi track " + str(len(tracks)) + " ends unexpectedly")
+
+    table = nt.NoteTable(ticks_per_quarter)
+
+    # gather tempo changes from every track (format 1 keeps them in the first track)
+    if smpte:
+        table.tempo_changes = [(0, tm.DEFAULT_TEMPO)]
+    else:
+        tempo_changes = []
+        for track in tracks:
+            tempo_changes.extend(track[1])
+        tempo_changes.sort(key=lambda x: x[0])
+        table.tempo_changes = tempo_changes
+
+    # time signatures are gathered the same way
+    time_signatures = []
+    for track in tracks:
+        time_signatures.extend(track[3])
+    time_signatures.sort(key=lambda x: x[0])
+    table.time_signatures = time_signatures
+
+    # format 0 files keep every channel in a single track, so split them
+    if fmt == 0 and len(tracks) == 1:
+        notes, tempos, programs, time_signatures = tracks[0]
+        tracks = []
+        for channel in sorted(set(n[4] for n in notes)):
+            tracks.append(([n for n in notes if n[4] == channel], [], programs, []))
+
+    pitch = []
+    velocity = []
+    track_num = []
+    channel = []
+    start = []
+    duration = []
+    for notes, tempos, programs, time_signatures in tracks:
+        if not notes:
+            continue
+        table.num_tracks += 1
+        for n in notes:
+            start.append(n[0])
+            duration.append(n[1])
+            pitch.append(n[2])
+            velocity.append(n[3])
+            channel.append(n[4])
+            track_num.append(table.num_tracks)
+
+        # instrument of the track, with the same 1-128 numbering as Constants.INSTRUMENTS
+        if table.num_tracks <= len(table.instruments):
+            first_channel = notes[0][4]
+            if first_channel == PERCUSSION_CHANNEL:
+                table.instruments[table.num_tracks - 1] = 129
+            elif first_channel in programs:
+                table.instruments[table.num_tracks - 1] = programs[first_channel] + 1
+
+    table.set_notes(pitch, velocity, track_num, channel, start, duration)
+    return table
+
+
+def read_chunk_header(data, pos):
+    """
+    Returns the type and length of the chunk starting at the given position.
+    """
+    if pos + 8 > len(data):
+        raise ValueError("Midi chunk header ends unexpectedly")
+    return data[pos:pos + 4], struct.unpack('>I', data[pos + 4:pos + 8])[0]
+
+
+def read_var_len(data, pos):
+    """
+    Reads a variable-length quantity and returns its value and the position right after it.
+    """
+    value = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value = (value << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            return value, pos
+
+
+def read_track(data):
+    """
+    Reads the events of a single track chunk.
+
+    Returns a tuple of: a list of notes as (start tick, duration, pitch, velocity, channel) tuples, a list of tempo
+    changes as (tick, microseconds per quarter) tuples, a dict mapping each channel to its first program, and a list
+    of time signature changes as (tick, numerator, denominator) tuples.
+    """
+    notes = []
+    tempos = []
+    programs = {}
+    time_signatures = []
+    # notes that are still sounding, mapped by (channel, pitch) to a list of (start tick, velocity) tuples
+    open_notes = {}
+
+    tick = 0
+    pos = 0
+    status = 0
+    while pos < len(data):
+        delta, pos = read_var_len(data, pos)
+        tick += delta
+
+        if data[pos] & 0x80:
+            status = data[pos]
+            pos += 1
+        elif status == 0:
+            raise ValueError("Midi data byte found without a status byte at tick " + str(tick))
+
+        if status == 0xFF:      # meta event
+            meta_type = data[pos]
+            length, pos = read_var_len(data, pos + 1)
+            if meta_type == 0x51 and length == 3:
+                tempos.append((tick, int.from_bytes(data[pos:pos + 3], 'big')))
+            elif meta_type == 0x58 and length >= 2 and data[pos] > 0:
+                # the denominator is stored as a power of 2
+                time_signatures.append((tick, data[pos], 2 ** data[pos + 1]))
+            pos += length
+            status = 0
+            if meta_type == 0x2F:       # end of track
+                break
+
+        elif status == 0xF0 or status == 0xF7:      # sysex event
+            length, pos = read_var_len(data, pos)
+            pos += length
+            status = 0
+
+        else:
+            kind = status & 0xF0
+            channel = status & 0x0F
+            if kind == 0xC0 or kind == 0xD0:
+                data1 = data[pos]
+                data2 = 0
+                pos += 1
+            else:
+                data1 = data[pos]
+                data2 = data[pos + 1]
+                pos += 2
+
+            if kind == 0x90 and data2 > 0:
+                open_notes.setdefault((channel, data1), []).append((tick, data2))
+            elif kind == 0x80 or kind == 0x90:
+                started = open_notes.get((channel, data1))
+                if started:
+                    start, velocity = started.pop(0)
+                    notes.append((start, tick - start, data1, velocity, channel))
+            elif kind == 0xC0 and channel not in programs:
+                programs[channel] = data1
+
+    # notes that were never turned off last until the end of the track
+    for (channel, pitch), started in open_notes.items():
+        for start, velocity in started:
+            notes.append((start, tick - start, pitch, velocity, channel))
+
+    return notes, tempos, programs, time_signatures
@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+"""
+This class keeps a persistent cache of parsed songs, so reloading a midi file doesn't have to parse and analyze
+it again.
+
+Each song is stored as a single .npz file named after a hash of the midi file's bytes and the cache version. It
+holds the note table, tempo and time signature changes, key, edge pitches and the chords of every beat, half-bar
+and bar. Very large songs are kept as a memory-mapped NoteStore (.notes) instead. When the cache grows past its
+size limit, the songs that were used least recently are deleted.
+"""
+import os
+import io
+import hashlib
+import zipfile
+import numpy as np
+import music21
+import mmv.midi.NoteTable as nt
+import mmv.midi.MeterIndex as mi
+import mmv.midi.NoteStore as nstore
+import mmv.util.MusicComp as muse
+
+# bump this whenever the layout of the cached files changes, so old files are ignored
+CACHE_VERSION = 2
+
+# the chord attributes of a VizNote that are stored in the cache
+CHORD_ATTRIBUTES = ['chord_in_beat', 'chord_in_half_bar', 'chord_in_bar']
+
+
+class SongCache:
+
+    def __init__(self, directory=None, max_size=256 * 1024 * 1024):
+        # directory the cached songs are kept in
+        if directory is None:
+            directory = os.path.join(os.path.expanduser("~"), ".mmv", "cache")
+        self.directory = directory
+        # the most bytes the cache can use on disk
+        self.max_size = max_size
+
+    def get_key(self, path):
+        """
+        Returns the cache key of the midi file at the given path.
+        """
+        sha = hashlib.sha1()
+        sha.update(str(CACHE_VERSION).encode())
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                sha.update(block)
+        return sha.hexdigest()
+
+    def get_path(self, key):
+        """
+        Returns the path of the cache file for the given key.
+        """
+        return os.path.join(self.directory, key + ".npz")
+
+    def get_store_path(self, key):
+        """
+        Returns the path of the NoteStore file for the given key.
+        """
+        return os.path.join(self.directory, key + ".notes")
+
+    def load_store(self, key):
+        """
+        Opens the NoteStore of the song with the given key, or returns None if it isn't cached.
+        """
+        path = self.get_store_path(key)
+        if not os.path.isfile(path):
+            return None
+        try:
+            store = nstore.NoteStore(path)
+        except (OSError, KeyError, ValueError):
+            # a broken store is deleted, so it's written again
+            self.remove(path)
+            return None
+        self.touch(path)
+        return store
+
+    def save_store(self, key, table):
+        """
+        Writes a song to a NoteStore in the cache and returns it, opened. Returns None if the song is too large for
+        the cache to hold. Raises OSError if it can't be written.
+        """
+        if len(table) * nstore.RECORD.itemsize > self.max_size:
+            return None
+        path = self.get_store_path(key)
+        os.makedirs(self.directory, exist_ok=True)
+        nstore.write(path, table)
+        self.evict(path)
+        return nstore.NoteStore(path)
+
+    def load(self, key):
+        """
+        Returns the cached song with the given key as a dict, or None if it isn't cached.
+
+        The dict holds the 'table', the 'key' of the song, its 'edge_pitches' and the 'chords' of the notes.
+        """
+        path = self.get_path(key)
+        if not os.path.isfile(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if int(data['version']) != CACHE_VERSION:
+                    return None
+
+                table = nt.NoteTable(int(data['ticks_per_quarter']))
+                table.pitch = data['pitch']
+                table.velocity = data['velocity']
+                table.track = data['track']
+                table.channel = data['channel']
+                table.start = data['start']
+                table.duration = data['duration']
+                table.tempo_changes = [(int(t), int(m)) for t, m in data['tempo_changes']]
+                table.time_signatures = [(int(t), int(n), int(d)) for t, n, d in data['time_signatures']]
+                table.num_tracks = int(data['num_tracks'])
+                table.instruments = data['instruments'].tolist()
+
+                song_key = None
+                if str(data['key_tonic']):
+                    song_key = music21.key.Key(str(data['key_tonic']), str(data['key_mode']))
+
+                chords = {}
+                for attr in CHORD_ATTRIBUTES:
+                    chords[attr] = (data[attr + '_index'],
+                                    data[attr + '_pitches'],
+                                    data[attr + '_bounds'])
+
+                song = {'table': table,
+                        'key': song_key,
+                        'edge_pitches': tuple(data['edge_pitches'].tolist()),
+                        'chords': chords}
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+            # a broken file is the same as a cache miss, and is deleted so it's written again
+            self.remove(path)
+            return None
+
+        # mark the song as recently used
+        self.touch(path)
+        return song
+
+    def touch(self, path):
+        """
+        Marks a file of the cache as recently used, so it is evicted last.
+        """
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+
+    def remove(self, path):
+        """
+        Deletes a file from the cache, if it can.
+        """
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def save(self, key, table, notes, song_key, edge_pitches):
+        """
+        Stores a parsed song in the cache. The notes must be the VizNotes of the table, in the same order. Returns
+        None, or the error if the song couldn't be written (i.e. the disk is full), in which case it just isn't
+        cached.
+        """
+        columns = {'version': np.array(CACHE_VERSION),
+                   'ticks_per_quarter': np.array(table.ticks_per_quarter),
+                   'pitch': table.pitch,
+                   'velocity': table.velocity,
+                   'track': table.track,
+                   'channel': table.channel,
+                   'start': table.start,
+                   'duration': table.duration,
+                   'tempo_changes': np.array(table.tempo_changes, dtype=np.int64).reshape(-1, 2),
+                   'time_signatures': np.array(table.time_signatures, dtype=np.int64).reshape(-1, 3),
+                   'num_tracks': np.array(table.num_tracks),
+                   'instruments': np.array(table.instruments, dtype=np.int32),
+                   'edge_pitches': np.array(edge_pitches, dtype=np.int32),
+                   'key_tonic': np.array(song_key.tonic.name if song_key is not None else ""),
+                   'key_mode': np.array(song_key.mode if song_key is not None else "")}
+
+        # store each distinct chord once, and which chord each note belongs to
+        for attr in CHORD_ATTRIBUTES:
+            index = np.full(len(notes), -1, dtype=np.int32)
+            chord_ids = {}
+            pitches = []
+            bounds = [0]
+            for i, n in enumerate(notes):
+                chord = getattr(n, attr)
+                if chord is None:
+                    continue
+                if id(chord) not in chord_ids:
+                    chord_ids[id(chord)] = len(chord_ids)
+                    pitches.extend(p.midi for p in chord.pitches)
+                    bounds.append(len(pitches))
+                index[i] = chord_ids[id(chord)]
+            columns[attr + '_index'] = index
+            columns[attr + '_pitches'] = np.array(pitches, dtype=np.uint8)
+            columns[attr + '_bounds'] = np.array(bounds, dtype=np.int64)
+
+        buffer = io.BytesIO()
+        np.savez(buffer, **columns)
+
+        # write to a temporary file first so a crash never leaves half a file behind
+        path = self.get_path(key)
+        temp_path = path + ".tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(temp_path, 'wb') as f:
+                f.write(buffer.getvalue())
+            os.replace(temp_path, path)
+        except OSError as e:
+            self.remove(temp_path)
+            return e
+
+        self.evict(path)
+        return None
+
+    def evict(self, keep=None):
+        """
+        Deletes the least recently used songs until the cache fits within its size limit. The file at the path
+        given in keep (i.e. the one just written) is never deleted.
+        """
+        if not os.path.isdir(self.directory):
+            return
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith((".npz", ".notes")):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                # deleted in the meantime (i.e. by another instance)
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.max_size:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+
+def apply_chords(notes, chords, first=0, last=None, built=None):
+    """
+    Sets the chords of the notes from a cached song, sharing one music21 chord between every note of a window.
+
+    :param first:   index of the first note to set the chords of
+    :param last:    index right after the last note to set the chords of
+    :param built:   dict of the chords that were already created, by (attribute, chord number). pass the same dict
+                    to share chords between calls that set the chords of different parts of the same song
+    """
+    if last is None:
+        last = len(notes)
+    if built is None:
+        built = {}
+    for attr in CHORD_ATTRIBUTES:
+        index, pitches, bounds = chords[attr]
+        for n, i in zip(notes[first:last], index[first:last].tolist()):
+            if i < 0:
+                chord = None
+            else:
+                chord = built.get((attr, i))
+                if chord is None:
+                    chord = muse.get_chord_from_pitches(pitches[bounds[i]:bounds[i + 1]].tolist())
+                    built[(attr, i)] = chord
+            setattr(n, attr, chord)
+
+
+def get_table_chords(table, meter=None):
+    """
+    Finds the chords of the beat, half-bar and bar of every note in a NoteTable, the same way
+    Utilities.transcribe_chords does, without creating any music21 objects. The chords are returned in the form
+    they are cached in: for each chord attribute, the chord number of every note (-1 for none), the pitches of
+    every chord one after the other, and where each chord's pitches start. apply_chords sets them on the notes.
+
+    :param meter:   MeterIndex of the table. one is made if it isn't given
+    """
+    if meter is None:
+        meter = mi.MeterIndex(table)
+    chords = {}
+    count = len(table)
+    pitches = table.pitch
+
+    for level in mi.LEVELS:
+        index = np.full(count, -1, dtype=np.int32)
+        chord_pitches = []
+        bounds = [0]
+        chord_ids = {}
+        first_notes = meter.first_notes[level]
+        # the windows that hold at least one note
+        filled = np.flatnonzero(first_notes[:-1] < first_notes[1:])
+        for start, end in zip(first_notes[filled].tolist(), first_notes[filled + 1].tolist()):
+            chord = tuple(sorted(pitches[start:end].tolist()))
+            if chord not in chord_ids:
+                chord_ids[chord] = len(chord_ids)
+                chord_pitches.extend(chord)
+                bounds.append(len(chord_pitches))
+            index[start:end] = chord_ids[chord]
+        chords['chord_in_' + level] = (index, np.array(chord_pitches, dtype=np.uint8),
+                                       np.array(bounds, dtype=np.int64))
+    return chords
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""
+This class converts positions in a song (ticks or quarter-length offsets) to milliseconds, following every tempo
+change in the song.
+
+The song is split into segments of constant tempo. Each segment stores the tick it starts on, the time it starts
+at and the length of one of its ticks, so a conversion is a binary search for the segment plus one multiplication.
+All conversions work on single values as well as whole numpy arrays.
+"""
+import numpy as np
+
+# default tempo of a midi file, in microseconds per quarter note (120 bpm)
+DEFAULT_TEMPO = 500000
+
+
+class TempoMap:
+
+    def __init__(self, tempo_changes=None, ticks_per_quarter=480):
+        """
+        :param tempo_changes:       list of (tick, microseconds per quarter note) tuples
+        :param ticks_per_quarter:   number of midi ticks in a quarter note
+        """
+        self.ticks_per_quarter = ticks_per_quarter
+
+        changes = sorted(tempo_changes or [], key=lambda x: x[0])
+        if not changes or changes[0][0] > 0:
+            changes.insert(0, (0, changes[0][1] if changes else DEFAULT_TEMPO))
+
+        # keep only the last tempo change on any given tick
+        ticks = []
+        tempos = []
+        for tick, tempo in changes:
+            if ticks and ticks[-1] == tick:
+                tempos[-1] = tempo
+            else:
+                ticks.append(tick)
+                tempos.append(tempo)
+
+        # tick each segment starts on
+        self.ticks = np.array(ticks, dtype=np.int64)
+        # microseconds per quarter note of each segment
+        self.tempos = np.array(tempos, dtype=np.int64)
+        # length of a tick in each segment, in ms
+        self.ms_per_tick = self.tempos / (1000.0 * ticks_per_quarter)
+        # time each segment starts at, in ms
+        self.ms = np.zeros(len(ticks))
+        self.ms[1:] = np.cumsum(np.diff(self.ticks) * self.ms_per_tick[:-1])
+
+    def __len__(self):
+        return len(self.ticks)
+
+    def get_segments(self, ticks):
+        """
+        Returns the index of the segment each tick is in.
+        """
+        return np.searchsorted(self.ticks, ticks, side='right') - 1
+
+    def ticks_to_ms(self, ticks):
+        """
+        Converts ticks from the start of the song to ms.
+        """
+        ticks = np.asarray(ticks, dtype=np.float64)
+        seg = np.maximum(self.get_segments(ticks), 0)
+        ms = self.ms[seg] + (ticks - self.ticks[seg]) * self.ms_per_tick[seg]
+        if ms.ndim == 0:
+            return float(ms)
+        return ms
+
+    def ms_to_ticks(self, ms):
+        """
+        Converts ms from the start of the song to ticks.
+        """
+        ms = np.asarray(ms, dtype=np.float64)
+        seg = np.maximum(np.searchsorted(self.ms, ms, side='right') - 1, 0)
+        ticks = self.ticks[seg] + (ms - self.ms[seg]) / self.ms_per_tick[seg]
+        if ticks.ndim == 0:
+            return float(ticks)
+        return ticks
+
+    def offsets_to_ms(self, offsets):
+        """
+        Converts offsets from the start of the song (in quarter lengths) to ms.
+        """
+        return self.ticks_to_ms(np.asarray(offsets, dtype=np.float64) * self.ticks_per_quarter)
+
+    def tempo_at(self, offset=0.):
+        """
+        Returns the tempo, in bpm, at the given offset (in quarter lengths).
+        """
+        seg = max(int(self.get_segments(offset * self.ticks_per_quarter)), 0)
+        return 60000000.0 / self.tempos[seg]
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+"""
+This class holds the tension, dissonance and chord membership of every note in a song, as columns that line up
+with the song's NoteTable. They are computed in one pass when a preset needs them, using only integer pitch-class
+math and numpy, so playing a note is a lookup instead of building music21 chords, scales and notes.
+
+The values are the ones MusicComp computes live:
+- chord: the notes of a track that start on the same tick form a chord. A note's chord is made of the notes of
+  its group played up to and including it, which is what MusicComp.find_chord_from_viznote sees when it plays.
+- tension: the sequential tension of MusicComp.get_sequential_tension. The chord of the note is compared with
+  itself there, so the distance part is always 0 and only the surface tension is left: 2 if the chord is in third
+  inversion, plus 3 for every diatonic and 4 for every chromatic note of the chord outside of its root, 2nd and 3rd.
+- dissonance: MusicComp.get_dissonance_of_note against the chord of the last few notes played, and the key
+  the song is in at that note.
+"""
+import numpy as np
+import mmv.midi.ChordIndex as ci
+import mmv.util.ChordTable as ct
+import mmv.util.MusicComp as muse
+
+# number of recent notes the dissonance is measured against, as in MusicComp.get_recent_notes
+RECENT_NOTES = 5
+
+# pitch classes whose default name has an accidental
+CHROMATIC = np.array([pc in (1, 3, 6, 8, 10) for pc in range(12)])
+
+# root of every pitch-class set, or -1 for the empty set, as in ChordTable
+ROOTS = np.array([info.root if info.root is not None else -1 for info in ct.TABLE], dtype=np.int8)
+
+# root music21 gives every pitch-class set spelled with the default note names, which is how MusicComp spells the
+# chords it measures the tension of. it differs from ROOTS for some chords, i.e. C, E-, G# has C as its root
+SPELLED_ROOTS = np.array([-1] + [ct.find_root(ct.get_pitch_classes(mask)) for mask in range(1, 4096)], dtype=np.int8)
+
+# position of each pitch class on the circle of fifths
+CIRCLE_POSITIONS = np.array([muse.convert_pitch_to_circle_position(pc) for pc in range(12)], dtype=np.int16)
+
+# surface tension added by a note of a pitch class (column) to a chord with the given root (row)
+NON_CHORD_TONE = np.zeros((12, 12), dtype=np.int16)
+for _root in range(12):
+    for _pc in range(12):
+        if _pc not in (_root, (_root + 2) % 12, (_root + 4) % 12):
+            NON_CHORD_TONE[_root, _pc] = 4 if CHROMATIC[_pc] else 3
+
+# diatonic step of each pitch class's default name
+STEPS = np.array(ct.PITCH_STEPS, dtype=np.int8)
+
+
+class TensionTable:
+
+    def __init__(self, table=None, key=None, chord_index=None, key_timeline=None):
+        # index of the chord (group of notes of a track starting on the same tick) each note belongs to
+        self.group = np.zeros(0, dtype=np.int64)
+        # pitch-class mask of each note's whole chord
+        self.group_mask = np.zeros(0, dtype=np.uint16)
+        # sequential tension of each note
+        self.tension = np.zeros(0, dtype=np.int16)
+        # dissonance of each note against the key and the recent notes
+        self.dissonance = np.zeros(0, dtype=np.int16)
+
+        if table is not None:
+            self.build(table, key, chord_index, key_timeline)
+
+    def __len__(self):
+        return len(self.tension)
+
+    def build(self, table, key=None, chord_index=None, key_timeline=None):
+        """
+        Computes every column for the notes of a NoteTable, in table order (which is the order they are played in).
+        The song's ChordIndex is built if it isn't given. If the song's KeyTimeline is given, the dissonance of each
+        note is measured against the key at that note instead of the key of the whole song.
+        """
+        count = len(table)
+        if count == 0:
+            return
+        pitch = np.asarray(table.pitch, dtype=np.int64)
+        pcs = pitch % 12
+        bits = (1 << pcs).astype(np.int64)
+
+        # the notes of each (track, tick) group are next to each other in the index's order, as they are played
+        if chord_index is None:
+            chord_index = ci.ChordIndex(table)
+        order = chord_index.order
+        group_sorted = chord_index.group[order]
+        first_of_group = chord_index.first
+        rank = chord_index.rank[order]
+
+        sorted_bits = bits[order]
+        sorted_pitch = pitch[order]
+        sorted_pcs = pcs[order]
+
+        # the chord each note sees when it plays is the notes of its group up to itself. groups are small, so
+        # each prefix is built by looking back one note at a time
+        prefix_mask = sorted_bits.copy()
+        prefix_bass = sorted_pitch.copy()
+        for k in range(1, int(rank.max()) + 1):
+            has = np.flatnonzero(rank >= k)
+            prefix_mask[has] |= sorted_bits[has - k]
+            prefix_bass[has] = np.minimum(prefix_bass[has], sorted_pitch[has - k])
+
+        roots = SPELLED_ROOTS[prefix_mask].astype(np.int64)
+        tension = np.zeros(count, dtype=np.int16)
+        for k in range(0, int(rank.max()) + 1):
+            has = np.flatnonzero(rank >= k)
+            tension[has] += NON_CHORD_TONE[roots[has], sorted_pcs[has - k]]
+
+        # third inversion: the bass is the seventh of the chord
+        bass_step = (STEPS[prefix_bass % 12] - STEPS[roots]) % 7 + 1
+        tension += np.where(bass_step == 7, 2, 0).astype(np.int16)
+
+        # whole-group masks, for chord membership
+        group_mask = np.zeros(len(first_of_group), dtype=np.int64)
+        np.bitwise_or.at(group_mask, group_sorted, sorted_bits)
+
+        self.group = np.empty(count, dtype=np.int64)
+        self.group[order] = group_sorted
+        self.group_mask = group_mask[self.group].astype(np.uint16)
+        self.tension = np.empty(count, dtype=np.int16)
+        self.tension[order] = tension
+
+        # dissonance against the chord of the last few notes played (in table order)
+        recent = bits.copy()
+        for k in range(1, RECENT_NOTES):
+            recent[k:] |= bits[:-k]
+        recent_roots = ROOTS[recent].astype(np.int64)
+        if key_timeline is not None:
+            tonic = key_timeline.get_tonics(table.offsets)
+        else:
+            tonic = key.tonic.pitchClass if key is not None else 0
+        distance_from_key = np.abs(CIRCLE_POSITIONS[pcs] - CIRCLE_POSITIONS[tonic])
+        distance_from_key = np.where(distance_from_key > 6, 12 - distance_from_key, distance_from_key)
+        self.dissonance = (distance_from_key +
+                           (CIRCLE_POSITIONS[pcs] - CIRCLE_POSITIONS[recent_roots]) % 12).astype(np.int16)
+
+    def get_tension(self, note):
+        """
+        Returns the tension of a VizNote, or 0 if the note isn't from the table.
+        """
+        if 0 <= note.index < len(self.tension):
+            return int(self.tension[note.index])
+        return 0
+
+    def get_dissonance(self, note):
+        """
+        Returns the dissonance of a VizNote, or 0 if the note isn't from the table.
+        """
+        if 0 <= note.index < len(self.dissonance):
+            return int(self.dissonance[note.index])
+        return 0
@@ -11,7 +11,7 @@ class InstrumentFrame(wx.Dialog):
     def __init__(self, parent, title):
         super().__init__(parent, title=title, size=(500, 300))
         self.parent = parent
-        tracks = list(self.parent.vizmanager.parser.score.parts)    # self.parent.vizmanager.tracks
+        tracks = list(range(self.parent.vizmanager.parser.table.num_tracks))    # self.parent.vizmanager.tracks
         panel = wx.Panel(self, -1)
         self.text_labels = []
         self.combo_boxes = []
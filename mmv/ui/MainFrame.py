@@ -13,6 +13,7 @@ import mmv.ui.PresetDialog as prf
 import mmv.core.VizManager as vm
 import mmv.ui.InstrumentFrame as isf
 import mmv.util.Utilities as util
+import mmv.util.Palette as pal
 
 
 class MainFrame(wx.Frame):
@@ -40,10 +41,20 @@ class MainFrame(wx.Frame):
         self.toggle_debug = self.viewmenu.AppendCheckItem(wx.ID_ANY, 'Show Debugger\tCtrl+B', 'Toggle showing the debug box')
         self.ldp = self.viewmenu.Append(wx.ID_ANY, 'Select Preset\tCtrl+P')
         self.fullscreen = self.viewmenu.Append(wx.ID_ANY, "Fullscreen\tCtrl+F", "Fullscreen")
+        self.dirty_rects = self.viewmenu.AppendCheckItem(wx.ID_ANY, 'Dirty Rectangles\tCtrl+D', 'Only redraw the parts of the screen that changed')
         self.toggle_play = self.midimenu.Append(wx.ID_ANY, 'Play/Pause\tSpace', 'Play/Pause the visualization')
         self.select_tracks = self.midimenu.Append(wx.ID_ANY, 'Track Select\tCtrl+T', 'Select instruments for each track')
         self.print_songz = self.viewmenu.Append(wx.ID_ANY, 'Print Song', 'Print the currently loaded song to the debug panel')
 
+        # one radio item per palette, checked on the current one
+        palettemenu = wx.Menu()
+        self.palette_items = {}
+        for name in pal.PALETTES:
+            item = palettemenu.AppendRadioItem(wx.ID_ANY, name, 'Color notes with the ' + name + ' palette')
+            item.Check(pal.PALETTES[name] is pal.current)
+            self.palette_items[name] = item
+        self.viewmenu.AppendSubMenu(palettemenu, 'Palette')
+
         # Create status bar
         self.statusbar = self.CreateStatusBar()
         self.statusbar.SetFieldsCount(5)
@@ -64,9 +75,12 @@ class MainFrame(wx.Frame):
         self.Bind(wx.EVT_SIZE, self.OnSize)
         self.Bind(wx.EVT_MENU, self.load_selected_preset, self.ldp)
         self.Bind(wx.EVT_MENU, self.toggle_fullscreen, self.fullscreen)
+        self.Bind(wx.EVT_MENU, self.toggle_dirty_rects, self.dirty_rects)
         self.Bind(wx.EVT_MENU, self.toggle_playing, self.toggle_play)
         self.Bind(wx.EVT_MENU, self.show_instrument_selector, self.select_tracks)
         self.Bind(wx.EVT_MENU, self.print_song, self.print_songz)
+        for name, item in self.palette_items.items():
+            self.Bind(wx.EVT_MENU, lambda event, name=name: self.vizmanager.set_palette(name), item)
 
         # Add panels to sizer and set to panel
         sizer = wx.BoxSizer(wx.HORIZONTAL)
@@ -152,6 +166,8 @@ class MainFrame(wx.Frame):
         """
         if self.vizmanager.preset is None:
             wx.MessageBox("No preset was selected", "Missing Preset!", wx.OK | wx.ICON_ERROR)
+        elif self.vizmanager.song_loader.is_running():
+            wx.MessageBox("The midi file is still loading", "Loading File...", wx.OK | wx.ICON_INFORMATION)
         elif self.vizmanager.parser.is_empty() is True:
             wx.MessageBox("No midi file was selected", "Missing File!", wx.OK | wx.ICON_ERROR)
         else:
@@ -199,9 +215,16 @@ class MainFrame(wx.Frame):
         """
         self.display.toggle_fullscreen(event)
 
+    def toggle_dirty_rects(self, event):
+        """
+        Toggles redrawing only the parts of the display that changed
+        """
+        self.display.set_dirty_rects(self.dirty_rects.IsChecked())
+
     def clear_display(self):
         """
         Clears the pygame display.
         """
         self.vizmanager.units.clear()
         self.display.screen.fill((0, 0, 0))
+        self.display.invalidate()
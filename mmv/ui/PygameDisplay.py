@@ -1,11 +1,34 @@
 #!/usr/bin/env python
 """
+This class is the pygame surface the visualization is drawn on, embedded in the main window.
 
+Every frame it updates and draws the units of the VizManager, then lets it play the notes that are due. By default
+the whole screen is cleared and redrawn every frame. In dirty rectangle mode only the parts of the screen that
+changed are: every unit reports the rects it draws in, and a unit that moved, changed color, appeared or went away
+damages both the rects it used to cover and the ones it covers now. The damaged rects are merged, cleared and
+redrawn (with every unit that overlaps them), and only they are sent to the display. When the damage covers most
+of the screen, or a unit can't tell where it draws, the frame is redrawn in full.
+
+Instead of clearing the screen, the display blits the cached background of the current preset (see Background), so
+static things like track dividers are never drawn again while a song plays.
+
+Slanted lines redrawn inside a damaged rect may land a pixel to the side of where they are drawn in full, since
+pygame rounds lines from where they enter the clip rect.
 """
 import wx
 import pygame
 import os
 import sys
+import time
+
+# when the damaged rects cover more than this fraction of the screen, the whole screen is redrawn instead
+FULL_REDRAW_RATIO = 0.5
+
+# most damaged rects sent to the display in one frame, past which the whole screen is redrawn
+MAX_DAMAGED_RECTS = 64
+
+# how often the frame rate readout is refreshed, in seconds
+READOUT_INTERVAL = 0.5
 
 
 class PygameDisplay(wx.Window):
@@ -33,6 +56,20 @@ class PygameDisplay(wx.Window):
         self.resized = False
         self.is_fullscreen = False
 
+        # whether only the damaged parts of the screen are redrawn
+        self.dirty_rects = False
+        # whether the next frame has to be redrawn in full (i.e. something filled the screen)
+        self.full_redraw = True
+        # what every unit drawn last frame looked like: its rects and its look, by unit
+        self.drawn = {}
+
+        # average time spent drawing a frame in ms, frames per second, and when they were last shown
+        self.frame_cost = 0.
+        self.frame_rate = 0.
+        self.last_frame = None
+        self.last_readout = 0.
+        self.readout = ""
+
         self.fps = 60.0
         self.timespacing = 1000.0 / self.fps
         self.timer.Start(self.timespacing, False)
@@ -42,30 +79,174 @@ class PygameDisplay(wx.Window):
         self.redraw()
 
     def redraw(self):
-        self.screen.fill((0, 0, 0))
+        start = time.perf_counter()
+        full = self.full_redraw or not self.dirty_rects
+        self.full_redraw = False
 
-        for unit in self.viz_manager.units:
-            # if isinstance(unit, Unit.RectNoteUnit):
-            if unit.should_delete is True:
-                self.viz_manager.units.remove(unit)
-            else:
-                unit.update()
-                unit.draw(self.screen)
+        units = self.update_units()
+        damage = None
+        if not full:
+            damage = self.draw_damage(units)
+        if damage is None:
+            self.draw_all(units)
 
         # pygame.draw.circle(self.screen, (0, 255, 0), (int(self.size.width/2), int(self.size.height/2)), 100)
 
-        self.viz_manager.main_frame.statusbar.SetStatusText("t: " + str(pygame.time.get_ticks()), 3)
+        timeline = self.viz_manager.timeline
+        # the notes sounding, the notes turned on and off during the last update, and the most ever sounding
+        scheduler = self.viz_manager.current_notes
+        self.viz_manager.main_frame.statusbar.SetStatusText("t: " + str(pygame.time.get_ticks()) + " ("
+                                                            + str(int(timeline.progress * 100)) + "%) on: "
+                                                            + str(len(scheduler)) + " (+"
+                                                            + str(scheduler.frame_pushed) + " -"
+                                                            + str(scheduler.frame_popped) + ", max "
+                                                            + str(scheduler.max_pending) + ")"
+                                                            + self.get_readout(), 3)
 
         self.viz_manager.update()
 
-        pygame.display.update()
+        # a preset that filled the screen while playing notes needs the whole screen shown, now and next frame
+        if damage is None or self.full_redraw:
+            pygame.display.update()
+        elif damage:
+            pygame.display.update(damage)
+        # the slots of the units removed this frame are only dropped now that nothing is iterating over them
+        self.viz_manager.units.compact()
+        self.measure_frame(start)
+
+    def update_units(self):
+        """
+        Updates every unit and removes the ones that are done. Returns the units left, in drawing order.
+        """
+        units = self.viz_manager.units
+        units.update()
+        return units
+
+    def draw_all(self, units):
+        """
+        Draws the background of the preset over the whole screen, then every unit.
+        """
+        self.draw_background()
+        for unit in units:
+            unit.draw(self.screen)
+        if self.dirty_rects:
+            self.drawn = {unit: self.get_state(unit) for unit in units}
+
+    def draw_damage(self, units):
+        """
+        Redraws the parts of the screen where units changed since the last frame. Returns the damaged rects, or
+        None if the whole screen has to be redrawn instead.
+        """
+        previous = self.drawn
+        current = {}
+        damage = []
+        for unit in units:
+            state = self.get_state(unit)
+            if state[0] is None:
+                return None
+            current[unit] = state
+            old = previous.pop(unit, None)
+            if old != state:
+                if old is not None:
+                    damage.extend(old[0])
+                damage.extend(state[0])
+        # whatever was drawn by units that are gone has to be cleared
+        for rects, look in previous.values():
+            damage.extend(rects)
+
+        damage = merge_rects(damage, self.screen.get_rect())
+        area = self.screen.get_width() * self.screen.get_height()
+        if len(damage) > MAX_DAMAGED_RECTS or sum(r.w * r.h for r in damage) > area * FULL_REDRAW_RATIO:
+            return None
+
+        self.drawn = current
+        if damage:
+            unit_rects = []
+            owners = []
+            for unit, (rects, look) in current.items():
+                for rect in rects:
+                    unit_rects.append(rect)
+                    owners.append(unit)
+            for rect in damage:
+                self.screen.set_clip(rect)
+                self.draw_background(rect)
+                drawn = None
+                # units that draw in several rects are only drawn once per damaged rect
+                for i in rect.collidelistall(unit_rects):
+                    if owners[i] is not drawn:
+                        owners[i].draw(self.screen)
+                        drawn = owners[i]
+            self.screen.set_clip(None)
+        return damage
+
+    def draw_background(self, rect=None):
+        """
+        Draws the cached background of the current preset over the screen, or over the given rect of it.
+        """
+        preset = self.viz_manager.preset
+        if preset is None:
+            self.screen.fill((0, 0, 0), rect)
+        else:
+            preset.background.draw(self.screen, rect)
+
+    @staticmethod
+    def get_state(unit):
+        """
+        Returns the rects a unit draws in (None if it can't tell) and its look.
+        """
+        rects = unit.get_rects()
+        if rects is not None:
+            rects = tuple(tuple(rect) for rect in rects)
+        return rects, unit.get_look()
+
+    def measure_frame(self, start):
+        """
+        Keeps track of how long frames take to draw and how many are drawn per second.
+        """
+        now = time.perf_counter()
+        self.frame_cost += ((now - start) * 1000 - self.frame_cost) * 0.1
+        if self.last_frame is not None and now > self.last_frame:
+            self.frame_rate += (1. / (now - self.last_frame) - self.frame_rate) * 0.1
+        self.last_frame = now
+
+    def get_readout(self):
+        """
+        Returns the frame rate and the time spent drawing a frame, as shown in the status bar.
+        """
+        now = time.perf_counter()
+        if now - self.last_readout >= READOUT_INTERVAL:
+            self.last_readout = now
+            self.readout = " | {0:.0f} fps, {1:.1f} ms/frame{2}".format(self.frame_rate, self.frame_cost,
+                                                                        " (dirty rects)" if self.dirty_rects else "")
+        return self.readout
+
+    def set_dirty_rects(self, enabled):
+        """
+        Turns dirty rectangle mode on or off.
+        """
+        self.dirty_rects = enabled
+        self.invalidate()
+
+    def invalidate(self):
+        """
+        Makes the whole screen redraw and show on the next frame. Call this after drawing to the screen directly.
+        """
+        self.full_redraw = True
+        self.drawn = {}
 
     def on_paint(self, event):
+        self.invalidate()
         self.redraw()
 
     def on_size(self, event):
         # self.screen.fill((0, 0, 0))
-        self.size = self.GetSize()
+        size = self.GetSize()
+        resized = size != self.size
+        self.size = size
+        self.invalidate()
+        # the presets only recompute where they draw things when the size actually changed
+        if resized and self.viz_manager is not None:
+            self.viz_manager.on_resize(size.x, size.y)
 
     def toggle_fullscreen(self, event):
         """
@@ -80,3 +261,21 @@ class PygameDisplay(wx.Window):
         self.Unbind(event=wx.EVT_PAINT, handler=self.on_paint)
         self.Unbind(event=wx.EVT_TIMER, handler=self.update, source=self.timer)
         pygame.quit()
+
+
+def merge_rects(rects, bounds):
+    """
+    Clips rects to the bounds and merges the ones that overlap, so no pixel is redrawn twice.
+    """
+    merged = []
+    for rect in rects:
+        rect = pygame.Rect(rect).clip(bounds)
+        if not rect.w or not rect.h:
+            continue
+        # keep growing the rect until it overlaps none of the merged ones
+        i = rect.collidelist(merged)
+        while i != -1:
+            rect.union_ip(merged.pop(i))
+            i = rect.collidelist(merged)
+        merged.append(rect)
+    return merged
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+"""
+A precomputed table of every chord, indexed by its pitch-class set.
+
+A set of pitch classes fits in 12 bits (bit 0 is C, bit 11 is B), so the whole table is a list of 4096 entries.
+The bitmask of a chord is also its ID: two groups of notes are the same chord exactly when their masks are equal,
+so detecting a chord change is an integer compare and looking a chord up is a list index. No music21 objects are
+created.
+
+Chords of the common types below get their root, quality and name straight from the type, the same way music21
+names a correctly spelled chord of that type. Every other set uses the same rules music21 uses to find the root
+and quality of a chord spelled with music21's default note names (C, C#, D, E-, E, F, F#, G, G#, A, B-, B).
+benchmarks/check_chord_table.py compares every entry against music21.
+"""
+import collections
+
+# the default music21 name of each pitch class
+PITCH_NAMES = ['C', 'C#', 'D', 'E-', 'E', 'F', 'F#', 'G', 'G#', 'A', 'B-', 'B']
+
+# the letter of each pitch class's default name, as a diatonic step (C = 0 ... B = 6)
+PITCH_STEPS = [0, 0, 1, 2, 2, 3, 3, 4, 4, 5, 6, 6]
+
+# common chord types, as (music21 common name, quality, semitones above the root). when a set fits more than one
+# type (i.e. C6 and Am7), the first type listed wins
+CHORD_TYPES = [('major triad', 'major', (0, 4, 7)),
+               ('minor triad', 'minor', (0, 3, 7)),
+               ('diminished triad', 'diminished', (0, 3, 6)),
+               ('augmented triad', 'augmented', (0, 4, 8)),
+               ('dominant seventh chord', 'major', (0, 4, 7, 10)),
+               ('major seventh chord', 'major', (0, 4, 7, 11)),
+               ('minor seventh chord', 'minor', (0, 3, 7, 10)),
+               ('half-diminished seventh chord', 'diminished', (0, 3, 6, 10)),
+               ('diminished seventh chord', 'diminished', (0, 3, 6, 9)),
+               ('minor-augmented tetrachord', 'minor', (0, 3, 7, 11)),
+               ('augmented major tetrachord', 'augmented', (0, 4, 8, 11)),
+               ('augmented seventh chord', 'augmented', (0, 4, 8, 10))]
+
+# root is a pitch class (or None for the empty set), chord_type is the common name of the type, or None
+ChordInfo = collections.namedtuple('ChordInfo', ['id', 'root', 'quality', 'name', 'chord_type'])
+
+
+def get_mask(pitches):
+    """
+    Returns the pitch-class bitmask (the chord ID) of a group of midi pitches.
+    """
+    mask = 0
+    for p in pitches:
+        mask |= 1 << (p % 12)
+    return mask
+
+
+def get_pitch_classes(mask):
+    """
+    Returns the pitch classes in a bitmask, from lowest to highest.
+    """
+    return [pc for pc in range(12) if mask >> pc & 1]
+
+
+def find_root(pcs):
+    """
+    Returns the root of a chord made of the given pitch classes (from lowest to highest) with their default names.
+    This follows music21's Chord.root(): the note with perfectly stacked thirds above it if there is one, else the
+    note with the most thirds, fifths and sevenths above it.
+    """
+    # one pitch class per letter, keeping the first one
+    by_step = {}
+    for pc in pcs:
+        by_step.setdefault(PITCH_STEPS[pc], pc)
+    unique = list(by_step.values())
+
+    if len(unique) == 1:
+        return pcs[0]
+    if len(unique) == 7:
+        return pcs[0]
+
+    steps = sorted(by_step)
+    for start in range(len(steps)):
+        last = steps[start]
+        stacked = True
+        for i in range(start + 1, start + len(steps)):
+            step = steps[i % len(steps)]
+            if step - last not in (2, -5):
+                stacked = False
+                break
+            last = step
+        if stacked:
+            return by_step[steps[start]]
+
+    best = None
+    best_score = -1.
+    for pc in unique:
+        step = PITCH_STEPS[pc]
+        score = 0.
+        for i, chord_step in enumerate((3, 5, 7, 2, 4, 6)):
+            if (step + chord_step - 1) % 7 in by_step:
+                score += 1. / (i + 6)
+        if score > best_score:
+            best = pc
+            best_score = score
+    return best
+
+
+def find_quality(pcs, root):
+    """
+    Returns the quality of a chord made of the given pitch classes with their default names, following music21's
+    Chord.quality: 'major', 'minor', 'diminished', 'augmented' or 'other'.
+    """
+    root_step = PITCH_STEPS[root]
+    # semitones above the root of every note on each chord step (1 = root, 3 = third...)
+    chord_steps = {}
+    for pc in pcs:
+        chord_step = (PITCH_STEPS[pc] - root_step) % 7 + 1
+        chord_steps.setdefault(chord_step, []).append((pc - root) % 12)
+
+    def repeated(chord_step):
+        semitones = chord_steps.get(chord_step, [])
+        return any(s != semitones[0] for s in semitones)
+
+    third = chord_steps.get(3, [None])[0]
+    fifth = chord_steps.get(5, [None])[0]
+    if third is None or repeated(1) or repeated(3):
+        return 'other'
+    if fifth is None:
+        return {4: 'major', 3: 'minor'}.get(third, 'other')
+    if repeated(5):
+        return 'other'
+    return {(4, 7): 'major', (3, 7): 'minor', (4, 8): 'augmented', (3, 6): 'diminished'}.get((third, fifth), 'other')
+
+
+def build_table():
+    """
+    Builds the ChordInfo of every pitch-class set.
+    """
+    # masks of the common chord types, with their root
+    types = {}
+    for name, quality, intervals in CHORD_TYPES:
+        for root in range(12):
+            mask = get_mask(root + i for i in intervals)
+            if mask not in types:
+                types[mask] = (root, quality, name)
+
+    table = [ChordInfo(0, None, 'other', "", None)]
+    for mask in range(1, 4096):
+        if mask in types:
+            root, quality, chord_type = types[mask]
+            name = PITCH_NAMES[root] + "-" + chord_type
+        else:
+            pcs = get_pitch_classes(mask)
+            root = find_root(pcs)
+            quality = find_quality(pcs, root)
+            chord_type = None
+            name = PITCH_NAMES[root] + " (" + " ".join(PITCH_NAMES[pc] for pc in pcs) + ")"
+        table.append(ChordInfo(mask, root, quality, name, chord_type))
+    return table
+
+
+# the ChordInfo of every pitch-class set, indexed by its mask
+TABLE = build_table()
+
+
+def get_chord_info(pitches):
+    """
+    Returns the ChordInfo of a group of midi pitches.
+    """
+    return TABLE[get_mask(pitches)]
@@ -7,6 +7,9 @@
 import music21
 import math
 import mmv.core.VizNote as vn
+import mmv.midi.KeyTimeline as kt
+import mmv.midi.NoteTable as nt
+import mmv.util.ChordTable as ct
 
 
 def get_chord(notes):
@@ -23,6 +26,38 @@ def get_chord(notes):
     return None
 
 
+def get_chord_info(notes):
+    """
+    Returns the ChordTable entry of the pitch classes in a list of notes, without creating a music21 chord.
+    """
+    pitches = []
+    for note in notes:
+        if isinstance(note, vn.VizNote):
+            pitches.append(note.pitch)
+        elif isinstance(note, music21.note.Note):
+            pitches.append(note.pitch.midi)
+    return ct.TABLE[ct.get_mask(pitches)]
+
+
+def get_root_note(chord_info):
+    """
+    Returns a music21 note (in the 4th octave) of the root of a ChordTable entry, or None if it has no root.
+    """
+    if chord_info.root is None:
+        return None
+    return music21.note.Note(60 + chord_info.root)
+
+
+def get_chord_from_pitches(pitches):
+    """
+    Creates a chord from a list of midi pitches.
+
+    The pitches are turned into music21 Pitch objects first, since music21 respells chords made directly from
+    integers, which is very slow.
+    """
+    return music21.chord.Chord([music21.pitch.Pitch(midi=p) for p in pitches])
+
+
 def get_recent_notes(notes, num=5):
     index = abs(num) * -1
     previous_notes = notes[index:]
@@ -161,23 +196,21 @@ def convert_pitch_to_circle_position(pitch, quality=None):
 
 def get_dissonance_of_note(note, viz_manager, notes=None):
     if isinstance(note, vn.VizNote):
-        pitch = note.note.pitch.midi % 12
+        pitch = note.pitch % 12
     elif isinstance(note, music21.note.Note):
         pitch = note.pitch.midi % 12
     else:
         pitch = note % 12
 
-    key_num = viz_manager.key.tonic.pitchClass
+    # until the key of the song is known, measure from C
+    key_num = viz_manager.key.tonic.pitchClass if viz_manager.key is not None else 0
 
     distance_from_key = abs(convert_pitch_to_circle_position(pitch) - convert_pitch_to_circle_position(key_num))
     if distance_from_key > 6:
         distance_from_key = 12 - distance_from_key
 
     recent_notes = get_recent_notes(notes)
-    chord = get_chord(recent_notes)
-    root = chord.root()
-    root_note = music21.note.Note(root)
-    root_pitch = root_note.pitch.midi % 12
+    root_pitch = get_chord_info(recent_notes).root
 
     dissonance = (convert_pitch_to_circle_position(pitch) - convert_pitch_to_circle_position(root_pitch)) % 12
 
@@ -481,6 +514,14 @@ def create_chord_from_note(root_note=None):
 
 
 def analyze_key(score):
+    """
+    Returns the key of a music21 score or NoteTable.
+
+    Key analysis only looks at how long each pitch class is played for, so a NoteTable is scored against every key
+    with numpy (see KeyTimeline) instead of building the full score.
+    """
     if isinstance(score, music21.stream.Score):
         key = score.analyze('key')
         return key
+    if isinstance(score, nt.NoteTable):
+        return kt.find_key(score)
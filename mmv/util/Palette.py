@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+"""
+This class holds the colors notes are drawn with, as lookup tables indexed by midi pitch.
+
+A palette has two tables: the color of each of the 128 midi pitches, and the color of each pitch relative to
+each of the 12 tonics (its scale degree). Finding the color of a note is a list index, whatever the palette is,
+so switching palettes while a song is playing costs nothing per note.
+
+Brightness changes use a table of clamped channel values instead of comparing every channel, and whole arrays of
+colors can be brightened or faded at once with numpy.
+"""
+import numpy as np
+
+# color of each pitch class, starting at C
+NOTE_NAME_COLORS = [(40, 255, 0),       # lime
+                    (0, 255, 242),      # aqua
+                    (0, 122, 255),      # sky blue
+                    (71, 0, 237),       # blue-ish
+                    (71, 0, 237),       # blue-ish
+                    (99, 0, 178),       # indigo
+                    (174, 0, 0),        # dark red
+                    (255, 0, 0),        # red
+                    (255, 0, 0),        # red
+                    (255, 102, 0),      # orange-red
+                    (255, 239, 0),      # yellow
+                    (153, 255, 0)]      # chartreuse
+
+# color of each scale degree, in semitones above the tonic
+SCALE_DEGREE_COLORS = [(255, 0, 0),
+                       (255, 100, 0),
+                       (255, 150, 0),
+                       (255, 200, 0),
+                       (255, 255, 0),
+                       (0, 255, 0),
+                       (0, 255, 255),
+                       (0, 0, 255),
+                       (100, 0, 255),
+                       (200, 0, 255),
+                       (255, 0, 255),
+                       (255, 100, 255)]
+
+# gray as bright as the midi pitch
+MONOCHROME_COLORS = [(p, p, p) for p in range(128)]
+
+# a channel plus an amount between -255 and 255, clamped to 0-255, indexed by channel + amount + 255
+CLAMPED = tuple(min(max(v - 255, 0), 255) for v in range(766))
+
+
+class Palette:
+
+    def __init__(self, name, pitch_colors, degree_colors=None):
+        """
+        :param name:            name of the palette
+        :param pitch_colors:    color of each pitch class (12 colors) or of each midi pitch (128 colors)
+        :param degree_colors:   color of each scale degree (12 colors) or of each midi pitch transposed to C (128
+                                colors). the pitch colors are used if they aren't given, so the key doesn't matter
+        """
+        self.name = name
+        # color of each midi pitch
+        self.pitch_colors = get_pitch_table(pitch_colors)
+        # color of each midi pitch in the key of each tonic, by the tonic's pitch class
+        if degree_colors is None:
+            self.key_colors = [self.pitch_colors] * 12
+        else:
+            degrees = get_pitch_table(degree_colors)
+            self.key_colors = [[degrees[(p - tonic) % 128] for p in range(128)] for tonic in range(12)]
+        # the same tables as arrays of shape (128, 3) and (12, 128, 3)
+        self.pitch_array = np.array(self.pitch_colors, dtype=np.uint8)
+        self.key_array = np.array(self.key_colors, dtype=np.uint8)
+
+    def get_pitch_color(self, pitch):
+        """
+        Returns the color of a midi pitch.
+        """
+        return self.pitch_colors[pitch]
+
+    def get_degree_color(self, pitch, tonic=0):
+        """
+        Returns the color of a midi pitch in the key of the given tonic (a pitch class).
+        """
+        return self.key_colors[tonic][pitch]
+
+
+def get_pitch_table(colors):
+    """
+    Returns a list of the colors of every midi pitch, from either 12 colors by pitch class or 128 by pitch.
+    """
+    colors = [tuple(int(c) for c in color) for color in colors]
+    if len(colors) == 12:
+        return [colors[p % 12] for p in range(128)]
+    if len(colors) != 128:
+        raise ValueError("A palette needs 12 or 128 colors, not " + str(len(colors)))
+    return colors
+
+
+# every palette, by name
+PALETTES = {}
+
+
+def add_palette(palette):
+    """
+    Adds a palette to the ones that can be switched to.
+    """
+    PALETTES[palette.name] = palette
+
+
+add_palette(Palette("Classic", NOTE_NAME_COLORS, SCALE_DEGREE_COLORS))
+add_palette(Palette("Scale Degrees", SCALE_DEGREE_COLORS, SCALE_DEGREE_COLORS))
+add_palette(Palette("Monochrome", MONOCHROME_COLORS))
+
+# the palette notes are currently drawn with
+current = PALETTES["Classic"]
+
+
+def set_palette(name):
+    """
+    Switches every preset to the palette with the given name. Raises KeyError if there is no such palette.
+    """
+    global current
+    current = PALETTES[name]
+
+
+def brighten(color, amount):
+    """
+    Returns an RGB color with the amount added to each channel, clamped to 0-255.
+    """
+    amount = int(amount) + 255
+    if 0 <= amount <= 510:
+        r, g, b = color
+        return CLAMPED[r + amount], CLAMPED[g + amount], CLAMPED[b + amount]
+    # anything past 255 either way makes every channel black or white
+    return (0, 0, 0) if amount < 0 else (255, 255, 255)
+
+
+def brighten_all(colors, amounts):
+    """
+    Returns an array of colors (one per row) with the amounts added to each channel, clamped to 0-255.
+
+    :param colors:      array of shape (n, 3)
+    :param amounts:     one amount for every color, or a single amount for all of them
+    """
+    amounts = np.asarray(amounts, dtype=np.int16)
+    if amounts.ndim == 1:
+        amounts = amounts[:, None]
+    return np.clip(np.asarray(colors, dtype=np.int16) + amounts, 0, 255).astype(np.uint8)
+
+
+def fade_all(colors, speeds):
+    """
+    Returns an array of colors (one per row) darkened by one step of their fade speeds.
+    """
+    return brighten_all(colors, -np.asarray(speeds, dtype=np.int16))
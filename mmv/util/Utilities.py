@@ -4,6 +4,10 @@ import pygame
 import wx
 import mmv.core.VizNote as vn
 import mmv.core.Unit as unit
+import mmv.midi.NoteTable as nt
+import mmv.midi.MeterIndex as mi
+import mmv.midi.TempoMap as tm
+import mmv.util.MusicComp as muse
 
 #############################################################
 #                                                           #
@@ -90,8 +94,11 @@ def print_chord_to_panel(panel, n):
 
 def offet_ms(offset, tempo):
     """
-
+    Converts an offset (in quarter lengths) to ms. The tempo is either a constant tempo in bpm, or a TempoMap which
+    follows every tempo change in the song. With a TempoMap, the offset can also be a numpy array of offsets.
     """
+    if isinstance(tempo, tm.TempoMap):
+        return tempo.offsets_to_ms(offset)
     seconds_per_beat = 60.0 / tempo
     ms_per_beat = seconds_per_beat * 1000
     offset_ms = ms_per_beat * offset
@@ -103,7 +110,7 @@ def graph_note_y(note, highest_note, lowest_note, screen_height, smart_crop=Fals
     Returns the height position of a note's pitch relative to the lowest and highest possible notes.
     """
     if isinstance(note, vn.VizNote):
-        pitch = note.note.pitch.midi
+        pitch = note.pitch
     else:
         pitch = note.pitch.midi
 
@@ -145,32 +152,32 @@ def create_note_rect(notes, the_note, dest):
     """
     Creates a note onto a destination rect. Used for the static piano roll preset.
 
-    :param notes:   the score object of the song the note belongs to
+    :param notes:   the VizNotes of the song the note belongs to
     :param the_note:   the note that is being graphed
     :param dest:    the destination rect to graph the note onto
     :return:        the rect that will represent the note within the destination rect
     """
 
-    if not isinstance(the_note, music21.note.Note):
+    if not isinstance(the_note, vn.VizNote):
         return None
 
     # get the highest and lowest notes for position normalization
     highest_note = 0
     lowest_note = float("inf")
     for n in notes:
-        if isinstance(n, music21.note.Note):
-            if n.pitch.midi > highest_note:
-                highest_note = n.pitch.midi
-            if n.pitch.midi < lowest_note:
-                lowest_note = n.pitch.midi
+        if isinstance(n, vn.VizNote):
+            if n.pitch > highest_note:
+                highest_note = n.pitch
+            if n.pitch < lowest_note:
+                lowest_note = n.pitch
 
     last_note = notes[len(notes) - 1]
     largest_offset = last_note.offset
-    number = the_note.pitch.midi
-    x = dest.left + dest.width * float(the_note.offset / (largest_offset + last_note.quarterLength))
+    number = the_note.pitch
+    x = dest.left + dest.width * float(the_note.offset / (largest_offset + last_note.quarter_length))
     y = dest.top + (dest.height - (((number - lowest_note) / (highest_note - lowest_note)) * dest.height))
     # print(str(x) + ", " + str(y))
-    w = (dest.left + dest.width * float(the_note.quarterLength / (largest_offset + last_note.quarterLength)))
+    w = (dest.left + dest.width * float(the_note.quarter_length / (largest_offset + last_note.quarter_length)))
     h = 20
     rect = pygame.Rect(x, y, w, h)
     return rect
@@ -178,8 +185,15 @@ def create_note_rect(notes, the_note, dest):
 
 def get_edge_pitches(score):
     """
-    Takes a score and returns the lowest and highest pitches in the song.
+    Takes a score (or NoteTable) and returns the lowest and highest pitches in the song.
     """
+    if isinstance(score, nt.NoteTable):
+        if score.edge_pitches is not None:
+            return score.edge_pitches
+        if len(score) == 0:
+            return 255, 0
+        return int(score.pitch.min()), int(score.pitch.max())
+
     lowest = 255
     highest = 0
     for note in score.flat.notes:
@@ -199,8 +213,115 @@ def get_edge_pitches(score):
     return lowest, highest
 
 
-def get_viz_notes(score):
-    current_offset = 0.0
+def get_viz_notes(song):
+    """
+    Takes a NoteTable (or a music21 score) and returns a list of all its notes as VizNotes, sorted by offset,
+    with the chords of the beat, half-bar and bar each note is in.
+    """
+    if isinstance(song, nt.NoteTable):
+        flat = get_viz_notes_from_table(song)
+        transcribe_chords(flat, meter=mi.MeterIndex(song))
+    else:
+        flat = get_viz_notes_from_score(song)
+        transcribe_chords(flat)
+    return flat
+
+
+def transcribe_chords(flat, first=0, last=None, chords=None, meter=None):
+    """
+    Sets the chord of the beat, half-bar and bar of every note in a list of VizNotes sorted by offset.
+
+    Since the notes are sorted, the notes of each window are next to each other, so every granularity is a single
+    sweep over the list. Windows with the same pitches share the same music21 chord.
+
+    :param first:   index of the first note to transcribe
+    :param last:    index right after the last note to transcribe. every bar must be either entirely inside or
+                    entirely outside of [first, last)
+    :param chords:  dict of the chords that were already created, by their sorted pitches. pass the same dict to
+                    share chords between calls that transcribe different parts of the same song
+    :param meter:   MeterIndex of the song the notes were made from. its beats and bars are used if it is given,
+                    otherwise every bar is taken to be 4/4
+    """
+    if not flat:
+        return
+    if last is None:
+        last = len(flat)
+    if first >= last:
+        return
+    if chords is None:
+        chords = {}
+
+    if meter is not None:
+        for level in mi.LEVELS:
+            first_notes = meter.first_notes[level]
+            number = meter.get_number(level, first)
+            while number < meter.count(level) and first_notes[number] < last:
+                start, end = meter.get_notes(level, number)
+                start, end = max(start, first), min(end, last)
+                if start < end:
+                    set_chord(flat, start, end, 'chord_in_' + level, chords)
+                number += 1
+        return
+
+    quarter_beats = int(flat[-1].offset)
+    bars = quarter_beats // 4
+    half_bars = bars * 2
+
+    # attribute to set, length of the window in quarter lengths, and number of windows in the song
+    granularities = [('chord_in_beat', 1, quarter_beats),
+                     ('chord_in_half_bar', 2, half_bars),
+                     ('chord_in_bar', 4, bars)]
+
+    for attr, length, count in granularities:
+        start = first
+        while start < last:
+            window = int(flat[start].offset // length)
+            end = start + 1
+            while end < last and int(flat[end].offset // length) == window:
+                end += 1
+
+            if window < count:
+                set_chord(flat, start, end, attr, chords)
+
+            start = end
+
+
+def set_chord(flat, start, end, attr, chords):
+    """
+    Sets the chord made of the notes flat[start:end] as the given chord attribute of each of them.
+    """
+    pitches = tuple(sorted(note.pitch for note in flat[start:end]))
+    chord = chords.get(pitches)
+    if chord is None:
+        chord = muse.get_chord_from_pitches(pitches)
+        chords[pitches] = chord
+    for note in flat[start:end]:
+        setattr(note, attr, chord)
+
+
+def get_viz_notes_from_table(table):
+    """
+    Creates a VizNote for every note in a NoteTable, without creating any music21 objects.
+    """
+    flat = []
+    offsets = table.offsets.tolist()
+    quarter_lengths = table.quarter_lengths.tolist()
+    pitches = table.pitch.tolist()
+    velocities = table.velocity.tolist()
+    tracks = table.track.tolist()
+    channels = table.channel.tolist()
+    for i in range(len(table)):
+        viz_note = vn.VizNote(None, pitches[i], velocities[i], offsets[i], quarter_lengths[i], tracks[i],
+                              channels[i])
+        viz_note.index = i
+        flat.append(viz_note)
+    return flat
+
+
+def get_viz_notes_from_score(score):
+    """
+    Creates a VizNote for every note in a music21 score, breaking chords down into their notes.
+    """
     last_offset = 0.0
     track_num = 0
     tracks = []
@@ -239,52 +360,6 @@ def get_viz_notes(score):
             flat.append(note)
 
     # print(len(flat))
-    flat.sort(key=lambda x: x.note.offset)
+    flat.sort(key=lambda x: x.offset)
     # print(flat)
-
-    quarter_beats = flat[-1].note.offset
-    quarter_beats = int(quarter_beats)
-
-    bars = quarter_beats // 4
-    half_bars = bars * 2
-
-    # transcribing chords by quarter beat in song
-    for i in range(0, quarter_beats):
-        q_notes = []
-        q_vnotes = []
-        for note in flat:
-            if float(i) <= note.note.offset < float(i + 1):
-                q_notes.append(note.note)
-                q_vnotes.append(note)
-        chord = music21.chord.Chord(q_notes)
-
-        for note in q_vnotes:
-            note.chord_in_beat = chord
-
-    # transcribing chords by half-bar in song
-    for i in range(0, half_bars):
-        hb_notes = []
-        hb_vnotes = []
-        for note in flat:
-            if float(i * 2) <= note.note.offset < float((i + 1) * 2):
-                hb_notes.append(note.note)
-                hb_vnotes.append(note)
-        chord = music21.chord.Chord(hb_notes)
-
-        for note in hb_vnotes:
-            note.chord_in_half_bar = chord
-
-    # transcribing chords by bar in song
-    for i in range(0, bars):
-        b_notes = []
-        b_vnotes = []
-        for note in flat:
-            if float(i * 4) <= note.note.offset < float((i + 1) * 4):
-                b_notes.append(note.note)
-                b_vnotes.append(note)
-        chord = music21.chord.Chord(b_notes)
-
-        for note in b_vnotes:
-            note.chord_in_bar = chord
-
     return flat